@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Any, Optional
 
 from entities import Entity, Ship, Miner, Base, Turret, Constructable
 from enums import Direction, Resource
@@ -66,3 +66,32 @@ class Action:
             self.entity.build(self._build_type)
         elif self._build and isinstance(self.entity, Base):
             self.entity.build(self._build_type)
+
+    def min_repr(self) -> Optional[list[Any]]:
+        """A minimal representation of the action: [entity id, move, mine, cargo, build type] (trailing Nones removed)
+
+        Returns None if the action does nothing at all.
+        """
+        r = [self.entity.id, self._move.value,
+             self._mine.value if self._mine is not None else None,
+             "".join([res.value for res in self._cargo]) if self._cargo is not None else None,
+             self._build_type.desc if self._build else None]
+        while r[-1] is None:
+            r.pop()
+        if len(r) == 2 and self._move == Direction.NONE:
+            return None
+        return r
+
+    @staticmethod
+    def from_min_repr(entity: Entity, r: list[Any]) -> Action:
+        """Recreates an action from its min_repr, given the entity it is for"""
+        a = Action(entity)
+        a._move = Direction(r[1])
+        if len(r) > 2 and r[2] is not None:
+            a._mine = Direction(r[2])
+        if len(r) > 3 and r[3] is not None:
+            a._cargo = [Resource(c) for c in r[3]]
+        if len(r) > 4 and r[4] is not None:
+            a._build = True
+            a._build_type = Entity.find_type(r[4])
+        return a
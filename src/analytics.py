@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+from time import perf_counter
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from enums import Resource
+from game_log import GameLog
+from log_codec import FrameArrays, INFO_FIELDS, KIND_CODES
+from outcome import winner
+
+
+DATASET_DIR = os.path.join(os.getcwd(), 'analytics')
+
+# the events of every frame, each extracted into a table of its own (with the columns of its array in FrameArrays)
+EVENT_COLUMNS: dict[str, tuple[str, ...]] = {
+    'moves': ('id', 'dir'),
+    'collisions': ('x', 'y'),
+    'attacks': ('x1', 'y1', 'x2', 'y2', 'player'),
+    'destroyed': ('x', 'y'),
+}
+TABLES: tuple[str, ...] = ('games', 'frames', *EVENT_COLUMNS)
+
+DEPOSIT_CODES: tuple[int, ...] = (KIND_CODES[Resource.ORE.value], KIND_CODES[Resource.FUEL.value])
+
+Aggregation = Union[str, tuple[str, str]]
+
+
+class Table:
+    """Columns of equal length, with just enough of a query API to filter, group and aggregate them
+
+    For example, the mean margin of games by the width of the map:
+        dataset.games.group('map_w', margin='mean', games=('game', 'count'))
+    and the mean frame in which a miner of player 1 first reached (was next to) a deposit:
+        dataset.frames.filter(min_p1_miners_at_deposits=1).group('game', first=('frame', 'min'))['first'].mean()
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray]):
+        self.columns: dict[str, np.ndarray] = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        if column not in self.columns:
+            raise KeyError(f"Unknown column {column}, the columns are {', '.join(self.columns)}")
+        return self.columns[column]
+
+    def take(self, rows: npt.NDArray) -> Table:
+        """The rows given by a boolean mask or by their indices"""
+        return Table({name: values[rows] for name, values in self.columns.items()})
+
+    def filter(self, mask: Optional[npt.NDArray[np.bool_]] = None, **conditions) -> Table:
+        """The rows matching the mask (if any) and every condition, given as column=value, min_<column>=value or
+        max_<column>=value (as with Catalogue.games)"""
+        keep = np.ones(len(self), dtype=bool) if mask is None else np.asarray(mask, dtype=bool).copy()
+        for key, value in conditions.items():
+            if key[:4] == 'min_' and key not in self.columns:
+                keep &= self[key[4:]] >= value
+            elif key[:4] == 'max_' and key not in self.columns:
+                keep &= self[key[4:]] <= value
+            else:
+                keep &= self[key] == value
+        return self.take(keep)
+
+    def sort(self, *by: str, descending: bool = False) -> Table:
+        order = np.lexsort([self[column] for column in reversed(by)])
+        return self.take(order[::-1] if descending else order)
+
+    def head(self, n: int = 10) -> Table:
+        return self.take(np.arange(min(n, len(self))))
+
+    def join(self, other: Table, on: str, *columns: str) -> Table:
+        """Adds columns of other to every row, from the row of other with the same value of on (which must be unique
+        in other, and have every value of on in self), e.g. frames.join(games, 'game', 'map_w')"""
+        keys = other[on]
+        order = np.argsort(keys, kind='stable')
+        rows = order[np.searchsorted(keys, self[on], sorter=order)]
+        return Table({**self.columns, **{column: other[column][rows] for column in columns}})
+
+    def group(self, by: Union[str, list[str], tuple[str, ...]] = (), **aggregations: Aggregation) -> Table:
+        """Groups the rows by the values of the columns in by (or puts them all in one group if there are none), and
+        aggregates each group, giving a row per group
+
+        Every aggregation is name=(column, function) or just name=function to aggregate the column of that name, the
+        functions are those in AGGREGATIONS (count, sum, mean, std, min, max, median, first and last).
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        if by:
+            order = np.lexsort([self[column] for column in reversed(by)])
+            keys = [self[column][order] for column in by]
+            change = np.zeros(len(order), dtype=bool)
+            change[:1] = True
+            for k in keys:
+                change[1:] |= k[1:] != k[:-1]
+            starts = np.flatnonzero(change)
+        else:
+            order = np.arange(len(self))
+            keys = []
+            starts = np.zeros(1 if len(self) else 0, dtype=np.intp)
+        result = {column: k[starts] for column, k in zip(by, keys)}
+        for name, aggregation in aggregations.items():
+            column, function = (name, aggregation) if isinstance(aggregation, str) else aggregation
+            if function not in AGGREGATIONS:
+                raise ValueError(f"Unknown aggregation {function}, use one of {', '.join(AGGREGATIONS)}")
+            result[name] = AGGREGATIONS[function](self[column][order], starts)
+        return Table(result)
+
+    def rows(self) -> list[dict[str, Any]]:
+        return [dict(zip(self.columns, row)) for row in zip(*(v.tolist() for v in self.columns.values()))]
+
+    def __str__(self):
+        cells = [list(self.columns)] + [[f"{v:.3f}" if isinstance(v, float) else str(v) for v in row.values()]
+                                        for row in self.rows()]
+        widths = [max(len(row[i]) for row in cells) for i in range(len(self.columns))]
+        return '\n'.join('  '.join(c.rjust(w) for c, w in zip(row, widths)) for row in cells)
+
+
+def _sizes(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.diff(np.append(starts, len(values)))
+
+
+def _sum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.add.reduceat(values.astype(float), starts) if len(starts) else np.zeros(0)
+
+
+def _std(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    n = _sizes(values, starts)
+    mean = _sum(values, starts) / n
+    return np.sqrt(np.maximum(_sum(values.astype(float) ** 2, starts) / n - mean ** 2, 0))
+
+
+# every aggregation gets the values of a column sorted by group, and the index where each group starts
+AGGREGATIONS: dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    'count': _sizes,
+    'sum': _sum,
+    'mean': lambda values, starts: _sum(values, starts) / _sizes(values, starts),
+    'std': _std,
+    'min': lambda values, starts: np.minimum.reduceat(values, starts) if len(starts) else values[:0],
+    'max': lambda values, starts: np.maximum.reduceat(values, starts) if len(starts) else values[:0],
+    'median': lambda values, starts: np.array([np.median(g) for g in np.split(values, starts[1:])] if len(starts)
+                                              else [], dtype=float),
+    'first': lambda values, starts: values[starts],
+    'last': lambda values, starts: values[np.append(starts[1:], len(values)) - 1],
+}
+
+
+def miners_at_deposits(frame: FrameArrays) -> list[int]:
+    """How many miners of each player are next to a deposit (so could mine it) in the frame"""
+    deposit = np.isin(frame.cells['kind'], DEPOSIT_CODES)
+    near = np.zeros_like(deposit)
+    near[1:] |= deposit[:-1]
+    near[:-1] |= deposit[1:]
+    near[:, 1:] |= deposit[:, :-1]
+    near[:, :-1] |= deposit[:, 1:]
+    e = frame.entities
+    at = near[e['x'], e['y']] & (e['kind'] == KIND_CODES['M']) & (e['in_building'] == 0)
+    return [int(np.count_nonzero(at & (e['owner'] == p))) for p in (1, 2)]
+
+
+def extract(path: str) -> dict[str, dict[str, np.ndarray]]:
+    """Extracts the tables of a single log, every row of which has the frame it comes from (but not the game)
+
+    The events of frame n are those of the step from frame n to frame n + 1 (so the last frame has none).
+    """
+    log = GameLog.load(path)
+    n = len(log)
+    info = np.zeros((n, 2, len(INFO_FIELDS)), dtype='<i4')
+    at_deposits = np.zeros((n, 2), dtype='<i4')
+    agent_times = np.full((n, 2), -1, dtype='<i8')  # only in logs that have them (see Game.play)
+    events: dict[str, list[np.ndarray]] = {name: [] for name in EVENT_COLUMNS}
+    for f in range(n):
+        frame = log.frame_arrays(f)
+        info[f] = frame.info
+        at_deposits[f] = miners_at_deposits(frame)
+        if 'agent_times' in frame.extra:
+            agent_times[f] = frame.extra['agent_times']
+        for name in EVENT_COLUMNS:
+            events[name].append(getattr(frame, name))
+
+    frames: dict[str, np.ndarray] = {'frame': np.arange(n, dtype='<i4')}
+    for p in range(2):
+        frames.update({f"p{p + 1}_{field}": info[:, p, i] for i, field in enumerate(INFO_FIELDS) if field != 'player'})
+        frames[f"p{p + 1}_miners_at_deposits"] = at_deposits[:, p]
+        frames[f"p{p + 1}_move_us"] = agent_times[:, p]
+    tables = {'frames': frames}
+    for name, columns in EVENT_COLUMNS.items():
+        counts = np.array([len(e) for e in events[name]], dtype='<i4')
+        frames[name] = counts
+        rows = np.concatenate(events[name]) if n else np.zeros((0, len(columns)))
+        tables[name] = {'frame': np.repeat(np.arange(n, dtype='<i4'), counts),
+                        **{column: rows[:, i] for i, column in enumerate(columns)}}
+
+    points = (int(info[-1, 0, INFO_FIELDS.index('points')]), int(info[-1, 1, INFO_FIELDS.index('points')]))
+    tables['games'] = {
+        'game_id': np.array([str(log.info['game_id'])]),
+        'path': np.array([os.path.abspath(path)]),
+        'game_length': np.array([log.info['game_length']]),
+        'map_w': np.array([log.info['map_w']]),
+        'map_h': np.array([log.info['map_h']]),
+        'seed': np.array([-1 if log.info.get('seed') is None else log.info['seed']]),
+        'frames': np.array([n]),
+        'p1_points': np.array([points[0]]),
+        'p2_points': np.array([points[1]]),
+        'winner': np.array([winner(points)]),
+        'margin': np.array([points[0] - points[1]]),
+    }
+    return tables
+
+
+def part_path(directory: str, log_path: str) -> str:
+    """The tables of every log are kept in a part of their own, named by a hash of the path of the log"""
+    name = hashlib.blake2b(os.path.abspath(log_path).encode(), digest_size=8).hexdigest()
+    return os.path.join(directory, 'parts', f"{name}.npz")
+
+
+def extract_part(task: tuple[str, str]) -> Optional[str]:
+    """Extracts the tables of a log into its part, returning the path of the log if it couldn't be read"""
+    log_path, directory = task
+    try:
+        tables = extract(log_path)
+    except (OSError, ValueError, KeyError, IndexError):
+        return log_path  # most likely the game is still being played
+    path = part_path(directory, log_path)
+    with open(f"{path}.{os.getpid()}.tmp", 'wb') as f:
+        np.savez(f, **{f"{table}/{column}": values for table, columns in tables.items()
+                       for column, values in columns.items()})
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+    return None
+
+
+def find_logs(log_dirs: list[str]) -> dict[str, tuple[int, int]]:
+    """Every log in the directories, with its mtime and size (to tell when it changes)"""
+    found = {}
+    for log_dir in log_dirs:
+        with os.scandir(log_dir) as it:
+            for entry in it:
+                if entry.name[:5] == 'game_' and entry.name[-5:] == '.plog':
+                    stat = entry.stat()
+                    found[os.path.abspath(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+
+class Dataset:
+    """Tables (one .npz each) of the frames and events of many game logs, to be queried with Table
+
+    The tables are games (a row per game), frames (a row per frame of every game, with the info block of both players,
+    the miners of each next to a deposit, the time each agent took to move if the log has it, and the number of every
+    event), and moves, collisions, attacks and destroyed (a row per event). Every row of every table but games has the
+    game (its row in games) and frame it comes from.
+    """
+
+    def __init__(self, directory: str = DATASET_DIR):
+        self.directory: str = directory
+        self._tables: dict[str, Table] = {}
+
+    def table(self, name: str) -> Table:
+        if name not in self._tables:
+            with np.load(os.path.join(self.directory, f"{name}.npz")) as data:
+                self._tables[name] = Table({column: data[column] for column in data.files})
+        return self._tables[name]
+
+    def __getattr__(self, name: str) -> Table:
+        if name in TABLES:
+            return self.table(name)
+        raise AttributeError(name)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, 'manifest.json')
+
+    def build(self, log_dirs: list[str], workers: Optional[int] = None) -> int:
+        """Brings the tables up to date with the logs in the directories, only extracting logs that are new or have
+        changed (each on its own, on a pool of workers) before putting every table back together
+
+        Returns the number of logs extracted.
+        """
+        os.makedirs(os.path.join(self.directory, 'parts'), exist_ok=True)
+        known: dict[str, list[int]] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                known = json.load(f)
+        found = find_logs(log_dirs)
+        changed = [path for path, stamp in found.items() if known.get(path) != list(stamp)]
+        if changed:
+            with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+                tasks = [(path, self.directory) for path in changed]
+                for failed in pool.imap_unordered(extract_part, tasks, chunksize=max(len(tasks) // 64, 1)):
+                    if failed is not None:
+                        print("Error reading", failed)
+                        found.pop(failed)
+        for path in known.keys() - found.keys():  # logs that were removed
+            if os.path.exists(part_path(self.directory, path)):
+                os.remove(part_path(self.directory, path))
+        self.combine(sorted(found))
+        with open(self.manifest_path, 'w') as f:
+            json.dump(found, f)
+        return len(changed)
+
+    def combine(self, log_paths: list[str]):
+        """Puts the tables of every part together, numbering the games in the order of the logs given"""
+        parts: dict[str, dict[str, list[np.ndarray]]] = {table: {} for table in TABLES}
+        for game, log_path in enumerate(log_paths):
+            with np.load(part_path(self.directory, log_path)) as data:
+                for key in data.files:
+                    table, column = key.split('/')
+                    parts[table].setdefault(column, []).append(data[key])
+                rows = {table: len(data[f"{table}/frame"]) for table in TABLES if table != 'games'}
+            for table, n in rows.items():
+                parts[table].setdefault('game', []).append(np.full(n, game, dtype='<i4'))
+        parts['games']['game'] = [np.arange(len(log_paths), dtype='<i4')]
+        for table, columns in parts.items():
+            with open(os.path.join(self.directory, f"{table}.npz"), 'wb') as f:
+                np.savez(f, **{column: np.concatenate(values) for column, values in columns.items()})
+        self._tables.clear()
+
+
+def parse_filters(specs: list[str]) -> dict[str, Any]:
+    filters = {}
+    for spec in specs:
+        key, _, text = spec.partition('=')
+        try:
+            filters[key] = json.loads(text)
+        except json.JSONDecodeError:
+            filters[key] = text
+    return filters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extracts the frames and events of many game logs into tables, and "
+                                                 "queries them")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="extract any new or changed logs")
+    build.add_argument('log_dirs', nargs='+', help="directories of game logs")
+    build.add_argument('--dataset', default=DATASET_DIR, help="where to keep the tables")
+    build.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    query = commands.add_parser('query', help="filter, group and aggregate a table")
+    query.add_argument('table', choices=TABLES)
+    query.add_argument('--dataset', default=DATASET_DIR, help="where the tables are kept")
+    query.add_argument('--filter', nargs='+', default=[], metavar='COLUMN=VALUE',
+                       help="conditions, also as min_<column>=value or max_<column>=value")
+    query.add_argument('--join', nargs='+', default=[], metavar='COLUMN',
+                       help="columns of the games table to add to every row (by game)")
+    query.add_argument('--group', nargs='+', default=[], metavar='COLUMN', help="the columns to group by")
+    query.add_argument('--agg', nargs='+', default=[], metavar='NAME=COLUMN:FUNCTION',
+                       help="aggregations of every group (or of the whole table without --group), e.g. "
+                            "margin=margin:mean, or just COLUMN:FUNCTION")
+    query.add_argument('--sort', nargs='+', default=[], metavar='COLUMN')
+    query.add_argument('--descending', action='store_true')
+    query.add_argument('--limit', type=int, default=20, help="how many rows to show")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = perf_counter()
+        extracted = Dataset(args.dataset).build(args.log_dirs, args.workers)
+        print(f"Extracted {extracted} logs in {perf_counter() - start:.1f}s, tables saved to {args.dataset}")
+        return
+
+    dataset = Dataset(args.dataset)
+    table = dataset.table(args.table)
+    if args.join:
+        table = table.join(dataset.games, 'game', *args.join)
+    table = table.filter(**parse_filters(args.filter))
+    if args.group or args.agg:
+        aggregations = {}
+        for spec in args.agg:
+            name, _, rest = spec.rpartition('=')
+            column, _, function = rest.partition(':')
+            aggregations[name or f"{column}_{function}"] = (column, function)
+        table = table.group(args.group, **aggregations)
+    if args.sort:
+        table = table.sort(*args.sort, descending=args.descending)
+    print(f"{len(table)} rows")
+    print(table.head(args.limit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+from copy import deepcopy
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import count
+from random import Random
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+import metrics
+from entities import Inventory, Attacker, Fighter
+from game import Game
+from game_log import LOG_WRITERS
+from params import GameParams, StartParams
+from path_finding import AStarMap, space_time_astar
+from player import Player, DEPTH
+from result_cache import engine_version
+from vec2 import vec2
+
+
+DEFAULT_THRESHOLD = 0.1  # how much slower (as a fraction) a benchmark must get to count as a regression
+
+
+@dataclass
+class Scenario:
+    name: str
+    game: Game  # the state every benchmark starts from, it is copied by anything that changes it
+
+
+def advance(game: Game, until: Callable[[Game], bool], max_turns: int = 1000) -> Game:
+    while not game.game_over and not until(game) and max_turns > 0:
+        game.step()
+        max_turns -= 1
+    return game
+
+
+def ship_count(game: Game) -> int:
+    return len(game.p1_inv.ships) + len(game.p2_inv.ships)
+
+
+def battle(game: Game, fighters: int) -> Game:
+    """Puts fighters of both players in blocks facing each other in the middle of the map"""
+    mid = game.w // 2
+    placed = [0, 0]
+    for x in range(game.w // 4):
+        for y in range(game.h):
+            for player, pos in ((0, vec2(mid - 1 - x, y)), (1, vec2(game.w - mid + x, y))):
+                if placed[player] < fighters and game.game_map[pos] is None:
+                    Fighter((game.p1_inv, game.p2_inv)[player], game.game_map, pos, game.params)
+                    placed[player] += 1
+    return game
+
+
+def make_scenarios() -> list[Scenario]:
+    """The scenarios every benchmark is run on, they are always exactly the same"""
+    return [
+        Scenario('early', advance(Game(0, Player, Player, seed=1), lambda g: g.move_num >= 10)),
+        Scenario('mid', advance(Game(0, Player, Player, seed=2), lambda g: ship_count(g) >= 40)),
+        Scenario('battle', battle(advance(Game(0, Player, Player, seed=3), lambda g: g.move_num >= 20), 40)),
+        Scenario('large', advance(Game(0, Player, Player, seed=4, game_params=GameParams(
+            start=StartParams(min_w=100, max_w=100, min_h=50, max_h=50))), lambda g: g.move_num >= 20)),
+    ]
+
+
+def measure(run: Callable[[Any], Any], setup: Callable[[], Any] = lambda: None, repeat: int = 5) -> list[float]:
+    """Times run(setup()) repeat times, not counting the time taken by setup"""
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = perf_counter()
+        run(state)
+        times.append(perf_counter() - start)
+    return times
+
+
+def histogram_totals(histogram: metrics.Histogram) -> dict[tuple[str, ...], tuple[float, int]]:
+    return {key: (total[0], sum(counts)) for key, (counts, total) in histogram.values.items()}
+
+
+def bench_step(scenario: Scenario, repeat: int, turns: int = 10) -> dict[str, list[float]]:
+    """The time taken by every phase of Game.step (and by each agent's move), per turn"""
+    metrics.enable()
+    results: dict[str, list[float]] = {}
+    for _ in range(repeat):
+        game = deepcopy(scenario.game)
+        phases, moves = histogram_totals(metrics.STEP_PHASE_SECONDS), histogram_totals(metrics.AGENT_MOVE_SECONDS)
+        start = perf_counter()
+        for _ in range(turns):
+            game.step()
+        results.setdefault('step', []).append((perf_counter() - start) / turns)
+        for name, before, histogram in (('phase', phases, metrics.STEP_PHASE_SECONDS),
+                                        ('move', moves, metrics.AGENT_MOVE_SECONDS)):
+            for key, (total, n) in histogram_totals(histogram).items():
+                previous, previous_n = before.get(key, (0, 0))
+                if n > previous_n:
+                    results.setdefault(f"step.{name}.{key[0]}", []).append((total - previous) / (n - previous_n))
+    return results
+
+
+def bench_generate_map(scenario: Scenario, repeat: int) -> dict[str, list[float]]:
+    def setup() -> Game:
+        game = Game.__new__(Game)  # just what generate_map needs
+        game.params = scenario.game.params
+        game.rand = Random(scenario.game.seed)
+        ids = count(1)
+        game.p1_inv, game.p2_inv = Inventory(1, game.params, ids=ids), Inventory(2, game.params, ids=ids)
+        game.deposits = {}
+        return game
+
+    return {'generate_map': measure(Game.generate_map, setup, repeat)}
+
+
+def bench_attack_all(scenario: Scenario, repeat: int) -> dict[str, list[float]]:
+    def run(attackers: list[Attacker]):
+        for a in attackers:
+            a.attack_all()
+
+    def setup() -> list[Attacker]:
+        game = deepcopy(scenario.game)  # attacks damage the entities
+        return game.p1_inv.attackers + game.p2_inv.attackers
+
+    return {'attack_all': measure(run, setup, repeat)}
+
+
+def path_queries(scenario: Scenario) -> list[tuple[vec2, vec2]]:
+    """The start and target of a path for every ship of player 1, the targets are random (but always the same) cells
+    that ships can go to"""
+    game = scenario.game
+    maze = Player.process_map(game.game_map, 1)
+    rand = Random(game.seed)
+    free = [vec2(x, y) for x, y in np.argwhere(maze > 0).tolist()]
+    return [(s.pos, rand.choice(free)) for s in game.p1_inv.ships]
+
+
+def bench_path_finding(scenario: Scenario, repeat: int) -> dict[str, list[float]]:
+    game = scenario.game
+    maze = Player.process_map(game.game_map, 1)
+    queries = path_queries(scenario)
+
+    def run_astar(_):
+        for start, target in queries:
+            AStarMap(start, target, maze)
+
+    def run_space_time_astar(reserved: dict[int, dict[vec2, list[int]]]):
+        for i, (start, target) in enumerate(queries):
+            space_time_astar(i, start, target, game.move_num, maze, reserved, DEPTH)
+
+    return {'AStarMap': measure(run_astar, repeat=repeat),
+            'space_time_astar': measure(run_space_time_astar, dict, repeat),
+            'process_map': measure(lambda _: Player.process_map(game.game_map, 1), repeat=repeat)}
+
+
+def bench_logs(scenario: Scenario, repeat: int, frames: int = 20) -> dict[str, list[float]]:
+    """The time taken to write a frame, with every log format (besides actions, which doesn't write frames)"""
+    frame = deepcopy(scenario.game).capture_frame()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, writer_type in LOG_WRITERS.items():
+            if writer_type.records_actions:
+                continue
+            writer = writer_type(os.path.join(tmp, f"bench.{name}"), scenario.game.log_info())
+
+            def run(_):
+                for _ in range(frames):
+                    writer.write_frame(frame)
+
+            results[f"log.{name}"] = [t / frames for t in measure(run, repeat=repeat)]
+            writer.close(scenario.game.log_info())
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[Scenario, int], dict[str, list[float]]]] = {
+    'step': bench_step,
+    'generate_map': bench_generate_map,
+    'attack_all': bench_attack_all,
+    'path_finding': bench_path_finding,
+    'logs': bench_logs,
+}
+
+
+def run_benchmarks(only: Optional[list[str]] = None, repeat: int = 5) -> dict[str, Any]:
+    """Runs every benchmark (or only those given) on every scenario, timings are in seconds"""
+    results = {}
+    for scenario in make_scenarios():
+        for name, bench in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            for key, times in bench(scenario, repeat).items():
+                results[f"{scenario.name}/{key}"] = {'median': statistics.median(times), 'min': min(times),
+                                                     'runs': len(times)}
+                print(f"{scenario.name}/{key}: {statistics.median(times) * 1000:.3f}ms")
+    return {
+        'meta': {'time': datetime.now(timezone.utc).isoformat(), 'python': sys.version.split()[0],
+                 'numpy': np.__version__, 'platform': platform.platform(), 'engine': engine_version()},
+        'results': results
+    }
+
+
+def compare(old: dict[str, Any], new: dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """Prints how every benchmark changed between two runs, returning those that got slower by more than threshold
+
+    The fastest run of every benchmark is compared, as it is the least affected by anything else using the machine.
+    """
+    regressions = []
+    for key, result in new['results'].items():
+        if key not in old['results']:
+            continue
+        before, after = old['results'][key]['min'], result['min']
+        change = after / before - 1 if before > 0 else 0
+        flag = ''
+        if change > threshold:
+            regressions.append(key)
+            flag = '  <-- REGRESSION'
+        print(f"{key}: {before * 1000:.3f}ms -> {after * 1000:.3f}ms ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the engine, path finding and logs on fixed scenarios")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="the benchmarks to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="how many times every benchmark is run")
+    parser.add_argument('--out', default='bench.json', help="where to save the results")
+    parser.add_argument('--baseline', default=None, help="the results of an earlier run to compare against")
+    parser.add_argument('--compare', nargs=2, default=None, metavar=('OLD', 'NEW'),
+                        help="only compare the results of two earlier runs")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="how much slower (as a fraction) counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        runs = []
+        for path in args.compare:
+            with open(path) as f:
+                runs.append(json.load(f))
+        old, new = runs
+    else:
+        new = run_benchmarks(args.only, args.repeat)
+        with open(args.out, 'w') as f:
+            json.dump(new, f, indent=1)
+        print(f"Results saved to {args.out}")
+        if args.baseline is None:
+            return
+        with open(args.baseline) as f:
+            old = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmarks got slower by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
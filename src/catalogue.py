@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from typing import Any, Optional
+
+from outcome import winner
+from game_log import GameLog, GameSummary, summary_path
+
+
+CATALOGUE_NAME = 'catalogue.sqlite'
+
+# every column of the catalogue, besides game_id, mtime and size (which tell us when a log needs to be re-read)
+GAME_COLUMNS: tuple[str, ...] = ('game_length', 'map_w', 'map_h', 'seed', 'p1_points', 'p2_points', 'winner')
+
+
+class Catalogue:
+    """An index (kept in an SQLite database next to them) of all the game logs in a directory
+
+    Every log is only read when it is first seen or when it changes, so listing the games is always cheap.
+    """
+
+    def __init__(self, log_dir: str):
+        self.log_dir: str = log_dir
+        self.db = sqlite3.connect(os.path.join(log_dir, CATALOGUE_NAME), timeout=30, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()  # the server uses the catalogue from several threads
+        self._unreadable: set[str] = set()  # logs that couldn't be read, which are only reported once
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS games (game_id TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, "
+                            "game_length INTEGER, map_w INTEGER, map_h INTEGER, seed INTEGER, p1_points INTEGER, "
+                            "p2_points INTEGER, winner INTEGER)")
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> Catalogue:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def log_path(self, game_id: Any) -> str:
+        return os.path.join(self.log_dir, f"game_{game_id}.plog")
+
+    def add(self, game_id: Any, info: dict[str, Any], points: tuple[int, int]):
+        """Adds (or updates) a game whose log has just been written, so it doesn't have to be read again"""
+        stat = os.stat(self.log_path(game_id))
+        row = (str(game_id), stat.st_mtime_ns, stat.st_size, info['game_length'], info['map_w'], info['map_h'],
+               info.get('seed'), points[0], points[1], winner(points))
+        with self._lock, self.db:
+            self.db.execute(f"INSERT OR REPLACE INTO games VALUES ({', '.join('?' * len(row))})", row)
+
+    def refresh(self):
+        """Brings the catalogue up to date with the log directory, only reading logs that are new or have changed"""
+        with self._lock:
+            known = {r['game_id']: (r['mtime'], r['size']) for r in self.db.execute("SELECT game_id, mtime, size "
+                                                                                    "FROM games")}
+        found = {}
+        with os.scandir(self.log_dir) as it:
+            for entry in it:
+                if entry.name[:5] == 'game_' and entry.name[-5:] == '.plog':
+                    stat = entry.stat()
+                    found[entry.name[5:-5]] = (stat.st_mtime_ns, stat.st_size)
+        for game_id in found.keys() - known.keys() | {g for g in found.keys() & known.keys() if found[g] != known[g]}:
+            try:
+                info, points = self.read_log(game_id)
+                self.add(game_id, info, points)
+            except (OSError, ValueError, KeyError, IndexError):
+                # most likely the game is still being played, so it is tried again on every refresh until it's done
+                if game_id not in self._unreadable:
+                    print("Error reading game", game_id)
+                    self._unreadable.add(game_id)
+            else:
+                self._unreadable.discard(game_id)
+        self._unreadable &= found.keys()
+        removed = [(game_id,) for game_id in known.keys() - found.keys()]
+        if removed:
+            with self._lock, self.db:
+                self.db.executemany("DELETE FROM games WHERE game_id = ?", removed)
+
+    def read_log(self, game_id: str) -> tuple[dict[str, Any], tuple[int, int]]:
+        """Finds the info block and final points of a game, from its summary if it has one (or else from its log)"""
+        log_path = self.log_path(game_id)
+        log = GameLog.load(log_path)
+        path = summary_path(log_path)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(log_path):
+            summary = GameSummary.load(path)
+            return log.info, (int(summary['p1_points'][-1]), int(summary['p2_points'][-1]))
+        final_info = log.frame(len(log) - 1)['info']
+        return log.info, (final_info[0]['points'], final_info[1]['points'])
+
+    @staticmethod
+    def _where(filters: dict[str, Any]) -> tuple[str, list]:
+        """Turns filters (column=value, min_<column>=value or max_<column>=value) into a WHERE clause"""
+        clauses, params = [], []
+        for key, value in filters.items():
+            if value is None:
+                continue
+            op, column = ('>=', key[4:]) if key[:4] == 'min_' else ('<=', key[4:]) if key[:4] == 'max_' else ('=', key)
+            if column not in GAME_COLUMNS:
+                raise ValueError(f"Unknown column {column}")
+            clauses.append(f"{column} {op} ?")
+            params.append(value)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def count(self, **filters) -> int:
+        where, params = self._where(filters)
+        with self._lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM games{where}", params).fetchone()[0]
+
+    def games(self, limit: Optional[int] = None, offset: int = 0, **filters) -> list[dict[str, Any]]:
+        """Lists the games matching the filters (see _where), in order of game id"""
+        where, params = self._where(filters)
+        query = f"SELECT * FROM games{where} ORDER BY CAST(game_id AS INTEGER), game_id LIMIT ? OFFSET ?"
+        with self._lock:
+            return [dict(r) for r in self.db.execute(query, params + [-1 if limit is None else limit, offset])]
@@ -20,7 +20,9 @@ class Entity(ABC):
     def __init__(self, p_inv: Inventory, game_map: npt.NDArray[object], pos: vec2,
                  game_params: params.GameParams, *, ent_id: Optional[int] = None, **kwargs):
         # by this point **kwargs should be empty as Entity MUST be the base class for everything else
-        if ent_id is None:
+        if ent_id is None and p_inv.ids is not None:
+            self.id = next(p_inv.ids)  # the game assigns its own IDs, so they are the same every time it is played
+        elif ent_id is None:
             self.id = Entity.auto_id  # automatically assigns a unique ID to every entity
             Entity.auto_id += 1
         else:
@@ -105,10 +107,14 @@ class Attacker(Entity, ABC):
         # if self.game_map[self.pos] != self:
         #     return []  # a ship can only attack when it's not inside a building
         attacks: list[Entity] = []
-        for pos in diamond(self.pos, self.range, self.game_map.shape[0], self.game_map.shape[1]):
-            ent: Optional[Entity] = self.game_map[pos]
-            if isinstance(ent, self.attacks) and self.player != ent.player:
-                attacks.append(ent)
+        # this is diamond(self.pos, self.range, ...) written out, as it's by far the hottest loop of the game
+        game_map, (x, y), size = self.game_map, self.pos, self.range
+        w, h = game_map.shape
+        for i in range(max(-size, -x), min(size + 1, w - x)):
+            for j in range(max(-size + abs(i), -y), min(size + 1 - abs(i), h - y)):
+                ent: Optional[Entity] = game_map[x + i, y + j]
+                if ent is not None and (i or j) and isinstance(ent, self.attacks) and self.player != ent.player:
+                    attacks.append(ent)
         if len(attacks) == 0:
             return []
         dmg = self.damage // len(attacks)
@@ -237,12 +243,18 @@ class UnderConstruction(Building, desc='C'):
         self.total_ore_needed: int = building_cost.ore_cost
         self.total_fuel_needed: int = building_cost.fuel_cost
 
+    @property
+    def progress(self) -> float:
+        """Fraction of the building that has been built (rounded to 2 decimal places)"""
+        res = self.game_params.resources
+        progress = res.ore * self.ore + res.fuel * self.fuel
+        total = res.ore * self.total_ore_needed + res.fuel * self.total_fuel_needed
+        return round(progress / total, 2)
+
     def min_repr(self) -> dict[str, Any]:
         d = super().min_repr()
         d['b'] = self.building_type.desc
-        progress = Resource.ORE.value * self.ore + Resource.FUEL.value * self.fuel
-        total = Resource.ORE.value * self.total_ore_needed + Resource.FUEL.value * self.total_fuel_needed
-        d['m'] = round(progress / total, 2)
+        d['m'] = self.progress
         return d
 
     def build(self, resources: list[Resource]) -> list[Resource]:
@@ -396,6 +408,8 @@ class Inventory:
     turrets: list[Turret] = field(default_factory=list)
     miners: list[Miner] = field(default_factory=list)
     fighters: list[Fighter] = field(default_factory=list)
+    # if set, this is used to assign IDs to new entities (it should be shared by both players' inventories)
+    ids: Optional[Iterator[int]] = field(default=None, repr=False, compare=False)
 
     @property
     def entities(self) -> list[Entity]:
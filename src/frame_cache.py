@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import tempfile
+from typing import Any, Optional
+
+import numpy as np
+
+import metrics
+from game_log import GameLog
+from log_codec import FrameArrays
+
+
+def default_cache_dir() -> str:
+    # /dev/shm is a tmpfs, so the cache is kept in memory (which every process maps) rather than written to disk
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'pandora_frames')
+
+
+# a chunk is its number of frames, the offset of every frame (and of the end of the last one), then the frames
+CHUNK_COUNT = struct.Struct('<I')
+
+
+class FrameCache:
+    """A byte-budgeted LRU cache of frame chunks, kept as files in a directory that any number of processes can share
+
+    Chunks are memory-mapped when used, so processes serving the same games share a single copy of them.
+    The least recently used chunks (by mtime, which is updated whenever a chunk is used) are deleted once the files
+    in the directory take up more than budget bytes.
+    """
+
+    def __init__(self, directory: str, budget: int):
+        self.directory: str = directory
+        self.budget: int = budget
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[mmap.mmap]:
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(path)  # marks the chunk as recently used
+        except FileNotFoundError:
+            metrics.CACHE_REQUESTS.inc(cache='frames', result='miss')
+            return None  # never cached, or another process just evicted it
+        metrics.CACHE_REQUESTS.inc(cache='frames', result='hit')
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.budget:
+            return
+        path = os.path.join(self.directory, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # other processes must never see a partly written chunk
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used chunks until the cache is within its budget"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue  # still being written
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # another process evicted it while we were looking
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        used = sum(size for _, size, _ in entries)
+        if used <= self.budget:
+            return
+        entries.sort()
+        target = self.budget * 3 // 4  # evict a bit more than needed, so we don't have to do this on every put
+        for _, size, path in entries:
+            if used <= target:
+                break
+            try:
+                os.remove(path)  # processes that have it mapped can keep using it
+            except FileNotFoundError:
+                pass
+            used -= size
+
+
+class CachedGameLog(GameLog):
+    """Wraps a log whose frames are expensive to decode, so that they are decoded chunk_frames at a time into a
+    FrameCache and served (in their binary form) from there
+
+    The key must identify this exact version of the log (e.g. include its mtime and size), as chunks are never updated.
+    """
+    chunk_frames = 32
+
+    def __init__(self, log: GameLog, key: str, cache: FrameCache):
+        self.log: GameLog = log
+        self.key: str = key
+        self.cache: FrameCache = cache
+        self.info: dict[str, Any] = log.info
+        self._chunk: Optional[tuple[int, mmap.mmap | bytes]] = None  # the last chunk used
+
+    def __len__(self):
+        return len(self.log)
+
+    def chunk(self, chunk_num: int) -> mmap.mmap | bytes:
+        if self._chunk is not None and self._chunk[0] == chunk_num:
+            return self._chunk[1]
+        key = f"{self.key}_{chunk_num}"
+        data = self.cache.get(key)
+        if data is None:
+            start = chunk_num * self.chunk_frames
+            blobs = [self.log.frame_bytes(n) for n in range(start, min(start + self.chunk_frames, len(self.log)))]
+            header_len = CHUNK_COUNT.size + 4 * (len(blobs) + 1)
+            offsets = np.cumsum([header_len] + [len(blob) for blob in blobs], dtype='<u4')
+            data = b''.join([CHUNK_COUNT.pack(len(blobs)), offsets.tobytes()] + blobs)
+            self.cache.put(key, data)
+        self._chunk = (chunk_num, data)
+        return data
+
+    def frame_bytes(self, frame_num: int) -> bytes:
+        if not 0 <= frame_num < len(self):
+            raise IndexError(f"Frame {frame_num} is out of range")
+        data = self.chunk(frame_num // self.chunk_frames)
+        i = frame_num % self.chunk_frames
+        start, end = np.frombuffer(data, dtype='<u4', count=2, offset=CHUNK_COUNT.size + 4 * i).tolist()
+        return data[start:end]
+
+    def frame_arrays(self, frame_num: int) -> FrameArrays:
+        return FrameArrays.decode(self.frame_bytes(frame_num), self.info['map_w'], self.info['map_h'])
+
+    def frame(self, frame_num: int) -> dict[str, Any]:
+        return self.frame_arrays(frame_num).to_dict()
@@ -1,47 +1,133 @@
 from __future__ import annotations
 
-import json
-from dataclasses import asdict
+from copy import deepcopy
+from dataclasses import asdict, astuple, dataclass
+from itertools import count
 from random import Random
+from time import perf_counter
+from typing import Any, Optional
 import os
 
 import numpy as np
 import numpy.typing as npt
 
 from vec2 import vec2
-from enums import Resource, enum_encoder
+from enums import Resource
 from entities import Inventory, Base, Turret, Miner, Fighter, ResourceDeposit, diamond, Attacker, Entity, Ship, Building
 from params import GameParams, TimeLimits, DepositParams
 from action import Action
 from agent import Agent
+import metrics
+from live import LivePublisher
+from profiling import AgentProfiler, PROFILERS, NULL_PROFILER, profile_path
+from game_log import LogWriter, LOG_WRITERS, GameSummary, summary_path
+from outcome import GameOutcome, winner
+from log_codec import FrameArrays, FrameCapture, INFO_FIELDS
 
 
 LOG_DIR = os.path.join(os.getcwd(), 'game_logs')
 
 
+@dataclass
+class MapLayout:
+    """A generated map, which can be reused by any game with the same seed and the same map_key of its params"""
+    game_length: int
+    w: int
+    h: int
+    base_pos: vec2  # the base of player 1, the base of player 2 is its mirror image
+    deposits: list[tuple[vec2, Resource, int]]  # (position, resource, amount), in the order they were generated
+    rand_state: tuple  # the state of Game.rand once the map was generated
+
+
+class AgentClock:
+    """The time used by an agent, kept as TimeLimits describes (though the dev-kit never makes an agent forfeit)"""
+
+    def __init__(self, time_limits: TimeLimits):
+        self.time_limits: TimeLimits = time_limits
+        self.init_time: float = 0
+        self.remaining: float = time_limits.MAIN  # the time left on the clock, in seconds
+        self.move_times: list[float] = []
+        self.timeouts: list[int] = []  # the moves (0 for the constructor) that took longer than was allowed
+
+    def add_init(self, elapsed: float):
+        self.init_time = elapsed
+        if elapsed > self.time_limits.INIT + self.time_limits.DELAY:
+            self.timeouts.append(0)
+
+    def add_move(self, move_num: int, elapsed: float):
+        self.move_times.append(elapsed)
+        if elapsed > self.remaining + self.time_limits.DELAY:
+            self.timeouts.append(move_num)
+        self.remaining += self.time_limits.INCREMENT - elapsed
+
+    def summary(self) -> dict[str, Any]:
+        """The constructor time, the p50, p95, max and total move times, the clock at the end and the timeouts"""
+        summary: dict[str, Any] = {'init': self.init_time}
+        if self.move_times:
+            p50, p95 = np.percentile(self.move_times, [50, 95]).tolist()
+            summary.update(p50=p50, p95=p95, max=max(self.move_times), total=sum(self.move_times))
+        summary.update(clock=self.remaining, timeouts=self.timeouts)
+        return summary
+
+
+def map_key(params: GameParams) -> tuple:
+    """Everything in the params that the game length and the map generated depend on"""
+    start = params.start
+    return (start.min_len, start.max_len, start.min_w, start.max_w, start.min_h, start.max_h, start.base_off,
+            start.clear, astuple(params.ore_deposits), astuple(params.fuel_deposits))
+
+
 # noinspection PyPep8Naming
 class Game:
     """Class encapsulating a single game"""
 
     def __init__(self, game_id: int, player_1: type[Agent], player_2: type[Agent], *, seed: int = 0,
-                 time_limits: TimeLimits = TimeLimits(), game_params: GameParams = GameParams()):
+                 time_limits: TimeLimits = TimeLimits(), game_params: GameParams = GameParams(),
+                 layout: Optional[MapLayout] = None, record_timings: bool = False, profile: Optional[str] = None):
+        """If a layout is given (the layout of a game with the same seed and map_key), the map is not generated
+
+        If record_timings is set, the time taken by every phase of every step (and by the agents) is recorded, in
+        step_times for the last step and in timings for the whole game. Otherwise, nothing is timed.
+        If profile is given (one of PROFILERS), the moves of each agent are profiled separately, see save_profiles
+        (if the game is stepped by hand rather than with play or run, stop_profiling must be called once it is over).
+        """
         self.game_id: int = game_id
         self.game_over: bool = False
         self.time_limits: TimeLimits = time_limits
         self.params: GameParams = game_params
+        self.seed: int = seed
         self.rand: Random = Random(seed)
-        self.game_length: int = self.rand.randrange(game_params.start.min_len, game_params.start.max_len + 1)
+        self.game_length: int
+        if layout is None:
+            self.game_length = self.rand.randrange(game_params.start.min_len, game_params.start.max_len + 1)
+        else:
+            self.game_length = layout.game_length
         self.move_num: int = 0
+        self.record_timings: bool = record_timings
+        self.step_times: dict[str, float] = {}
+        self.timings: metrics.TimingStats = metrics.TimingStats()
+        self.profilers: tuple[AgentProfiler, AgentProfiler] = (NULL_PROFILER, NULL_PROFILER)
+        if profile is not None:
+            self.profilers = (PROFILERS[profile](), PROFILERS[profile]())
 
-        self.p1_inv = Inventory(1, game_params)
-        self.p2_inv = Inventory(2, game_params)
+        ids = count(1)  # entity IDs are assigned per game, so replaying a game gives every entity the same ID
+        self.p1_inv = Inventory(1, game_params, ids=ids)
+        self.p2_inv = Inventory(2, game_params, ids=ids)
+        self.actions: tuple[list[Action], list[Action]] = ([], [])  # the actions of both players in the last step
 
         # map generation
         self.w: int
         self.h: int
         self.game_map: npt.NDArray[object]
         self.deposits: dict[vec2, ResourceDeposit] = {}
-        self.generate_map()
+        if layout is None:
+            self.generate_map()
+            layout = MapLayout(self.game_length, self.w, self.h, self.p1_inv.bases[0].pos,
+                               [(pos, d.resource, d.amount) for pos, d in self.deposits.items()], self.rand.getstate())
+        else:
+            self.load_layout(layout)
+        self.layout: MapLayout = layout
+        self.capture: FrameCapture = FrameCapture(self.w, self.h)  # used to capture frames for the logs
 
         # starting ships
         base_1 = self.p1_inv.bases[0]
@@ -62,64 +148,144 @@ class Game:
             'game_map': self.game_map
         }
 
+        # the engine times the agents itself, every move is charged to their clocks
+        self.clocks: tuple[AgentClock, AgentClock] = (AgentClock(time_limits), AgentClock(time_limits))
+        start = perf_counter()
         self.player_1: Agent = player_1(1, **game_info)
+        self.clocks[0].add_init(perf_counter() - start)
+        start = perf_counter()
         self.player_2: Agent = player_2(2, **game_info)
+        self.clocks[1].add_init(perf_counter() - start)
 
-    def play(self, log: bool = False, log_p: bool = False):
+    def play(self, log: bool = False, log_p: bool = False, keyframe_interval: int = 0, log_format: str = 'json',
+             live_url: Optional[str] = None):
+        """Plays the game to the end, optionally saving the game logs
+
+        Frames are written to the log as they are produced, in the given log_format (one of LOG_WRITERS).
+        A summary of the game (see GameSummary) is saved alongside the log, and the game is added to the Catalogue.
+        If keyframe_interval is positive, only every keyframe_interval-th frame stores the full map, and every other
+        frame only stores the cells that changed since the previous frame (as a 'delta' instead of a 'map').
+        If live_url is given, every frame is also published to the server there (see LivePublisher) as it is produced.
+        If the agents are profiled, their profiles are saved next to the log (see profile_path).
+        """
         if self.game_over:
             return
-        frames = []
+        start_time = perf_counter()
+        start_move = self.move_num
+        writer: Optional[LogWriter] = None
+        summary: Optional[GameSummary] = None
+        log_path = f"{LOG_DIR}/game_{self.game_id}.plog"
+        if log:
+            writer = LOG_WRITERS[log_format](log_path, self.log_info(), keyframe_interval)
+            summary = GameSummary()
+        publisher: Optional[LivePublisher] = None
+        if live_url is not None:
+            publisher = LivePublisher(live_url, self.game_id, self.log_info())
         if log_p:
             print('=' * (self.w * 2 - 1))
             print(str(self))
             print('=' * (self.w * 2 - 1))
 
-        while not self.game_over:
-            min_map = [[self.game_map[x, y].min_repr() if self.game_map[x, y] is not None else {'t': 'E'}
-                        for y in range(self.h)] for x in range(self.w)]
-            info = [self.p1_inv.min_repr(), self.p2_inv.min_repr()]
-            moves, collisions, attacks, destroyed = self.step()
-            frame = {
-                'info': info,
-                'map': min_map,
-                'moves': moves,
-                'collisions': collisions,
-                'attacks': attacks,
-                'destroyed': destroyed
-            }
-            frames.append(frame)
-            if log_p:
-                print(str(self))
-                print('=' * (self.w * 2 - 1))
-            elif self.move_num % 50 == 0:
-                print(f"Move {self.move_num} [{info[0]['points']} vs {info[1]['points']}]")
-        min_map = [[self.game_map[x, y].min_repr() if self.game_map[x, y] is not None else {'t': 'E'}
-                    for y in range(self.h)] for x in range(self.w)]
-        info = [self.p1_inv.min_repr(), self.p2_inv.min_repr()]
-        frame = {
-            'info': info,
-            'map': min_map,
-            'moves': {},
-            'collisions': [],
-            'attacks': [],
-            'destroyed': []
-        }
-        frames.append(frame)
-        if log:
-            logs = {
-                'info': {
-                    'game_id': self.game_id,
-                    'game_length': self.game_length,
-                    'map_w': self.w,
-                    'map_h': self.h,
-                    'game_params': asdict(self.params)
-                },
-                'frames': frames
-            }
-
+        try:
+            while not self.game_over:
+                frame_num = self.move_num
+                frame = self.capture_frame()
+                moves, collisions, attacks, destroyed = self.step()
+                frame.set_events(moves, collisions, attacks, destroyed)
+                # the time each agent took to move from this frame (in microseconds), and what was left on its clock
+                # (in ms)
+                frame.extra['agent_times'] = [round(c.move_times[-1] * 1e6) for c in self.clocks]
+                frame.extra['clocks'] = [round(c.remaining * 1e3) for c in self.clocks]
+                if self.record_timings:  # in microseconds, as that's plenty
+                    frame.extra['timings'] = {name: round(t * 1e6) for name, t in self.step_times.items()}
+                if writer is not None:
+                    if writer.records_actions:
+                        frame.extra['actions'] = [[r for a in actions if (r := a.min_repr()) is not None]
+                                                  for actions in self.actions]
+                    writer.write_frame(frame)
+                    summary.add(frame)
+                if publisher is not None:
+                    publisher.publish(frame_num, frame)
+                if log_p:
+                    print(str(self))
+                    print('=' * (self.w * 2 - 1))
+                elif self.move_num % 50 == 0:
+                    points = frame.info[:, INFO_FIELDS.index('points')]
+                    print(f"Move {self.move_num} [{points[0]} vs {points[1]}]")
+        finally:
+            self.stop_profiling()
+        if writer is not None or publisher is not None:
+            frame = self.capture_frame()
+        if writer is not None:
+            writer.write_frame(frame)
+            summary.add(frame)
             print("Saving game logs...")
-            with open(f"{LOG_DIR}/game_{self.game_id}.plog", 'w') as f:
-                json.dump(logs, f, default=enum_encoder)
+            writer.close(self.log_info())
+            summary.save(summary_path(log_path))
+            if self.profilers[0] is not NULL_PROFILER:
+                self.save_profiles(profile_path(log_path, 1), profile_path(log_path, 2))
+            from catalogue import Catalogue  # only games that are logged need the catalogue
+            with Catalogue(LOG_DIR) as catalogue:
+                points = frame.info[:, INFO_FIELDS.index('points')].tolist()
+                catalogue.add(self.game_id, self.log_info(), (points[0], points[1]))
+        if publisher is not None:  # this is only done once the log is saved, as viewers will then switch over to it
+            publisher.publish(self.move_num, frame)
+            publisher.close(self.log_info())
+        metrics.GAMES_COMPLETED.inc()
+        metrics.GAME_TURNS_PER_SECOND.set((self.move_num - start_move) / (perf_counter() - start_time))
+
+    def run(self) -> GameOutcome:
+        """Plays the game to the end as fast as possible, without capturing any frames or printing anything
+
+        This is what bulk evaluation (see tournament.py) uses, play is needed for logs or watching the game.
+        """
+        start_time = perf_counter()
+        start_move = self.move_num
+        try:
+            while not self.game_over:
+                self.step()
+        finally:
+            self.stop_profiling()
+        metrics.GAMES_COMPLETED.inc()
+        metrics.GAME_TURNS_PER_SECOND.set((self.move_num - start_move) / (perf_counter() - start_time))
+        return self.outcome()
+
+    def stop_profiling(self):
+        """Stops profiling the agents (play and run do this once the game is over, or if it crashes), their stats are
+        kept until they are saved"""
+        for profiler in self.profilers:
+            profiler.close()
+
+    def save_profiles(self, path_1: str, path_2: str):
+        """Saves the stats of each agent (see profiling.py to add up and show them)"""
+        self.stop_profiling()
+        for profiler, path in zip(self.profilers, (path_1, path_2)):
+            profiler.save(path)
+
+    def outcome(self) -> GameOutcome:
+        points = (self.p1_inv.score, self.p2_inv.score)
+        return GameOutcome(winner(points), points, self.move_num,
+                           self.timings.summary() if self.record_timings else None)
+
+    def capture_frame(self) -> FrameArrays:
+        """Captures the current state of the game, with no events (they can be set once the next step is done)
+
+        The same FrameArrays is reused every time, so it must be used before the next frame is captured.
+        """
+        return self.capture.capture(self.p1_inv, self.p2_inv, self.deposits)
+
+    def log_info(self) -> dict[str, Any]:
+        return {
+            'game_id': self.game_id,
+            'game_length': self.game_length,
+            'map_w': self.w,
+            'map_h': self.h,
+            'game_params': asdict(self.params),
+            'time_limits': asdict(self.time_limits),
+            'seed': self.seed,
+            'agent_times': [c.summary() for c in self.clocks],
+            **({'timings': self.timings.summary()} if self.record_timings else {})
+        }
 
     def step(self) -> tuple[dict[str, str], list[vec2], list[tuple[vec2, vec2, int]], list[vec2]]:
         if self.game_over:
@@ -127,22 +293,44 @@ class Game:
         self.move_num += 1
         if self.move_num == self.game_length:
             self.game_over = True
+        metrics.TURNS.inc()
+        timer = metrics.step_timer(self.record_timings)
         # we assume that the actions we have received here are already validated
-        actions1: list[Action] = self.player_1.move(self.move_num, self.game_map, self.p1_inv, self.p2_inv)
-        actions2: list[Action] = self.player_2.move(self.move_num, self.game_map, self.p1_inv, self.p2_inv)
+        # the clocks only time the moves themselves, not the profilers or the timer
+        with self.profilers[0]:
+            start = perf_counter()
+            actions1: list[Action] = self.player_1.move(self.move_num, self.game_map, self.p1_inv, self.p2_inv)
+            elapsed_1 = perf_counter() - start
+        timer.agent(1)
+        with self.profilers[1]:
+            start = perf_counter()
+            actions2: list[Action] = self.player_2.move(self.move_num, self.game_map, self.p1_inv, self.p2_inv)
+            elapsed_2 = perf_counter() - start
+        timer.agent(2)
+        self.clocks[0].add_move(self.move_num, elapsed_1)
+        self.clocks[1].add_move(self.move_num, elapsed_2)
+        self.actions = (actions1, actions2)
         actions = actions1 + actions2
         # first comes mining
         self.execute_mining(actions)
+        timer.phase('mining')
         # then cargo
         for a in actions:
             a.execute_cargo()
+        timer.phase('cargo')
         # then building new ships and buildings
         for a in actions:
             a.execute_build()
+        timer.phase('build')
         # now we can get to moving the ships
         moves, collisions = self.execute_movement(actions)
+        timer.phase('movement')
         # and finally execute the attacks, and destroy entities as needed
         attacks, destroyed = self.execute_attacks()
+        timer.phase('attacks')
+        if self.record_timings:
+            self.step_times = timer.times
+            self.timings.add(timer.times)
 
         if len(self.p1_inv.bases) == 0 or len(self.p2_inv.bases) == 0:
             self.game_length = self.move_num  # someone lost all their bases, so the game must end
@@ -232,6 +420,16 @@ class Game:
         for pos in diamond(base_pos, self.params.start.clear, self.w, self.h):
             self.game_map[pos] = None  # nothing should have overwritten any of these locations so nothing can be lost
 
+    def load_layout(self, layout: MapLayout):
+        self.w = layout.w
+        self.h = layout.h
+        self.game_map = np.ndarray((self.w, self.h), dtype=object)
+        Base(self.p1_inv, self.game_map, layout.base_pos, self.params)
+        Base(self.p2_inv, self.game_map, vec2(self.w - layout.base_pos.x - 1, layout.base_pos.y), self.params)
+        for pos, resource, amount in layout.deposits:
+            self.game_map[pos] = self.deposits[pos] = ResourceDeposit(amount, resource)
+        self.rand.setstate(layout.rand_state)
+
     def generate_deposit(self, resource: Resource, params: DepositParams, retry_count=0):
         # this will ONLY put deposits in locations that currently have nothing (None)
         # we will pretend we cannot go beyond half the map, and then simply reflect the map around the middle
@@ -281,6 +479,18 @@ class Game:
                 self.game_map[dp].amount = params.max_amt
                 self.game_map[(self.w - dp.x - 1, dp.y)].amount = params.max_amt
 
+    def __deepcopy__(self, memo):
+        # numpy arrays don't add themselves to the memo, so without this every entity would get its own copy of the map
+        game_map = np.ndarray(self.game_map.shape, dtype=object)
+        memo[id(self.game_map)] = game_map
+        for pos, mo in np.ndenumerate(self.game_map):
+            game_map[pos] = deepcopy(mo, memo)
+        game = Game.__new__(Game)
+        memo[id(self)] = game
+        for k, v in self.__dict__.items():
+            setattr(game, k, deepcopy(v, memo))
+        return game
+
     def __str__(self):
         s: str = ''
         for j in range(self.h):
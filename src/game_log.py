@@ -0,0 +1,658 @@
+from __future__ import annotations
+
+import json
+import lzma
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Optional, IO
+
+import numpy as np
+
+import metrics
+from enums import enum_encoder
+from log_codec import FrameArrays, INFO_FIELDS
+
+
+# A frame map is a list of columns (indexed [x][y]) of the min_repr dicts of every cell
+MinMap = list[list[dict[str, Any]]]
+# a delta is a list of [x, y, cell] entries for every cell that changed since the previous frame
+MapDelta = list[list]
+
+
+def map_delta(prev_map: MinMap, new_map: MinMap) -> MapDelta:
+    """Finds every cell of new_map that differs from prev_map (both must have the same size)"""
+    delta: MapDelta = []
+    for x, (prev_col, new_col) in enumerate(zip(prev_map, new_map)):
+        if prev_col == new_col:
+            continue  # most columns don't change at all, so this saves us a lot of time
+        for y, (prev_cell, new_cell) in enumerate(zip(prev_col, new_col)):
+            if prev_cell != new_cell:
+                delta.append([x, y, new_cell])
+    return delta
+
+
+def apply_delta(min_map: MinMap, delta: MapDelta) -> MinMap:
+    """Returns a new map with the delta applied, min_map itself is left unchanged"""
+    new_map = [col.copy() for col in min_map]  # cells are only ever replaced, never modified, so this is enough
+    for x, y, cell in delta:
+        new_map[x][y] = cell
+    return new_map
+
+
+class LogWriter(ABC):
+    """Writes the frames of a game to a log file as they are produced, so they never need to be kept in memory
+
+    Frames are passed as FrameArrays (usually straight from FrameCapture), and only converted to dicts by the writers
+    that need them. Frames are always complete, the writer takes care of turning them into deltas if needed.
+    """
+    format: str  # the name of the format (in LOG_WRITERS)
+    binary: bool = False  # whether the log file is opened in binary mode
+    records_actions: bool = False  # if set, every frame must also have the 'actions' of both players
+    bytes_report_interval: int = 50  # how often (in frames) the bytes written are added to the metrics
+
+    def __init__(self, path: str, info: dict[str, Any], keyframe_interval: int = 0):
+        self.path: str = path
+        self.keyframe_interval: int = keyframe_interval
+        self.frame_count: int = 0
+        self._bytes_reported: int = 0
+        self._prev_map: Optional[MinMap] = None
+        self._file: IO = open(path, 'wb' if self.binary else 'w')
+        self.write_header(dict(info, keyframe_interval=keyframe_interval))
+
+    @abstractmethod
+    def write_header(self, info: dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def write_encoded_frame(self, frame: Any):
+        pass
+
+    @abstractmethod
+    def write_footer(self, info: dict[str, Any]):
+        pass
+
+    def write_frame(self, frame: FrameArrays):
+        self.write_encoded_frame(self.encode_frame(frame))
+        self.frame_count += 1
+        if self.frame_count % self.bytes_report_interval == 0:
+            self.report_bytes()
+
+    def report_bytes(self):
+        """Adds the bytes written since the last report to the metrics"""
+        written = self._file.tell()
+        metrics.LOG_BYTES.inc(written - self._bytes_reported, format=self.format)
+        self._bytes_reported = written
+
+    def encode_frame(self, frame: FrameArrays) -> Any:
+        frame = frame.to_dict()
+        min_map = frame['map']
+        if self.keyframe_interval > 0 and self.frame_count % self.keyframe_interval != 0:
+            frame['delta'] = map_delta(self._prev_map, frame.pop('map'))
+        self._prev_map = min_map
+        return frame
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self, info: dict[str, Any]):
+        """Finalizes the log, info may differ from the info the log was started with (e.g. in game_length)"""
+        self.write_footer(dict(info, keyframe_interval=self.keyframe_interval))
+        self.report_bytes()
+        self._file.close()
+
+
+class JsonLogWriter(LogWriter):
+    """Writes a single JSON document, {'frames': [...], 'info': {...}}, which can be read with a single json.load
+
+    The info block is written at the end as we only know the final info once the game is over.
+    """
+    format = 'json'
+
+    def write_header(self, info: dict[str, Any]):
+        self._file.write('{"frames": [')
+
+    def write_encoded_frame(self, frame: dict[str, Any]):
+        if self.frame_count > 0:
+            self._file.write(', ')
+        json.dump(frame, self._file)
+
+    def write_footer(self, info: dict[str, Any]):
+        self._file.write('], "info": ')
+        json.dump(info, self._file, default=enum_encoder)
+        self._file.write('}')
+
+
+class JsonLinesLogWriter(LogWriter):
+    """Writes a header record (with the info block), then one line per frame, then a footer record
+
+    Every line is written as soon as it's produced, so even if the game crashes we can read all frames so far.
+    """
+    format = 'jsonl'
+
+    def write_header(self, info: dict[str, Any]):
+        json.dump({'format': 'jsonl', 'info': info}, self._file, default=enum_encoder)
+        self._file.write('\n')
+
+    def write_encoded_frame(self, frame: dict[str, Any]):
+        json.dump(frame, self._file)
+        self._file.write('\n')
+
+    def write_footer(self, info: dict[str, Any]):
+        json.dump({'frame_count': self.frame_count, 'info': info}, self._file, default=enum_encoder)
+        self._file.write('\n')
+
+
+# the layout of a binary log is:
+#   BINARY_MAGIC, BINARY_HEADER (version, header length), header (the info block as JSON)
+#   for every frame: FRAME_LENGTH, the frame (as encoded by FrameArrays)
+#   footer (frame count and final info block as JSON), offset of every frame (as <u8), BINARY_TRAILER
+BINARY_MAGIC = b'PLOG'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<HI')
+FRAME_LENGTH = struct.Struct('<I')
+BINARY_END_MAGIC = b'PEND'
+BINARY_TRAILER = struct.Struct('<QQI4s')  # footer position, offsets position, frame count, BINARY_END_MAGIC
+
+
+class BinaryLogWriter(LogWriter):
+    """Writes every frame as typed arrays (see FrameArrays), with an offset table at the end for random access
+
+    Frames are always complete, so keyframe_interval is ignored.
+    """
+    format = 'binary'
+    binary = True
+
+    def __init__(self, path: str, info: dict[str, Any], keyframe_interval: int = 0):
+        self.offsets: list[int] = []
+        super().__init__(path, info, 0)
+
+    def write_header(self, info: dict[str, Any]):
+        header = json.dumps(info, default=enum_encoder).encode()
+        self._file.write(BINARY_MAGIC + BINARY_HEADER.pack(BINARY_VERSION, len(header)) + header)
+
+    def encode_frame(self, frame: FrameArrays) -> bytes:
+        return frame.encode()
+
+    def write_encoded_frame(self, frame: bytes):
+        self.offsets.append(self._file.tell())
+        self._file.write(FRAME_LENGTH.pack(len(frame)))
+        self._file.write(frame)
+
+    def write_footer(self, info: dict[str, Any]):
+        footer_pos = self._file.tell()
+        self._file.write(json.dumps({'frame_count': self.frame_count, 'info': info}, default=enum_encoder).encode())
+        offsets_pos = self._file.tell()
+        self._file.write(np.array(self.offsets, dtype='<u8').tobytes())
+        self._file.write(BINARY_TRAILER.pack(footer_pos, offsets_pos, self.frame_count, BINARY_END_MAGIC))
+
+
+# the layout of a compressed log is similar to that of a binary log, but with frames grouped into chunks:
+#   COMPRESSED_MAGIC, BINARY_HEADER (version, header length), header (compression, chunk_frames and info as JSON)
+#   for every chunk: CHUNK_LENGTH, the compressed chunk (chunk_frames frames as they would be in a binary log)
+#   footer (frame count and final info block as JSON), offset of every chunk (as <u8), BINARY_TRAILER
+# since every chunk is compressed separately, a single frame can be read by decompressing only its chunk
+COMPRESSED_MAGIC = b'PLGZ'
+CHUNK_LENGTH = struct.Struct('<I')
+COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 9), zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress)
+}
+
+
+class CompressedLogWriter(BinaryLogWriter):
+    """Writes binary frames in fixed-size chunks, each compressed separately, with an offset table at the end
+
+    Only complete chunks are ever written, so a flush (or a crash) will not include frames of the current chunk.
+    """
+    compression: str
+    chunk_frames: int = 32
+
+    def __init__(self, path: str, info: dict[str, Any], keyframe_interval: int = 0):
+        self._chunk: list[bytes] = []
+        self.chunk_offsets: list[int] = []
+        super().__init__(path, info, keyframe_interval)
+
+    def write_header(self, info: dict[str, Any]):
+        header = json.dumps({'compression': self.compression, 'chunk_frames': self.chunk_frames, 'info': info},
+                            default=enum_encoder).encode()
+        self._file.write(COMPRESSED_MAGIC + BINARY_HEADER.pack(BINARY_VERSION, len(header)) + header)
+
+    def write_encoded_frame(self, frame: bytes):
+        self._chunk.append(FRAME_LENGTH.pack(len(frame)))
+        self._chunk.append(frame)
+        if len(self._chunk) == 2 * self.chunk_frames:
+            self.write_chunk()
+
+    def write_chunk(self):
+        chunk = COMPRESSORS[self.compression][0](b''.join(self._chunk))
+        self.chunk_offsets.append(self._file.tell())
+        self._file.write(CHUNK_LENGTH.pack(len(chunk)))
+        self._file.write(chunk)
+        self._chunk = []
+
+    def write_footer(self, info: dict[str, Any]):
+        if len(self._chunk) > 0:
+            self.write_chunk()
+        self.offsets = self.chunk_offsets
+        super().write_footer(info)
+
+
+class ZlibLogWriter(CompressedLogWriter):
+    format = 'zlib'
+    compression = 'zlib'
+
+
+class LzmaLogWriter(CompressedLogWriter):
+    format = 'lzma'
+    compression = 'lzma'
+
+
+# the layout of an action log is:
+#   ACTIONS_MAGIC, BINARY_HEADER (version, header length), header (the info block as JSON)
+#   a zlib stream of JSON lines, one for every frame and then a footer (frame count and final info block)
+# every frame is {'a': [actions of player 1, actions of player 2]}, with 'c' (the state checksum) every few frames
+# as the game is deterministic, every frame can be rebuilt from the seed, game params and actions (see replay.py)
+ACTIONS_MAGIC = b'PACT'
+DEFAULT_CHECKSUM_INTERVAL = 20
+
+
+class ActionLogWriter(LogWriter):
+    """Writes only the actions of both players every turn, and a checksum of the state every keyframe_interval turns
+
+    The stream is flushed with Z_SYNC_FLUSH, so everything written before a flush can be read even after a crash.
+    """
+    format = 'actions'
+    binary = True
+    records_actions = True
+
+    def __init__(self, path: str, info: dict[str, Any], keyframe_interval: int = 0):
+        self._compressor = zlib.compressobj(9)
+        super().__init__(path, info, keyframe_interval if keyframe_interval > 0 else DEFAULT_CHECKSUM_INTERVAL)
+
+    def write_header(self, info: dict[str, Any]):
+        header = json.dumps(info, default=enum_encoder).encode()
+        self._file.write(ACTIONS_MAGIC + BINARY_HEADER.pack(BINARY_VERSION, len(header)) + header)
+
+    def encode_frame(self, frame: FrameArrays) -> bytes:
+        record: dict[str, Any] = {'a': frame.extra.get('actions', [[], []])}
+        if self.frame_count % self.keyframe_interval == 0:
+            record['c'] = frame.state_checksum()
+        return (json.dumps(record, separators=(',', ':')) + '\n').encode()
+
+    def write_encoded_frame(self, frame: bytes):
+        self._file.write(self._compressor.compress(frame))
+
+    def flush(self):
+        self._file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        super().flush()
+
+    def write_footer(self, info: dict[str, Any]):
+        footer = json.dumps({'frame_count': self.frame_count, 'info': info}, default=enum_encoder) + '\n'
+        self._file.write(self._compressor.compress(footer.encode()))
+        self._file.write(self._compressor.flush())
+
+
+LOG_WRITERS: dict[str, type[LogWriter]] = {
+    'json': JsonLogWriter,
+    'jsonl': JsonLinesLogWriter,
+    'binary': BinaryLogWriter,
+    'zlib': ZlibLogWriter,
+    'lzma': LzmaLogWriter,
+    'actions': ActionLogWriter
+}
+
+
+JSONL_MAGIC = '{"format": "jsonl"'  # every JSON Lines log starts with this
+
+
+class GameLog(ABC):
+    """A game log that can be read one frame at a time, whatever format it was written in"""
+    info: dict[str, Any]
+
+    @staticmethod
+    def load(path: str) -> GameLog:
+        with open(path, 'rb') as f:
+            start = f.read(len(JSONL_MAGIC))
+        if start.startswith(BINARY_MAGIC):
+            return BinaryGameLog(path)
+        elif start.startswith(COMPRESSED_MAGIC):
+            return CompressedGameLog(path)
+        elif start.startswith(ACTIONS_MAGIC):
+            from replay import ReplayGameLog  # replaying needs the game itself, which imports this module
+            return ReplayGameLog(path)
+        elif start == JSONL_MAGIC.encode():
+            return JsonGameLog(path, jsonl=True)
+        else:
+            return JsonGameLog(path)
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    @abstractmethod
+    def frame(self, frame_num: int) -> dict[str, Any]:
+        """Returns frame number frame_num, in the same form as it is in a JSON log without deltas"""
+        pass
+
+    def frame_arrays(self, frame_num: int) -> FrameArrays:
+        return FrameArrays.from_dict(self.frame(frame_num), self.info['map_w'], self.info['map_h'])
+
+    def frame_bytes(self, frame_num: int) -> bytes:
+        """Returns frame number frame_num encoded as by FrameArrays.encode"""
+        return self.frame_arrays(frame_num).encode()
+
+
+def index_path(log_path: str) -> str:
+    """The frame index of a JSON log is saved next to it, game_<id>.plog has its index in game_<id>.pidx"""
+    return log_path[:-len('.plog')] + '.pidx'
+
+
+def _index_jsonl(data: mmap.mmap) -> tuple[dict[str, Any], list[int], list[int]]:
+    """Finds the info block and the byte range of every frame of a JSON Lines log"""
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))  # only lines that were completely written are used
+    info = json.loads(data[starts[0]:ends[0]])['info']
+    footer = json.loads(data[starts[-1]:ends[-1]]) if len(ends) > 1 else {}
+    if 'frame_count' in footer:
+        info = footer['info']
+        starts, ends = starts[:-1], ends[:-1]
+    else:  # the log was never finalized, so the game only lasted as long as the frames we have
+        info = dict(info, game_length=len(ends) - 2)
+    return info, starts[1:].tolist(), ends[1:].tolist()
+
+
+_SEPARATORS = re.compile(r'[\s,]*')
+INDEX_WINDOW = 1 << 22  # how much of a JSON log is decoded at a time to find its frames
+
+
+def _index_json(data: mmap.mmap) -> tuple[dict[str, Any], list[int], list[int]]:
+    """Finds the info block and the byte range of every frame of a JSON log
+
+    Every frame has to be scanned once, but only a window of the log (of at least INDEX_WINDOW bytes, or the size of
+    the largest frame) is ever held in memory.
+    """
+    decoder = json.JSONDecoder()
+    frames_start = data.find(b'[', data.find(b'"frames"')) + 1
+    starts, ends = [], []
+    # the window is decoded as latin-1, which keeps character offsets equal to byte offsets
+    window, window_start, text = INDEX_WINDOW, 0, ''
+    pos = frames_start
+    while True:
+        try:
+            rel = _SEPARATORS.match(text, pos - window_start).end()
+            if text[rel] == ']':
+                pos = window_start + rel
+                break
+            _, end = decoder.raw_decode(text, rel)
+        except (IndexError, json.JSONDecodeError):
+            if window_start + len(text) >= len(data):
+                raise  # the log itself ends here
+            if pos == window_start:
+                window *= 2  # the frame is bigger than the whole window
+            window_start, text = pos, data[pos:pos + window].decode('latin-1')
+            continue
+        starts.append(window_start + rel)
+        ends.append(window_start + end)
+        pos = window_start + end
+    # the rest of the log is tiny, so we can just decode it with the frames left out
+    info = json.loads(data[:frames_start] + data[pos:])['info']
+    return info, starts, ends
+
+
+class JsonGameLog(GameLog):
+    """A JSON (or JSON Lines) game log, memory-mapped so that only the frames requested are ever decoded
+
+    The byte range of every frame is found the first time the log is opened, and saved next to it (see index_path).
+    Frames are rebuilt from keyframes and deltas as needed.
+    """
+
+    def __init__(self, path: str, jsonl: bool = False):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = self.load_index(path)
+        if index is None:
+            index = _index_jsonl(self.data) if jsonl else _index_json(self.data)
+            self.save_index(path, *index)
+        self.info: dict[str, Any] = index[0]
+        self.starts: list[int] = index[1]
+        self.ends: list[int] = index[2]
+        self.keyframe_interval: int = self.info.get('keyframe_interval', 0)
+        # the last frame rebuilt, as playback is (almost always) sequential this makes it cheap to find the next one
+        self._last: Optional[tuple[int, MinMap]] = None
+        self._lock = threading.Lock()  # the server reads logs from several threads, which would race on self._last
+
+    @staticmethod
+    def load_index(path: str) -> Optional[tuple[dict[str, Any], list[int], list[int]]]:
+        """Loads the saved index of a log, if there is one and the log hasn't changed since it was made"""
+        try:
+            with np.load(index_path(path)) as index:
+                stat = os.stat(path)
+                if index['log_size'] != stat.st_size or index['log_mtime'] != stat.st_mtime_ns:
+                    return None  # the game was still being played when the index was made
+                return json.loads(index['info'].tobytes()), index['starts'].tolist(), index['ends'].tolist()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def save_index(path: str, info: dict[str, Any], starts: list[int], ends: list[int]):
+        stat = os.stat(path)
+        tmp_path = index_path(path) + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, starts=np.array(starts, dtype=np.int64), ends=np.array(ends, dtype=np.int64),
+                         info=np.frombuffer(json.dumps(info).encode(), dtype=np.uint8),
+                         log_size=stat.st_size, log_mtime=stat.st_mtime_ns)
+            os.replace(tmp_path, index_path(path))  # other processes must never see a partly written index
+        except OSError:
+            pass  # the index only saves time, so we can do without it if the log directory isn't writable
+
+    def __len__(self):
+        return len(self.starts)
+
+    def raw_frame(self, frame_num: int) -> dict[str, Any]:
+        """Decodes frame number frame_num exactly as it is in the log (so it may be a delta)"""
+        return json.loads(self.data[self.starts[frame_num]:self.ends[frame_num]])
+
+    def frame(self, frame_num: int) -> dict[str, Any]:
+        frame = self.raw_frame(frame_num)
+        if 'delta' not in frame:
+            return frame  # this is a keyframe (or the log has no deltas at all)
+        frame['map'] = self.min_map(frame_num, frame['delta'])
+        frame.pop('delta')
+        return frame
+
+    def min_map(self, frame_num: int, delta: MapDelta) -> MinMap:
+        """Rebuilds the map of a delta frame, given its delta"""
+        with self._lock:
+            return self._min_map(frame_num, delta)
+
+    def _min_map(self, frame_num: int, delta: MapDelta) -> MinMap:
+        if self._last is not None and self._last[0] < frame_num and \
+                frame_num - self._last[0] <= frame_num % self.keyframe_interval:
+            start, min_map = self._last  # we can continue on from the last frame we rebuilt
+        else:
+            start = frame_num - frame_num % self.keyframe_interval
+            min_map = self.raw_frame(start)['map']
+        for n in range(start + 1, frame_num):
+            min_map = apply_delta(min_map, self.raw_frame(n)['delta'])
+        min_map = apply_delta(min_map, delta)
+        self._last = (frame_num, min_map)
+        return min_map
+
+
+class BinaryGameLog(GameLog):
+    """A binary game log, memory-mapped so that frames are only read and decoded when they are requested"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        version, header_len = BINARY_HEADER.unpack_from(self.data, len(BINARY_MAGIC))
+        if version > BINARY_VERSION:
+            raise ValueError(f"Unsupported binary log version {version} (latest supported is {BINARY_VERSION})")
+        pos = len(BINARY_MAGIC) + BINARY_HEADER.size
+        self.info: dict[str, Any] = json.loads(self.data[pos:pos + header_len])
+        frames_start = pos + header_len
+        self.w: int = self.info['map_w']
+        self.h: int = self.info['map_h']
+
+        if self.data[-len(BINARY_END_MAGIC):] == BINARY_END_MAGIC:
+            footer_pos, offsets_pos, frame_count, _ = BINARY_TRAILER.unpack_from(self.data,
+                                                                                 len(self.data) - BINARY_TRAILER.size)
+            self.info = json.loads(self.data[footer_pos:offsets_pos])['info']
+            self.offsets: list[int] = np.frombuffer(self.data, dtype='<u8', count=frame_count,
+                                                    offset=offsets_pos).tolist()
+        else:  # the log was never finalized, so we find all frames that were completely written
+            self.offsets = []
+            pos = frames_start
+            while pos + FRAME_LENGTH.size <= len(self.data):
+                length, = FRAME_LENGTH.unpack_from(self.data, pos)
+                if pos + FRAME_LENGTH.size + length > len(self.data):
+                    break
+                self.offsets.append(pos)
+                pos += FRAME_LENGTH.size + length
+            self.info = dict(self.info, game_length=len(self.offsets) - 1)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def frame_arrays(self, frame_num: int) -> FrameArrays:
+        pos = self.offsets[frame_num]
+        length, = FRAME_LENGTH.unpack_from(self.data, pos)
+        pos += FRAME_LENGTH.size
+        return FrameArrays.decode(memoryview(self.data)[pos:pos + length], self.w, self.h)
+
+    def frame_bytes(self, frame_num: int) -> bytes:
+        pos = self.offsets[frame_num]
+        length, = FRAME_LENGTH.unpack_from(self.data, pos)
+        pos += FRAME_LENGTH.size
+        return self.data[pos:pos + length]
+
+    def frame(self, frame_num: int) -> dict[str, Any]:
+        return self.frame_arrays(frame_num).to_dict()
+
+
+class CompressedGameLog(GameLog):
+    """A compressed game log, memory-mapped so that only the chunk containing the requested frame is read"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        version, header_len = BINARY_HEADER.unpack_from(self.data, len(COMPRESSED_MAGIC))
+        if version > BINARY_VERSION:
+            raise ValueError(f"Unsupported compressed log version {version} (latest supported is {BINARY_VERSION})")
+        pos = len(COMPRESSED_MAGIC) + BINARY_HEADER.size
+        header = json.loads(self.data[pos:pos + header_len])
+        self.decompress = COMPRESSORS[header['compression']][1]
+        self.chunk_frames: int = header['chunk_frames']
+        self.info: dict[str, Any] = header['info']
+        chunks_start = pos + header_len
+        self.w: int = self.info['map_w']
+        self.h: int = self.info['map_h']
+        self._chunk: Optional[tuple[int, bytes, list[int]]] = None  # the last chunk decompressed
+
+        if self.data[-len(BINARY_END_MAGIC):] == BINARY_END_MAGIC:
+            footer_pos, offsets_pos, self.frame_count, _ = BINARY_TRAILER.unpack_from(self.data, len(self.data) -
+                                                                                      BINARY_TRAILER.size)
+            self.info = json.loads(self.data[footer_pos:offsets_pos])['info']
+            num_chunks = (self.frame_count + self.chunk_frames - 1) // self.chunk_frames
+            self.chunk_offsets: list[int] = np.frombuffer(self.data, dtype='<u8', count=num_chunks,
+                                                          offset=offsets_pos).tolist()
+        else:  # the log was never finalized, so we use all chunks that were completely written
+            self.chunk_offsets = []
+            pos = chunks_start
+            while pos + CHUNK_LENGTH.size <= len(self.data):
+                length, = CHUNK_LENGTH.unpack_from(self.data, pos)
+                if pos + CHUNK_LENGTH.size + length > len(self.data):
+                    break
+                self.chunk_offsets.append(pos)
+                pos += CHUNK_LENGTH.size + length
+            self.frame_count = len(self.chunk_offsets) * self.chunk_frames  # only complete chunks are ever written
+            self.info = dict(self.info, game_length=self.frame_count - 1)
+
+    def __len__(self):
+        return self.frame_count
+
+    def chunk(self, chunk_num: int) -> tuple[bytes, list[int]]:
+        """Decompresses a chunk, returning the data and the offset of every frame in it"""
+        if self._chunk is not None and self._chunk[0] == chunk_num:
+            return self._chunk[1], self._chunk[2]
+        pos = self.chunk_offsets[chunk_num]
+        length, = CHUNK_LENGTH.unpack_from(self.data, pos)
+        pos += CHUNK_LENGTH.size
+        data = self.decompress(self.data[pos:pos + length])
+        offsets = []
+        pos = 0
+        while pos < len(data):
+            offsets.append(pos)
+            pos += FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(data, pos)[0]
+        self._chunk = (chunk_num, data, offsets)
+        return data, offsets
+
+    def frame_arrays(self, frame_num: int) -> FrameArrays:
+        return FrameArrays.decode(self.frame_bytes(frame_num), self.w, self.h)
+
+    def frame_bytes(self, frame_num: int) -> bytes:
+        if not 0 <= frame_num < self.frame_count:
+            raise IndexError(f"Frame {frame_num} is out of range")
+        data, offsets = self.chunk(frame_num // self.chunk_frames)
+        pos = offsets[frame_num % self.chunk_frames]
+        length, = FRAME_LENGTH.unpack_from(data, pos)
+        pos += FRAME_LENGTH.size
+        return data[pos:pos + length]
+
+    def frame(self, frame_num: int) -> dict[str, Any]:
+        return self.frame_arrays(frame_num).to_dict()
+
+
+SUMMARY_EVENTS: tuple[str, ...] = ('attacks', 'collisions', 'destroyed')
+
+
+def summary_path(log_path: str) -> str:
+    """The summary of a game is saved next to its log, game_<id>.plog has its summary in game_<id>.psum"""
+    return log_path[:-len('.plog')] + '.psum'
+
+
+class GameSummary:
+    """Timelines (one entry per frame) of the info block of both players and the number of events in every frame
+
+    These are saved as columns in an .npz file, named p1_<field> and p2_<field> for every field of the info block,
+    and attacks, collisions and destroyed for the number of events.
+    """
+
+    def __init__(self):
+        self.info: list[np.ndarray] = []
+        self.events: list[tuple[int, ...]] = []
+
+    def add(self, frame: FrameArrays):
+        self.info.append(frame.info.copy())
+        self.events.append((len(frame.attacks), len(frame.collisions), len(frame.destroyed)))
+
+    def columns(self) -> dict[str, np.ndarray]:
+        info = np.array(self.info, dtype='<i4').reshape(-1, 2, len(INFO_FIELDS))
+        events = np.array(self.events, dtype='<i4').reshape(-1, len(SUMMARY_EVENTS))
+        columns = {f'p{p + 1}_{field}': info[:, p, i] for p in range(2) for i, field in enumerate(INFO_FIELDS)
+                   if field != 'player'}
+        columns.update({event: events[:, i] for i, event in enumerate(SUMMARY_EVENTS)})
+        return columns
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:  # np.savez would add .npz to the path otherwise
+            np.savez_compressed(f, **self.columns())
+
+    @staticmethod
+    def load(path: str) -> dict[str, np.ndarray]:
+        with np.load(path) as data:
+            return {k: data[k] for k in data.files}
+
+    @staticmethod
+    def from_log(log: GameLog) -> GameSummary:
+        """Builds the summary of a game from its log (which is much slower than loading a saved summary)"""
+        summary = GameSummary()
+        for n in range(len(log)):
+            summary.add(log.frame_arrays(n))
+        return summary
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import json
+import queue
+import struct
+import threading
+import urllib.request
+from typing import Any, Optional
+
+from enums import enum_encoder
+from log_codec import FrameArrays
+
+
+DEFAULT_QUEUE_SIZE = 64
+MAX_BATCH_FRAMES = 16
+
+# every frame published is prefixed with its number and length
+LIVE_FRAME = struct.Struct('<II')
+
+
+class LivePublisher:
+    """Publishes the frames of a game to a server (see server.py) as they are produced, so that it can be watched live
+
+    Frames are sent by a background thread. If the server can't keep up, frames are dropped rather than ever slowing
+    down the game (the log is still complete, so the game can be watched in full once it is over).
+    """
+
+    def __init__(self, url: str, game_id: int, info: dict[str, Any], queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.url: str = f"{url.rstrip('/')}/live/{game_id}"
+        self.queue: queue.Queue[tuple[str, bytes]] = queue.Queue(queue_size)
+        self.dropped: int = 0  # frames dropped because the queue was full
+        self._error_shown = False
+        self.queue.put(('start', json.dumps(info, default=enum_encoder).encode()))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, frame_num: int, frame: FrameArrays):
+        blob = frame.encode()  # the frame itself will be reused, so it has to be encoded right away
+        try:
+            self.queue.put_nowait(('frames', LIVE_FRAME.pack(frame_num, len(blob)) + blob))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, info: dict[str, Any], timeout: float = 10):
+        """Tells the server the game is over, waiting (at most timeout seconds) for everything to be sent"""
+        try:
+            self.queue.put(('end', json.dumps(info, default=enum_encoder).encode()), timeout=timeout)
+        except queue.Full:
+            return  # the server must be stuck, and the game shouldn't be
+        self._thread.join(timeout)
+
+    def _run(self):
+        pending: Optional[tuple[str, bytes]] = None
+        while True:
+            endpoint, body = pending if pending is not None else self.queue.get()
+            pending = None
+            if endpoint == 'frames':  # send every frame that is already waiting along with this one
+                parts = [body]
+                while len(parts) < MAX_BATCH_FRAMES:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item[0] != 'frames':
+                        pending = item
+                        break
+                    parts.append(item[1])
+                body = b''.join(parts)
+            self._post(endpoint, body)
+            if endpoint == 'end':
+                return
+
+    def _post(self, endpoint: str, body: bytes):
+        request = urllib.request.Request(f"{self.url}/{endpoint}", data=body, method='POST',
+                                         headers={'Content-Type': 'application/octet-stream'})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        except OSError as e:
+            if not self._error_shown:  # the server may well not be running, which is fine
+                print(f"Couldn't publish game to {self.url}: {e}")
+                self._error_shown = True
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from enums import Resource, Direction
+from entities import Inventory, Entity, Ship, Miner, UnderConstruction, ResourceDeposit
+from vec2 import vec2
+
+
+# codes used for the kind of every cell and entity, these must NEVER be reordered (only appended to)
+KINDS: list[str] = ['E', Resource.ORE.value, Resource.FUEL.value, 'B', 'T', 'C', 'M', 'K']
+KIND_CODES: dict[str, int] = {k: i for i, k in enumerate(KINDS)}
+SHIP_KINDS: set[str] = {'M', 'K'}
+BUILDING_KINDS: set[str] = {'B', 'T', 'C'}
+
+DIRECTIONS: list[str] = [d.value for d in Direction]
+DIRECTION_CODES: dict[str, int] = {d: i for i, d in enumerate(DIRECTIONS)}
+NO_DIRECTION: int = DIRECTION_CODES[Direction.NONE.value]
+
+# the fields of Inventory.min_repr, in the order they are stored
+INFO_FIELDS: tuple[str, ...] = ('player', 'ore', 'fuel', 'bases', 'turrets', 'under_construction', 'miners',
+                                'fighters', 'points')
+
+# all arrays are stored little-endian, so logs can be moved between machines (and decoded by the viewer)
+CELL_COLUMNS: tuple[tuple[str, str], ...] = (('kind', '<u1'), ('owner', '<u1'), ('health', '<i4'),
+                                             ('amount', '<i4'), ('dir', '<u1'))
+ENTITY_COLUMNS: tuple[tuple[str, str], ...] = (('id', '<i4'), ('x', '<i2'), ('y', '<i2'), ('kind', '<u1'),
+                                               ('owner', '<u1'), ('health', '<i4'), ('dir', '<u1'),
+                                               ('in_building', '<u1'), ('build', '<u1'), ('progress', '<u1'),
+                                               ('cargo_len', '<u1'))
+# the keys every frame has, anything else is stored as JSON in FrameArrays.extra
+STANDARD_KEYS: set[str] = {'info', 'map', 'moves', 'collisions', 'attacks', 'destroyed'}
+
+# entity count, cargo bytes, moves, collisions, attacks, destroyed, extra bytes
+FRAME_HEADER = struct.Struct('<7I')
+
+
+class FrameArrays:
+    """A single frame of a game log stored as typed arrays (struct of arrays) rather than nested dicts
+
+    Cells are stored as (w, h) arrays of kind, owner, health, deposit amount and direction.
+    Every entity (including ships inside buildings) is also a row of the entity table, which holds everything else.
+    Any keys of the frame this class doesn't know about are stored in extra (as JSON).
+    """
+
+    def __init__(self, w: int, h: int, n_entities: int = 0):
+        self.w: int = w
+        self.h: int = h
+        self.info: npt.NDArray[np.int32] = np.zeros((2, len(INFO_FIELDS)), dtype='<i4')
+        self.cells: dict[str, npt.NDArray] = {name: np.zeros((w, h), dtype=dt) for name, dt in CELL_COLUMNS}
+        self.entities: dict[str, npt.NDArray] = {name: np.zeros(n_entities, dtype=dt) for name, dt in ENTITY_COLUMNS}
+        self.cargo: bytes = b''  # the cargo of every miner in the entity table, concatenated
+        self.moves: npt.NDArray = np.zeros((0, 2), dtype='<i4')  # (entity id, direction code)
+        self.collisions: npt.NDArray = np.zeros((0, 2), dtype='<i2')  # (x, y)
+        self.attacks: npt.NDArray = np.zeros((0, 5), dtype='<i2')  # (x1, y1, x2, y2, player)
+        self.destroyed: npt.NDArray = np.zeros((0, 2), dtype='<i2')  # (x, y)
+        self.extra: dict[str, Any] = {}
+
+    @staticmethod
+    def from_dict(frame: dict[str, Any], w: int, h: int) -> FrameArrays:
+        """Converts a frame as produced by Game.play (or as read back from a JSON log) into arrays"""
+        rows: list[tuple] = []
+        cargo: list[str] = []
+        fa = FrameArrays(w, h)
+        fa.info[:] = [[inv[f] for f in INFO_FIELDS] for inv in frame['info']]
+        kind, owner, health, amount, direction = (fa.cells[name] for name, _ in CELL_COLUMNS)
+        direction.fill(NO_DIRECTION)
+        for x, col in enumerate(frame['map']):
+            for y, cell in enumerate(col):
+                t = cell['t']
+                kind[x, y] = KIND_CODES[t]
+                if 'a' in cell:
+                    amount[x, y] = cell['a']
+                    continue
+                if t == 'E':
+                    continue
+                owner[x, y] = cell['p']
+                health[x, y] = cell['h']
+                if 'd' in cell:
+                    direction[x, y] = DIRECTION_CODES[cell['d']]
+                rows.append(FrameArrays._entity_row(cell, x, y, False, cargo))
+                for v in cell.get('v', {}).values():
+                    rows.append(FrameArrays._entity_row(v, x, y, True, cargo))
+        fa.entities = {name: np.array([r[i] for r in rows], dtype=dt) for i, (name, dt) in enumerate(ENTITY_COLUMNS)}
+        fa.cargo = ''.join(cargo).encode('ascii')
+        fa.set_events(frame['moves'], frame['collisions'], frame['attacks'], frame['destroyed'])
+        fa.extra = {k: v for k, v in frame.items() if k not in STANDARD_KEYS}
+        return fa
+
+    def set_events(self, moves: dict[str, str], collisions: list, attacks: list, destroyed: list):
+        """Sets the events of the frame, as returned by Game.step"""
+        self.moves = np.array([(int(i), DIRECTION_CODES[m]) for i, m in moves.items()], dtype='<i4').reshape(-1, 2)
+        self.collisions = np.array(collisions, dtype='<i2').reshape(-1, 2)
+        self.attacks = np.array([(*a[0], *a[1], a[2]) for a in attacks], dtype='<i2').reshape(-1, 5)
+        self.destroyed = np.array(destroyed, dtype='<i2').reshape(-1, 2)
+
+    @staticmethod
+    def _entity_row(ent: dict[str, Any], x: int, y: int, in_building: bool, cargo: list[str]) -> tuple:
+        c = ent.get('c', '')
+        cargo.append(c)
+        return (int(ent['i']), x, y, KIND_CODES[ent['t']], ent['p'], ent['h'],
+                DIRECTION_CODES[ent['d']] if 'd' in ent else NO_DIRECTION, in_building,
+                KIND_CODES[ent['b']] if 'b' in ent else 0, round(ent['m'] * 100) if 'm' in ent else 0, len(c))
+
+    def to_dict(self) -> dict[str, Any]:
+        """Converts the frame back into the same form it has in a JSON log"""
+        kinds = self.cells['kind'].tolist()
+        amounts = self.cells['amount'].tolist()
+        min_map = [[{'t': KINDS[k], 'a': a} if k in (1, 2) else {'t': 'E'} for k, a in zip(k_col, a_col)]
+                   for k_col, a_col in zip(kinds, amounts)]
+        cargo = self.cargo.decode('ascii')
+        c_start = 0
+        for ent_id, x, y, k, p, hp, d, in_building, b, m, c_len in zip(*(self.entities[name].tolist()
+                                                                          for name, _ in ENTITY_COLUMNS)):
+            t = KINDS[k]
+            ent = {'t': t, 'i': str(ent_id), 'h': hp, 'p': p}
+            if t in SHIP_KINDS:
+                ent['d'] = DIRECTIONS[d]
+            if t == 'M':
+                ent['c'] = cargo[c_start:c_start + c_len]
+                c_start += c_len
+            if t in BUILDING_KINDS:
+                ent['v'] = {}
+            if t == 'C':
+                ent['b'] = KINDS[b]
+                ent['m'] = m / 100
+            if in_building:
+                min_map[x][y]['v'][str(ent_id)] = ent
+            else:
+                min_map[x][y] = ent
+        frame = {
+            'info': [dict(zip(INFO_FIELDS, inv)) for inv in self.info.tolist()],
+            'map': min_map,
+            'moves': {str(i): DIRECTIONS[d] for i, d in self.moves.tolist()},
+            'collisions': self.collisions.tolist(),
+            'attacks': [[[x1, y1], [x2, y2], p] for x1, y1, x2, y2, p in self.attacks.tolist()],
+            'destroyed': self.destroyed.tolist()
+        }
+        frame.update(self.extra)
+        return frame
+
+    def state_checksum(self) -> int:
+        """A CRC32 of the state of the game in this frame (i.e. everything except the events and extra)"""
+        crc = zlib.crc32(self.info.tobytes())
+        for name, _ in CELL_COLUMNS:
+            crc = zlib.crc32(self.cells[name].tobytes(), crc)
+        for name, _ in ENTITY_COLUMNS:
+            crc = zlib.crc32(self.entities[name].tobytes(), crc)
+        return zlib.crc32(self.cargo, crc)
+
+    def encode(self) -> bytes:
+        extra = json.dumps(self.extra).encode() if self.extra else b''
+        parts = [FRAME_HEADER.pack(len(self.entities['id']), len(self.cargo), len(self.moves), len(self.collisions),
+                                   len(self.attacks), len(self.destroyed), len(extra)),
+                 self.info.tobytes()]
+        parts += [self.cells[name].tobytes() for name, _ in CELL_COLUMNS]
+        parts += [self.entities[name].tobytes() for name, _ in ENTITY_COLUMNS]
+        parts += [self.cargo, self.moves.tobytes(), self.collisions.tobytes(), self.attacks.tobytes(),
+                  self.destroyed.tobytes(), extra]
+        return b''.join(parts)
+
+    @staticmethod
+    def decode(data: bytes | memoryview, w: int, h: int) -> FrameArrays:
+        n_ent, n_cargo, n_moves, n_col, n_att, n_des, n_extra = FRAME_HEADER.unpack_from(data)
+        fa = FrameArrays(w, h)
+        pos = FRAME_HEADER.size
+
+        def take(dtype: str, count: int, shape: tuple[int, ...]) -> npt.NDArray:
+            nonlocal pos
+            arr = np.frombuffer(data, dtype=dtype, count=count, offset=pos).reshape(shape)
+            pos += arr.nbytes
+            return arr
+
+        fa.info = take('<i4', fa.info.size, fa.info.shape)
+        fa.cells = {name: take(dt, w * h, (w, h)) for name, dt in CELL_COLUMNS}
+        fa.entities = {name: take(dt, n_ent, (n_ent,)) for name, dt in ENTITY_COLUMNS}
+        fa.cargo = bytes(data[pos:pos + n_cargo])
+        pos += n_cargo
+        fa.moves = take('<i4', 2 * n_moves, (n_moves, 2))
+        fa.collisions = take('<i2', 2 * n_col, (n_col, 2))
+        fa.attacks = take('<i2', 5 * n_att, (n_att, 5))
+        fa.destroyed = take('<i2', 2 * n_des, (n_des, 2))
+        if n_extra > 0:
+            fa.extra = json.loads(bytes(data[pos:pos + n_extra]))
+        return fa
+
+
+
+class FrameCapture:
+    """Captures the state of a game straight into a FrameArrays, without building the min_repr of every cell
+
+    The same FrameArrays (and cell arrays) are reused for every frame, so each frame must be used (e.g. written to the
+    log) before the next one is captured.
+    """
+
+    def __init__(self, w: int, h: int):
+        self.frame: FrameArrays = FrameArrays(w, h)
+
+    def capture(self, p1_inv: Inventory, p2_inv: Inventory, deposits: dict[vec2, ResourceDeposit]) -> FrameArrays:
+        fa = self.frame
+        kind, owner, health, amount, direction = (fa.cells[name] for name, _ in CELL_COLUMNS)
+        kind.fill(0)
+        owner.fill(0)
+        health.fill(0)
+        amount.fill(0)
+        direction.fill(NO_DIRECTION)
+        if len(deposits) > 0:
+            xs, ys = np.array(list(deposits.keys()), dtype=np.intp).T
+            kind[xs, ys] = [KIND_CODES[d.resource.value] for d in deposits.values()]
+            amount[xs, ys] = [d.amount for d in deposits.values()]
+
+        rows: list[tuple] = []
+        for i, inv in enumerate((p1_inv, p2_inv)):
+            resources = inv.game_params.resources
+            points = inv.ore * resources.ore + inv.fuel * resources.fuel
+            for b in inv.buildings:
+                rows.append(self._entity_row(b, False))
+                rows += [self._entity_row(v, True) for v in b.vehicles]
+            contained = {v.id for b in inv.buildings for v in b.vehicles}
+            rows += [self._entity_row(s, False) for s in inv.ships if s.id not in contained]
+            for e in inv.entities:
+                points += e.value
+            fa.info[i] = (inv.player, inv.ore, inv.fuel, len(inv.bases), len(inv.turrets),
+                          len(inv.under_construction), len(inv.miners), len(inv.fighters), points)
+        # the entity table is in the same order as FrameArrays.from_dict would give (vehicles after their building)
+        rows.sort(key=lambda r: (r[1], r[2], r[7]))
+
+        fa.entities = {name: np.array([r[i] for r in rows], dtype=dt) for i, (name, dt) in enumerate(ENTITY_COLUMNS)}
+        fa.cargo = ''.join([r[-1] for r in rows]).encode('ascii')
+        on_map = fa.entities['in_building'] == 0
+        xs, ys = fa.entities['x'][on_map], fa.entities['y'][on_map]
+        kind[xs, ys] = fa.entities['kind'][on_map]
+        owner[xs, ys] = fa.entities['owner'][on_map]
+        health[xs, ys] = fa.entities['health'][on_map]
+        direction[xs, ys] = fa.entities['dir'][on_map]
+        fa.set_events({}, [], [], [])
+        fa.extra = {}
+        return fa
+
+    @staticmethod
+    def _entity_row(e: Entity, in_building: bool) -> tuple:
+        cargo = "".join([res.value for res in e.cargo]) if isinstance(e, Miner) else ''
+        uc = isinstance(e, UnderConstruction)
+        return (e.id, e.pos.x, e.pos.y, KIND_CODES[e.desc], e.player, e.health,
+                DIRECTION_CODES[e.dir.value] if isinstance(e, Ship) else NO_DIRECTION, in_building,
+                KIND_CODES[e.building_type.desc] if uc else 0, round(e.progress * 100) if uc else 0, len(cargo), cargo)
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import traceback
+from dataclasses import dataclass
+from functools import partial
+from itertools import combinations, count
+from time import perf_counter
+from typing import Any, Iterator, Optional
+
+import metrics
+from result_cache import CACHE_DIR
+from tournament import GameTask, GameResult, init_worker, merge_metrics, play_task
+
+
+# the score (of the first agent) of a pair of games on the same seed, one from each side, is one of these
+PAIR_SCORES: tuple[float, ...] = (0, 0.25, 0.5, 0.75, 1)
+
+
+def elo_to_score(elo: float) -> float:
+    """The expected score (1 for a win, 0.5 for a draw) of a player this much stronger than their opponent"""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_to_elo(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+@dataclass
+class SPRT:
+    """A sequential probability ratio test of H0: elo = elo0 against H1: elo = elo1
+
+    alpha and beta are the chances of accepting H1 when H0 is true and H0 when H1 is true.
+    No decision is made before min_pairs pairs, as the variance estimated from only a few of them is far too low.
+    """
+    elo0: float = 0
+    elo1: float = 20
+    alpha: float = 0.05
+    beta: float = 0.05
+    min_pairs: int = 8
+
+    @property
+    def bounds(self) -> tuple[float, float]:
+        return math.log(self.beta / (1 - self.alpha)), math.log((1 - self.beta) / self.alpha)
+
+
+class Match:
+    """A match between two agents, played as pairs of games on the same seed (one from each side)
+
+    The results of the pairs are counted in a pentanomial model (how many pairs the first agent scored 0, 1/4, ... 1
+    in), which accounts for the seeds themselves favouring one of the agents, unlike counting the games on their own.
+    """
+
+    def __init__(self, agent_a: str, agent_b: str, preset: str = 'default', sprt: SPRT = SPRT(), first_seed: int = 0):
+        self.agent_a: str = agent_a
+        self.agent_b: str = agent_b
+        self.preset: str = preset
+        self.sprt: SPRT = sprt
+        self.seeds: Iterator[int] = count(first_seed)
+        self.pentanomial: list[int] = [0] * len(PAIR_SCORES)
+        self.pending: dict[int, list[GameResult]] = {}  # the games played so far of pairs not yet complete
+        self.games_scheduled: int = 0
+        self.errors: int = 0  # pairs thrown away because a game crashed
+        self.decision: Optional[str] = None  # 'H0' or 'H1' once the test is over
+
+    @property
+    def pairs(self) -> int:
+        return sum(self.pentanomial)
+
+    def next_pair(self) -> tuple[GameTask, GameTask]:
+        seed = next(self.seeds)
+        self.pending[seed] = []
+        self.games_scheduled += 2
+        return (GameTask(seed, self.preset, self.agent_a, self.agent_b),
+                GameTask(seed, self.preset, self.agent_b, self.agent_a))
+
+    def add_result(self, result: GameResult):
+        games = self.pending[result.task.seed]
+        games.append(result)
+        if len(games) < 2:
+            return
+        del self.pending[result.task.seed]
+        if any(r.error is not None for r in games):
+            self.errors += 1
+            return
+        score = 0  # in half points, so that it can be used as the index in the pentanomial
+        for r in games:
+            side = 1 if r.task.player_1 == self.agent_a else 2
+            score += 2 if r.winner == side else 1 if r.winner == 0 else 0
+        self.pentanomial[score] += 1
+        if self.decision is None and self.pairs >= self.sprt.min_pairs:
+            lower, upper = self.sprt.bounds
+            llr = self.llr()
+            self.decision = 'H1' if llr >= upper else 'H0' if llr <= lower else None
+
+    def stats(self) -> tuple[float, float]:
+        """The mean and variance of the score of a pair"""
+        # outcomes not seen yet get a tiny count, otherwise the variance is 0 after a few identical pairs
+        counts = [n or 1e-3 for n in self.pentanomial]
+        total = sum(counts)
+        mean = sum(n * s for n, s in zip(counts, PAIR_SCORES)) / total
+        var = sum(n * (s - mean) ** 2 for n, s in zip(counts, PAIR_SCORES)) / total
+        return mean, var
+
+    def llr(self) -> float:
+        """The log-likelihood ratio of H1 to H0, using the normal approximation of the pentanomial model"""
+        if self.pairs == 0:
+            return 0
+        mean, var = self.stats()
+        s0, s1 = elo_to_score(self.sprt.elo0), elo_to_score(self.sprt.elo1)
+        return self.pairs * (s1 - s0) * (2 * mean - s0 - s1) / (2 * var)
+
+    def elo(self) -> tuple[float, float, float]:
+        """The estimated Elo difference (of agent_a over agent_b), with its 95% confidence interval"""
+        if self.pairs == 0:
+            return 0, -math.inf, math.inf
+        mean, var = self.stats()
+        margin = 1.96 * math.sqrt(var / self.pairs)
+        return score_to_elo(mean), score_to_elo(mean - margin), score_to_elo(mean + margin)
+
+    def summary(self) -> dict[str, Any]:
+        elo, low, high = self.elo()
+        return {'agent_a': self.agent_a, 'agent_b': self.agent_b, 'preset': self.preset, 'pairs': self.pairs,
+                'pentanomial': self.pentanomial, 'errors': self.errors, 'elo': elo, 'elo_95': [low, high],
+                'llr': self.llr(), 'llr_bounds': list(self.sprt.bounds), 'decision': self.decision}
+
+    def __str__(self):
+        elo, low, high = self.elo()
+        lower, upper = self.sprt.bounds
+        return (f"[{self.preset}] {self.agent_a} vs {self.agent_b}: {self.pairs} pairs {self.pentanomial}, "
+                f"elo {elo:+.1f} [{low:+.1f}, {high:+.1f}], LLR {self.llr():.2f} ({lower:.2f}, {upper:.2f})"
+                + (f", {self.errors} crashed" if self.errors else "")
+                + (f" -> {self.decision}" if self.decision else ""))
+
+
+def crashed(task: GameTask, error: BaseException) -> GameResult:
+    return GameResult(task, error=''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+
+
+def run_matches(matches: list[Match], workers: Optional[int] = None, max_games: Optional[int] = None,
+                cache_dir: Optional[str] = CACHE_DIR) -> int:
+    """Plays the matches on a pool of workers until every test reaches a decision (or max_games have been played)
+
+    Pairs are always scheduled for the undecided match with the fewest games so far, so matches that are decided
+    quickly leave the rest of the budget to the close ones. Games already in the ResultCache in cache_dir (unless it
+    is None) aren't played again, but still count towards max_games. Returns the number of games played.
+    """
+    workers = workers or os.cpu_count()
+    agents = list(dict.fromkeys(a for m in matches for a in (m.agent_a, m.agent_b)))
+    presets = list(dict.fromkeys(m.preset for m in matches))
+    done: queue.Queue[tuple[Match, GameResult]] = queue.Queue()
+    scheduled = played = 0
+    with multiprocessing.Pool(workers, partial(init_worker, metrics_enabled=metrics.enabled),
+                              (agents, presets, cache_dir)) as pool:
+        while True:
+            # keep every worker busy, with a game waiting for each
+            while scheduled - played < 2 * workers and (max_games is None or scheduled + 2 <= max_games):
+                undecided = [m for m in matches if m.decision is None]
+                if not undecided:
+                    break
+                match = min(undecided, key=lambda m: m.games_scheduled)
+                for task in match.next_pair():
+                    # anything play_task lets through (e.g. failing to pickle the result) still has to count as a game
+                    pool.apply_async(play_task, (task,), callback=lambda r, m=match: done.put((m, r)),
+                                     error_callback=lambda e, m=match, t=task: done.put((m, crashed(t, e))))
+                scheduled += 2
+            if scheduled == played or all(m.decision is not None for m in matches):
+                break  # any games still running are no longer needed, and are stopped along with the pool
+            match, result = done.get()
+            merge_metrics(result)
+            played += 1
+            if result.error is not None:
+                print(f"Game {result.task} crashed:\n{result.error}")
+            decided = match.decision is not None
+            match.add_result(result)
+            if match.decision is not None and not decided:
+                print(match)
+    return played
+
+
+def run_match(agent_a: str, agent_b: str, preset: str = 'default', sprt: SPRT = SPRT(), first_seed: int = 0,
+              workers: Optional[int] = None, max_games: Optional[int] = None,
+              cache_dir: Optional[str] = CACHE_DIR) -> Match:
+    match = Match(agent_a, agent_b, preset, sprt, first_seed)
+    run_matches([match], workers, max_games, cache_dir)
+    return match
+
+
+def round_robin(agents: list[str], preset: str = 'default', sprt: SPRT = SPRT(), first_seed: int = 0,
+                workers: Optional[int] = None, max_games: Optional[int] = None,
+                cache_dir: Optional[str] = CACHE_DIR) -> list[Match]:
+    """Tests every pair of agents, sharing the pool (and the budget of max_games) between all the matches"""
+    matches = [Match(a, b, preset, sprt, first_seed) for a, b in combinations(dict.fromkeys(agents), 2)]
+    run_matches(matches, workers, max_games, cache_dir)
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares agents with a sequential probability ratio test, playing "
+                                                 "only as many games as needed to reach a decision")
+    parser.add_argument('agents', nargs='+', help="agent classes, as module:Class (every pair of them is tested)")
+    parser.add_argument('--elo0', type=float, default=SPRT.elo0, help="the Elo difference of H0")
+    parser.add_argument('--elo1', type=float, default=SPRT.elo1, help="the Elo difference of H1")
+    parser.add_argument('--alpha', type=float, default=SPRT.alpha)
+    parser.add_argument('--beta', type=float, default=SPRT.beta)
+    parser.add_argument('--min-pairs', type=int, default=SPRT.min_pairs)
+    parser.add_argument('--preset', default='default', help="the GameParams preset (see tournament.py)")
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--max-games', type=int, default=None, help="the most games to play over all matches")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--out', default=None, help="where to save the results (as JSON)")
+    parser.add_argument('--cache', default=CACHE_DIR, help="the directory of the cache of game results")
+    parser.add_argument('--no-cache', action='store_true', help="play every game, even if its result is cached")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve the metrics of every game (see metrics.py) on this port while the games are played")
+    args = parser.parse_args()
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+
+    start = perf_counter()
+    sprt = SPRT(args.elo0, args.elo1, args.alpha, args.beta, args.min_pairs)
+    matches = round_robin(args.agents, args.preset, sprt, args.first_seed, args.workers, args.max_games,
+                          None if args.no_cache else args.cache)
+    print(f"Finished in {perf_counter() - start:.1f}s")
+    for m in matches:
+        print(m)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump([m.summary() for m in matches], f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+import numpy as np
+
+
+# the content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS: tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                                      0.5, 1, 2.5, 5, 10)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Metric(ABC):
+    """A metric, which may have labels (every combination of label values is tracked separately)"""
+    kind: str
+    values: dict
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name: str = name
+        self.doc: str = doc
+        self.labels: tuple[str, ...] = labels
+        self._lock = threading.Lock()
+
+    def key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """The lines of the metric in the Prometheus text format"""
+        pass
+
+    def drain(self) -> dict:
+        """Takes the values of the metric (by label values) so far, leaving it empty"""
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+    @abstractmethod
+    def merge(self, values: dict):
+        """Adds values taken (with drain) from the same metric in another process"""
+        pass
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, doc, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values: dict[tuple[str, ...], float]):
+        with self._lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[self.key(labels)] = value
+
+    def merge(self, values: dict[tuple[str, ...], float]):
+        with self._lock:
+            self.values.update(values)  # the latest value wins
+
+
+class Histogram(Metric):
+    """A histogram, percentiles can be estimated from it (e.g. with histogram_quantile in Prometheus)"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets: tuple[float, ...] = buckets
+        self.values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}  # (bucket counts, [sum])
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self._lock:
+            if key not in self.values:
+                self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self.values[key]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def merge(self, values: dict[tuple[str, ...], tuple[list[int], list[float]]]):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                if key not in self.values:
+                    self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+                own_counts, own_total = self.values[key]
+                for i, count in enumerate(counts):
+                    own_counts[i] += count
+                own_total[0] += total[0]
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound))
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total[0]}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """All the metrics of a process
+
+    Processes that play games for another (like the workers of tournament.py) drain their registry after every game
+    and send the values back, for the other process to merge into its own, so that they can all be exported from it.
+    """
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for m in self.metrics for line in m.render()) + '\n'
+
+    def drain(self) -> dict[str, dict]:
+        """Takes the values of every metric (by name) that has any, see Metric.drain"""
+        return {m.name: values for m in self.metrics if (values := m.drain())}
+
+    def merge(self, values: dict[str, dict]):
+        by_name = {m.name: m for m in self.metrics}
+        for name, metric_values in values.items():
+            by_name[name].merge(metric_values)
+
+
+REGISTRY = Registry()
+
+GAMES_COMPLETED: Counter = REGISTRY.add(Counter('pandora_games_completed_total', "Games played to the end"))
+TURNS: Counter = REGISTRY.add(Counter('pandora_turns_total', "Turns played (the rate of this is turns per second)"))
+GAME_TURNS_PER_SECOND: Gauge = REGISTRY.add(Gauge('pandora_last_game_turns_per_second',
+                                                  "Turns per second of the last game completed"))
+STEP_PHASE_SECONDS: Histogram = REGISTRY.add(Histogram('pandora_step_phase_seconds',
+                                                       "Time taken by each phase of Game.step", ('phase',)))
+AGENT_MOVE_SECONDS: Histogram = REGISTRY.add(Histogram('pandora_agent_move_seconds',
+                                                       "Time taken by Agent.move", ('player',)))
+LOG_BYTES: Counter = REGISTRY.add(Counter('pandora_log_bytes_written_total', "Bytes of game logs written",
+                                          ('format',)))
+CACHE_REQUESTS: Counter = REGISTRY.add(Counter('pandora_cache_requests_total', "Lookups in caches, by result",
+                                               ('cache', 'result')))
+
+# timings are only taken while metrics are being collected (see enable) or for games that record them (see step_timer)
+# everything else is always counted
+enabled: bool = False
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+class StepTimer:
+    """Times the phases of a single Game.step, every call records the time since the previous one
+
+    The times (in seconds) are kept in times, by phase or by agent ('move_1' and 'move_2'), and are also added to the
+    metrics if observe is set.
+    """
+
+    def __init__(self, observe: bool = True):
+        self.observe: bool = observe
+        self.times: dict[str, float] = {}
+        self.last: float = perf_counter()
+
+    def lap(self) -> float:
+        now = perf_counter()
+        elapsed, self.last = now - self.last, now
+        return elapsed
+
+    def phase(self, name: str):
+        elapsed = self.times[name] = self.lap()
+        if self.observe:
+            STEP_PHASE_SECONDS.observe(elapsed, phase=name)
+
+    def agent(self, player: int):
+        elapsed = self.times[f"move_{player}"] = self.lap()
+        if self.observe:
+            AGENT_MOVE_SECONDS.observe(elapsed, player=player)
+
+
+class NullStepTimer(StepTimer):
+    """Used when nothing needs the times, so that timing a step costs no more than a few empty calls"""
+
+    def __init__(self):
+        super().__init__(observe=False)
+
+    def phase(self, name: str):
+        pass
+
+    def agent(self, player: int):
+        pass
+
+
+NULL_STEP_TIMER = NullStepTimer()
+
+
+def step_timer(record: bool = False) -> StepTimer:
+    """A timer for a step, which only takes any times if metrics are enabled or the caller needs them (record)"""
+    return StepTimer(enabled) if enabled or record else NULL_STEP_TIMER
+
+
+class TimingStats:
+    """Collects the times of every step of a game (see StepTimer.times), to summarise them once the game is over"""
+
+    def __init__(self):
+        self.times: dict[str, list[float]] = {}
+
+    def add(self, times: dict[str, float]):
+        for name, elapsed in times.items():
+            self.times.setdefault(name, []).append(elapsed)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """The total, mean, median, 95th percentile and max of every time, in seconds
+
+        'engine' and 'agents' are the totals of all the phases and of both agents' moves, so they can be compared.
+        """
+        summary = {}
+        for name, times in self.times.items():
+            p50, p95 = np.percentile(times, [50, 95]).tolist()
+            summary[name] = {'total': sum(times), 'mean': sum(times) / len(times), 'p50': p50, 'p95': p95,
+                             'max': max(times)}
+        summary['engine'] = {'total': sum(sum(t) for n, t in self.times.items() if not n.startswith('move_'))}
+        summary['agents'] = {'total': sum(sum(t) for n, t in self.times.items() if n.startswith('move_'))}
+        return summary
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would otherwise flood the output of the games
+
+
+def serve(port: int = 9100, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serves the metrics (at any path) from a background thread, for runs that don't have server.py running"""
+    enable()
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+# these are kept apart from game.py so that anything that only reads results (like the catalogue) doesn't need the
+# engine itself
+@dataclass
+class GameOutcome:
+    """How a game ended, which is all Game.run gives"""
+    winner: int  # 1 or 2, or 0 if it was a draw
+    points: tuple[int, int]
+    turns: int
+    timings: Optional[dict[str, dict[str, float]]] = None  # the summary of Game.timings, if they were recorded
+
+
+def winner(points: tuple[int, int]) -> int:
+    """The player with the most points at the end of the game, or 0 if it was a draw"""
+    return 1 if points[0] > points[1] else 2 if points[1] > points[0] else 0
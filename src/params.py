@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from typing import overload
+from dataclasses import dataclass, field, fields, is_dataclass
+from typing import Any, overload, get_type_hints
 
 import entities
 from enums import Resource
@@ -209,6 +209,26 @@ class GameParams:
         }
         return type_to_info[entity_type]
 
+    @staticmethod
+    def from_dict(d: dict[str, Any]) -> GameParams:
+        """Recreates GameParams from asdict(GameParams), as stored in the game logs"""
+        return _from_dict(GameParams, d)
+
+
+def _from_dict(cls: type, d: dict[str, Any]) -> Any:
+    hints = get_type_hints(cls)
+    kwargs = {}
+    for f in fields(cls):
+        if f.name not in d:
+            continue  # just use the default
+        value = d[f.name]
+        if is_dataclass(hints[f.name]):
+            value = _from_dict(hints[f.name], value)
+        elif hints[f.name] is Resource and not isinstance(value, Resource):
+            value = Resource[value] if value in Resource.__members__ else Resource(value)  # logs store the name
+        kwargs[f.name] = value
+    return cls(**kwargs)
+
 
 @dataclass
 class TimeLimits:
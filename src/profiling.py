@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import argparse
+import cProfile
+import pstats
+import sys
+import threading
+from abc import ABC, abstractmethod
+from time import perf_counter, sleep
+from types import FrameType
+from typing import Optional
+
+
+# the key of a function in pstats: (file, first line, name)
+FunctionKey = tuple[str, int, str]
+
+# the moves themselves in sampled profiles, named as pstats names built-in functions, which calls whatever the agent
+# does (so that a profile is never empty, as pstats can't load those)
+MOVES: FunctionKey = ('~', 0, '<moves>')
+
+
+class AgentProfiler(ABC):
+    """Profiles the moves of an agent, every move is made inside `with profiler:`
+
+    Whatever the profiler, its stats are in the format of pstats (so they can be loaded, sorted, printed and added
+    together with pstats.Stats), and are saved with save.
+    """
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+    @abstractmethod
+    def stats(self) -> pstats.Stats:
+        pass
+
+    def save(self, path: str):
+        self.stats().dump_stats(path)
+
+    def close(self):
+        """Stops the profiler, nothing else is profiled after this"""
+        pass
+
+
+class NullProfiler(AgentProfiler):
+    """Used when agents aren't profiled, so that a move costs no more than an empty with"""
+
+    def stats(self) -> pstats.Stats:
+        return pstats.Stats()  # no stats at all
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class CProfiler(AgentProfiler):
+    """A deterministic profiler (cProfile), which times every call but slows the agent down quite a bit"""
+
+    def __init__(self):
+        self.profile: cProfile.Profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+
+    def stats(self) -> pstats.Stats:
+        return pstats.Stats(self.profile)
+
+
+class SamplingProfiler(AgentProfiler):
+    """A sampling profiler, which looks at what the agent is doing every interval seconds from another thread
+
+    It hardly slows the agent down, but only sees what it was doing at each sample, so the times are estimates (the
+    time since the last sample is charged to the function running) and the call counts are the number of samples.
+    Only the moves themselves (MOVES) are timed exactly, along with how many there were.
+    During a move, the thread switch interval (see sys.setswitchinterval) is lowered to a fraction of interval, as
+    otherwise the sampling thread rarely gets to run while the agent is busy, and only sees where it happens to wait.
+    Between moves the sampling thread just waits for the next one, until the profiler is closed.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval: float = interval
+        # pstats' format: {function: (calls, primitive calls, own time, total time, {caller: (same, per caller)})}
+        self.samples: dict[FunctionKey, list] = {}
+        self.thread_id: Optional[int] = None
+        self.caller: Optional[FrameType] = None  # the frame that called the move, which isn't part of the stack
+        self.active_since: float = 0
+        self.moves: int = 0
+        self.move_time: float = 0
+        self.running: bool = True
+        self.active: threading.Event = threading.Event()  # set during a move
+        self.sampler: Optional[threading.Thread] = None
+        self.switch_interval: float = 0  # what it was before the move
+
+    def __enter__(self):
+        if not self.running:
+            return
+        self.thread_id = threading.get_ident()
+        if self.sampler is None:
+            self.sampler = threading.Thread(target=self.run, name='agent-sampler', daemon=True)
+            self.sampler.start()
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval / 10))
+        self.active_since = perf_counter()
+        self.caller = sys._getframe(1)
+        self.active.set()
+
+    def __exit__(self, *exc):
+        if self.caller is None:
+            return  # the profiler was closed
+        self.active.clear()
+        self.caller = None
+        sys.setswitchinterval(self.switch_interval)
+        self.moves += 1
+        self.move_time += perf_counter() - self.active_since
+
+    def run(self):
+        last = perf_counter()
+        while self.running:
+            if not self.active.is_set():
+                self.active.wait()
+                last = perf_counter()
+                continue
+            sleep(self.interval)
+            now = perf_counter()
+            caller = self.caller
+            if caller is not None:
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    self.add_sample(frame, caller, now - max(last, self.active_since))
+            last = now
+
+    def add_sample(self, frame: FrameType, caller: FrameType, elapsed: float):
+        stack: list[FunctionKey] = []  # innermost first
+        while frame is not None and frame is not caller:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        if frame is None or not stack or stack[0][0] == __file__:
+            return  # the move was over (or not yet started) by the time the sample was taken
+        stack.append(MOVES)
+        seen = set()
+        for i, key in enumerate(stack[:-1]):
+            entry = self.samples.setdefault(key, [0, 0, 0.0, 0.0, {}])
+            if i == 0:
+                entry[2] += elapsed
+            if key not in seen:  # recursive functions are only counted once per sample
+                seen.add(key)
+                entry[0] += 1
+                entry[1] += 1
+                entry[3] += elapsed
+            by_caller = entry[4].setdefault(stack[i + 1], [0, 0, 0.0, 0.0])
+            by_caller[0] += 1
+            by_caller[1] += 1
+            by_caller[2] += elapsed if i == 0 else 0
+            by_caller[3] += elapsed
+
+    def stats(self) -> pstats.Stats:
+        """The stats so far, which should only be taken once the profiler is closed (samples are added by its thread)"""
+        stats = {key: (nc, cc, tt, ct, {c: tuple(v) for c, v in callers.items()})
+                 for key, (nc, cc, tt, ct, callers) in self.samples.items()}
+        stats[MOVES] = (self.moves, self.moves, 0.0, self.move_time, {})
+        return pstats.Stats(SampledStats(stats))
+
+    def close(self):
+        self.running = False
+        self.active.set()  # so that the sampling thread sees it should stop
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+
+
+class SampledStats:
+    """pstats.Stats loads the stats of anything with create_stats and stats, like cProfile.Profile"""
+
+    def __init__(self, stats: dict[FunctionKey, tuple]):
+        self.stats: dict[FunctionKey, tuple] = stats
+
+    def create_stats(self):
+        pass
+
+
+PROFILERS: dict[str, type[AgentProfiler]] = {
+    'cprofile': CProfiler,
+    'sampling': SamplingProfiler,
+}
+
+
+def profile_path(log_path: str, player: int) -> str:
+    """The profile of an agent is saved next to the log, game_<id>.plog has the profile of player 1 in
+    game_<id>.p1.prof"""
+    return log_path[:-len('.plog')] + f".p{player}.prof"
+
+
+def aggregate(paths: list[str]) -> pstats.Stats:
+    """The stats of many profiles (of any profiler) added together"""
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adds up the profiles of agents (saved by Game or tournament.py) "
+                                                 "and shows where they spend their time")
+    parser.add_argument('profiles', nargs='+', help="the .prof files to add up")
+    parser.add_argument('--sort', default='tottime', help="the pstats sort key (default: tottime)")
+    parser.add_argument('--limit', type=int, default=30, help="how many functions to show")
+    parser.add_argument('--callers', default=None, metavar='FUNCTION',
+                        help="show what calls the functions matching this (e.g. space_time_astar)")
+    parser.add_argument('--out', default=None, help="where to save the added up profile")
+    args = parser.parse_args()
+
+    stats = aggregate(args.profiles)
+    if args.out is not None:
+        stats.dump_stats(args.out)
+    stats.strip_dirs().sort_stats(args.sort)
+    if args.callers is not None:
+        stats.print_callers(args.callers)
+    else:
+        stats.print_stats(args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import threading
+import zlib
+from copy import deepcopy
+from functools import partial
+from typing import Any, Optional
+
+import numpy.typing as npt
+
+from action import Action
+from agent import Agent
+from entities import Inventory
+from game import Game
+from game_log import GameLog, ACTIONS_MAGIC, BINARY_HEADER, BINARY_VERSION
+from params import GameParams, TimeLimits
+
+
+class ReplayDesyncError(Exception):
+    """Raised when a replayed game does not match the checksums recorded when it was originally played"""
+    pass
+
+
+class ReplayAgent(Agent):
+    """An agent that simply repeats the actions recorded in an action log"""
+
+    def __init__(self, player: int, *, actions: list[list[list[list[Any]]]], **kwargs):
+        super().__init__(player)
+        self.actions = actions  # for every frame, the actions of both players (as given by Action.min_repr)
+
+    def move(self, move_num: int, game_map: npt.NDArray[object], p1_inv: Inventory, p2_inv: Inventory) -> list[Action]:
+        entities = {e.id: e for e in p1_inv.entities + p2_inv.entities}
+        # an agent can hold on to an entity that no longer exists, but such actions can't do anything anyway
+        return [Action.from_min_repr(entities[r[0]], r) for r in self.actions[move_num - 1][self.player - 1]
+                if r[0] in entities]
+
+    def __deepcopy__(self, memo):
+        return self  # the recorded actions never change, so snapshots of a game can share the agent
+
+
+class ReplayGameLog(GameLog):
+    """An action log, every frame is rebuilt by replaying the game from the nearest snapshot
+
+    A snapshot of the game is kept every keyframe_interval frames, as they are reached.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            data = f.read()
+        version, header_len = BINARY_HEADER.unpack_from(data, len(ACTIONS_MAGIC))
+        if version > BINARY_VERSION:
+            raise ValueError(f"Unsupported action log version {version} (latest supported is {BINARY_VERSION})")
+        pos = len(ACTIONS_MAGIC) + BINARY_HEADER.size
+        self.info: dict[str, Any] = json.loads(data[pos:pos + header_len])
+        # if the log was never finalized, this still gives us everything that was flushed
+        lines = zlib.decompressobj().decompress(data[pos + header_len:]).split(b'\n')
+
+        self.actions: list[list[list[list[Any]]]] = []
+        self.checksums: dict[int, int] = {}
+        finalized = False
+        for line in lines[:-1]:  # the last line is either empty or incomplete
+            record = json.loads(line)
+            if 'frame_count' in record:
+                self.info = record['info']
+                finalized = True
+                break
+            if 'c' in record:
+                self.checksums[len(self.actions)] = record['c']
+            self.actions.append(record['a'])
+        if not finalized:
+            self.info = dict(self.info, game_length=len(self.actions) - 1)
+        self.keyframe_interval: int = self.info['keyframe_interval']
+
+        agent = partial(ReplayAgent, actions=self.actions)
+        game = Game(self.info['game_id'], agent, agent, seed=self.info['seed'],
+                    time_limits=TimeLimits(**self.info['time_limits']),
+                    game_params=GameParams.from_dict(self.info['game_params']))
+        self.snapshots: dict[int, Game] = {0: deepcopy(game)}
+        self._game: Optional[Game] = game  # the game being replayed, at the start of the next frame to be rebuilt
+        self._lock = threading.Lock()  # only one frame can be rebuilt at a time, as they share self._game
+
+    def __len__(self):
+        return len(self.actions)
+
+    def frame(self, frame_num: int) -> dict[str, Any]:
+        if not 0 <= frame_num < len(self):
+            raise IndexError(f"Frame {frame_num} is out of range")
+        with self._lock:
+            if self._game.move_num > frame_num:
+                start = max(n for n in self.snapshots if n <= frame_num)
+                self._game = deepcopy(self.snapshots[start])
+            while self._game.move_num < frame_num:
+                self.replay_frame()
+            return self.replay_frame()
+
+    def replay_frame(self) -> dict[str, Any]:
+        """Replays a single step of the game, and returns the frame for it"""
+        game = self._game
+        n = game.move_num
+        if n % self.keyframe_interval == 0 and n not in self.snapshots:
+            self.snapshots[n] = deepcopy(game)
+        frame = game.capture_frame()
+        if n in self.checksums and frame.state_checksum() != self.checksums[n]:
+            raise ReplayDesyncError(f"Game {self.info['game_id']} does not match its log at frame {n}")
+        frame.set_events(*game.step())
+        return frame.to_dict()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import os
+import sys
+from dataclasses import asdict
+from types import ModuleType
+from typing import Any, Optional
+
+import metrics
+from enums import enum_encoder
+from params import GameParams, TimeLimits
+
+
+CACHE_DIR = os.path.join(os.getcwd(), 'result_cache')
+
+# the modules the outcome of Game.run depends on, besides the agents (metrics makes the cached timings)
+# the logs, profilers and live publishing that game also imports have no effect on it, so aren't part of the version
+ENGINE_MODULES: tuple[str, ...] = ('game', 'outcome', 'entities', 'action', 'params', 'enums', 'vec2', 'agent',
+                                   'metrics')
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def modules_hash(modules: list[ModuleType]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for module in sorted(modules, key=lambda m: m.__name__):
+        h.update(f"{module.__name__}:{file_hash(module.__file__)}\n".encode())
+    return h.hexdigest()
+
+
+def engine_version() -> str:
+    """A hash of the source of the engine, which changes whenever the engine does"""
+    return modules_hash([importlib.import_module(name) for name in ENGINE_MODULES])
+
+
+def agent_version(agent: type) -> str:
+    """A hash of the source of the agent's module and of every module it uses from the same directory (so not the
+    standard library or any packages), which changes whenever any code the agent runs does"""
+    root = os.path.dirname(os.path.abspath(sys.modules[agent.__module__].__file__))
+    found: dict[str, ModuleType] = {}
+    stack = [sys.modules[agent.__module__]]
+    while stack:
+        module = stack.pop()
+        path = getattr(module, '__file__', None)
+        if module.__name__ in found or path is None or not os.path.abspath(path).startswith(root):
+            continue
+        found[module.__name__] = module
+        for value in vars(module).values():  # modules it imported, and the modules of anything it imported from them
+            used = value if isinstance(value, ModuleType) else sys.modules.get(getattr(value, '__module__', None) or '')
+            if used is not None:
+                stack.append(used)
+    return modules_hash(list(found.values()))
+
+
+def game_key(player_1: str, player_2: str, seed: int, params: GameParams, time_limits: TimeLimits,
+             engine: str) -> str:
+    """The key of a game, given the versions of both agents (see agent_version) and of the engine"""
+    inputs = {'player_1': player_1, 'player_2': player_2, 'seed': seed, 'game_params': asdict(params),
+              'time_limits': asdict(time_limits), 'engine': engine}
+    return hashlib.blake2b(json.dumps(inputs, sort_keys=True, default=enum_encoder).encode(),
+                           digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """The results of finished games, kept as a small JSON file per game (named by its game_key) in a directory
+
+    Any number of processes can share the directory. Only games whose key changes (because the code of an agent or of
+    the engine changed, or they are played with different params) are ever played again.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory: str = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, f"{key}.json")) as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            metrics.CACHE_REQUESTS.inc(cache='results', result='miss')
+            return None
+        metrics.CACHE_REQUESTS.inc(cache='results', result='hit')
+        return result
+
+    def put(self, key: str, result: dict[str, Any]):
+        path = os.path.join(self.directory, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)  # other processes must never see a partly written result
@@ -1,52 +1,258 @@
-import os
+import gzip
+import hashlib
 import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
 from functools import lru_cache
+from typing import Any, Callable
 
-from flask import Flask, render_template, redirect, url_for
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, redirect, url_for, jsonify, abort, request, stream_with_context
+from flask_socketio import SocketIO, emit, join_room
 
 import colorama
 
+from catalogue import Catalogue, GAME_COLUMNS
+from frame_cache import FrameCache, CachedGameLog, default_cache_dir
+from game_log import GameLog, BinaryGameLog, GameSummary, summary_path, FRAME_LENGTH
+from live import LIVE_FRAME
+import metrics
+
 colorama.init()
 
 app = Flask(__name__)
 
 app.config['SECRET_KEY'] = 'secret!'
 app.config['GAME_LOGS'] = os.path.join(os.getcwd(), 'game_logs')
+app.config['CATALOGUE_REFRESH_INTERVAL'] = 5  # seconds
+app.config['GAMES_PER_PAGE'] = 50
+# decoded frames are cached here, shared by every server process (set FRAME_CACHE_BYTES to 0 to turn this off)
+app.config['FRAME_CACHE_DIR'] = default_cache_dir()
+app.config['FRAME_CACHE_BYTES'] = 256 * 1024 * 1024
+# games can only be published live from these addresses, and only this many of their latest frames are kept
+app.config['LIVE_PUBLISHERS'] = {'127.0.0.1', '::1'}
+app.config['LIVE_BUFFER_FRAMES'] = 200
 
 socketio = SocketIO(app)
 
+MAX_FRAMES_PER_MESSAGE = 60
+MAX_WINDOW_FRAMES = 1000
+
 
 @app.route('/')
 def index():
-    return render_template('index.html', games=get_games())
+    filters = {}
+    for column in GAME_COLUMNS:
+        for key in (column, 'min_' + column, 'max_' + column):
+            filters[key] = request.args.get(key, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = app.config['GAMES_PER_PAGE']
+    catalogue = get_catalogue()
+    games = catalogue.games(limit=per_page, offset=(page - 1) * per_page, **filters)
+    pages = max((catalogue.count(**filters) + per_page - 1) // per_page, 1)
+    args = {k: v for k, v in filters.items() if v is not None}
+    return render_template('index.html', games=games, page=page, pages=pages, args=args, live=sorted(live_games))
 
 
 @app.route('/<game_id>')
 def game(game_id):
-    if game_id in get_games():
+    if game_exists(game_id):
         return render_template('game.html', game_id=game_id)
     else:
         return redirect(url_for('index'))
 
 
-def get_games():
-    return [f[5:-5] for f in os.listdir(app.config['GAME_LOGS']) if f[:5] == 'game_' and f[-5:] == '.plog']
+@app.route('/summary/<game_id>')
+def summary(game_id):
+    if not game_exists(game_id):
+        abort(404)
+    return jsonify(game_id=game_id, **{k: v.tolist() for k, v in get_game_summary(game_id).items()})
+
+
+@app.route('/metrics')
+def metrics_page():
+    return app.response_class(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def game_exists(game_id):
+    return os.path.isfile(os.path.join(app.config['GAME_LOGS'], "game_{}.plog".format(game_id)))
+
+
+_catalogue = None
+_catalogue_refreshed = 0.0
+_catalogue_lock = threading.Lock()  # requests are served from several threads
 
 
-@lru_cache(maxsize=3)
-def get_game_log(game_id):
-    with open(os.path.join(app.config['GAME_LOGS'], "game_{}.plog".format(game_id))) as f:
-        log = json.load(f)
+def get_catalogue() -> Catalogue:
+    """The catalogue of all games, refreshed (at most every CATALOGUE_REFRESH_INTERVAL seconds) whenever it is used"""
+    global _catalogue, _catalogue_refreshed
+    with _catalogue_lock:
+        if _catalogue is None:
+            _catalogue = Catalogue(app.config['GAME_LOGS'])
+        if time.monotonic() - _catalogue_refreshed > app.config['CATALOGUE_REFRESH_INTERVAL']:
+            _catalogue.refresh()
+            _catalogue_refreshed = time.monotonic()
+        return _catalogue
+
+
+def get_game_log(game_id) -> GameLog:
+    stat = os.stat(os.path.join(app.config['GAME_LOGS'], "game_{}.plog".format(game_id)))
+    return load_game_log(game_id, stat.st_mtime_ns, stat.st_size)  # a log that has changed is loaded again
+
+
+@lru_cache(maxsize=32)  # logs are memory-mapped and decoded a frame at a time, so keeping them open is cheap
+def load_game_log(game_id, mtime: int, size: int) -> GameLog:
+    log = GameLog.load(os.path.join(app.config['GAME_LOGS'], "game_{}.plog".format(game_id)))
+    if app.config['FRAME_CACHE_BYTES'] > 0 and not isinstance(log, BinaryGameLog):  # binary logs are already cheap
+        log = CachedGameLog(log, f"{game_id}_{mtime}_{size}", get_frame_cache())
     return log
 
 
+@lru_cache(maxsize=None)
+def get_frame_cache() -> FrameCache:
+    return FrameCache(app.config['FRAME_CACHE_DIR'], app.config['FRAME_CACHE_BYTES'])
+
+
+def get_game_summary(game_id):
+    log_path = os.path.join(app.config['GAME_LOGS'], "game_{}.plog".format(game_id))
+    path = summary_path(log_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(log_path):
+        # older logs don't have a summary, so we make one (and save it so we only ever have to do this once)
+        GameSummary.from_log(get_game_log(game_id)).save(path)
+    return GameSummary.load(path)
+
+
+def frame_range(log: GameLog, start: int, count: int) -> tuple[int, int]:
+    """The start and stop of the frames to send when count frames from start are asked for"""
+    start = max(start, 0)
+    return start, max(min(start + min(count, MAX_FRAMES_PER_MESSAGE), len(log)), start)
+
+
+def encode_frames(log: GameLog, start: int, stop: int) -> bytes:
+    # every frame in its binary form (see log_codec.FrameArrays.encode) prefixed with its length
+    return b''.join(FRAME_LENGTH.pack(len(blob)) + blob for blob in map(log.frame_bytes, range(start, stop)))
+
+
+def log_version(game_id) -> str:
+    """A hash of the contents of a log, which changes whenever the log does"""
+    path = os.path.join(app.config['GAME_LOGS'], "game_{}.plog".format(game_id))
+    stat = os.stat(path)
+    return hash_log(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=256)
+def hash_log(path: str, mtime: int, size: int) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=128)
+def compressed_frames(game_id, version: str, start: int, stop: int, encoding: str) -> bytes:
+    return compress(encode_frames(get_game_log(game_id), start, stop), encoding)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(body, mtime=0)  # the same body must always give the same bytes, as ETags are strong
+    elif encoding == 'deflate':
+        return zlib.compress(body)
+    return body
+
+
+def cached_response(etag: str, make_body: Callable[[str], bytes], mimetype: str, immutable: bool):
+    """A response that can be cached by its ETag (the body is only made, given the encoding, if it is needed)
+
+    Immutable responses can be cached forever, anything else has to be revalidated every time it is used.
+    """
+    encoding = request.accept_encodings.best_match(['gzip', 'deflate']) or 'identity'
+    etag = f"{etag}-{encoding}"  # every encoding is a different representation, so it needs its own ETag
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(make_body(encoding), mimetype=mimetype)
+        if encoding != 'identity':
+            response.content_encoding = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 60 * 60
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+@app.route('/api/<game_id>/info')
+def api_game_info(game_id):
+    if not game_exists(game_id):
+        abort(404)
+    version = log_version(game_id)
+    # the version is what frames are fetched by, so they can be cached forever (see api_frames)
+    return cached_response(version, lambda encoding: compress(json.dumps(dict(
+        get_game_log(game_id).info, version=version)).encode(), encoding), 'application/json', immutable=False)
+
+
+@app.route('/api/<game_id>/<version>/frames')
+def api_frames(game_id, version):
+    if not game_exists(game_id) or version != log_version(game_id):
+        abort(404)  # the log has changed since this version, the info has to be fetched again
+    start, stop = frame_range(get_game_log(game_id), request.args.get('start', 0, type=int),
+                              request.args.get('count', MAX_FRAMES_PER_MESSAGE, type=int))
+    return cached_response(f"{version}-{start}-{stop}",
+                           lambda encoding: compressed_frames(game_id, version, start, stop, encoding),
+                           'application/octet-stream', immutable=True)
+
+
+@app.route('/api/<game_id>/<version>/window')
+def api_window(game_id, version):
+    """Streams the frames from start up to (but not including) stop, in that order (so stop can be before start)
+
+    Every frame is prefixed with its number and length, and is sent as soon as it is ready, so the viewer can show
+    the frames nearest to where it is playing while the rest of the window is still coming.
+    """
+    if not game_exists(game_id) or version != log_version(game_id):
+        abort(404)
+    log = get_game_log(game_id)
+    start = max(request.args.get('start', 0, type=int), 0)
+    if start >= len(log):
+        abort(404)  # there is no such frame
+    stop = min(max(request.args.get('stop', len(log), type=int), -1), len(log))
+    step = 1 if stop >= start else -1
+    frames = range(start, stop, step)[:MAX_WINDOW_FRAMES]
+    encoding = request.accept_encodings.best_match(['gzip', 'deflate'])
+
+    def generate():
+        # every frame is flushed on its own, but still compressed against the frames before it
+        compressor = zlib.compressobj(wbits=31 if encoding == 'gzip' else 15) if encoding is not None else None
+        for n in frames:
+            blob = log.frame_bytes(n)
+            data = LIVE_FRAME.pack(n, len(blob)) + blob  # the same framing as frames published live
+            yield data if compressor is None else compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressor is not None:
+            yield compressor.flush()
+
+    response = app.response_class(stream_with_context(generate()), mimetype='application/octet-stream')
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    response.cache_control.immutable = True
+    return response
+
+
 @socketio.event
 def get_game_info(data):
     game_id = data['game_id']
     try:
         log = get_game_log(game_id)
-        game_info = log['info']
+        game_info = log.info
         emit('game_info', game_info)
     except EnvironmentError:
         print("Error getting game", game_id)
@@ -58,11 +264,109 @@ def get_frame(data):
     frame_num = data['frame_num']
     try:
         log = get_game_log(game_id)
-        frame = log['frames'][frame_num]
+        frame = log.frame(frame_num)
         emit('frame', {'game_id': game_id, 'frame_num': frame_num, 'frame': frame})
     except EnvironmentError:
         print("Error getting game", game_id)
 
 
+@socketio.event
+def get_frames(data):
+    game_id = data['game_id']
+    try:
+        log = get_game_log(game_id)
+        start, stop = frame_range(log, data['start'], data['count'])
+        emit('frames', {'game_id': game_id, 'start': start, 'count': stop - start,
+                        'data': zlib.compress(encode_frames(log, start, stop))})
+    except EnvironmentError:
+        print("Error getting game", game_id)
+
+
+class LiveGame:
+    """A game being played right now, and the latest frames published by it"""
+
+    def __init__(self, info: dict[str, Any]):
+        self.info: dict[str, Any] = info
+        self.frames: deque[tuple[int, bytes]] = deque(maxlen=app.config['LIVE_BUFFER_FRAMES'])
+
+
+live_games: dict[str, LiveGame] = {}
+
+
+def live_room(game_id) -> str:
+    return f"live_{game_id}"
+
+
+def check_publisher():
+    if request.remote_addr not in app.config['LIVE_PUBLISHERS']:
+        abort(403)
+
+
+def emit_live_frames(live_game: LiveGame, frames: list[tuple[int, bytes]], **kwargs):
+    """Emits frames in the same form as get_frames does, one message for every run of consecutive frames"""
+    runs: list[list[tuple[int, bytes]]] = []
+    for frame_num, blob in frames:
+        if runs and runs[-1][-1][0] == frame_num - 1:
+            runs[-1].append((frame_num, blob))
+        else:
+            runs.append([(frame_num, blob)])
+    for run in runs:
+        payload = b''.join(FRAME_LENGTH.pack(len(blob)) + blob for _, blob in run)
+        socketio.emit('frames', {'game_id': live_game.info['game_id'], 'start': run[0][0], 'count': len(run),
+                                 'data': zlib.compress(payload)}, **kwargs)
+
+
+@app.route('/live/<game_id>')
+def live(game_id):
+    return render_template('game.html', game_id=game_id, live=True)
+
+
+@app.route('/live/<game_id>/start', methods=['POST'])
+def live_start(game_id):
+    check_publisher()
+    live_games[game_id] = LiveGame(request.get_json(force=True))
+    socketio.emit('live_info', live_games[game_id].info, to=live_room(game_id))
+    return '', 204
+
+
+@app.route('/live/<game_id>/frames', methods=['POST'])
+def live_frames(game_id):
+    check_publisher()
+    if game_id not in live_games:
+        abort(404)
+    data = request.get_data()
+    frames = []
+    pos = 0
+    while pos < len(data):
+        frame_num, length = LIVE_FRAME.unpack_from(data, pos)
+        pos += LIVE_FRAME.size
+        frames.append((frame_num, data[pos:pos + length]))
+        pos += length
+    live_games[game_id].frames.extend(frames)
+    emit_live_frames(live_games[game_id], frames, to=live_room(game_id))
+    return '', 204
+
+
+@app.route('/live/<game_id>/end', methods=['POST'])
+def live_end(game_id):
+    check_publisher()
+    live_games.pop(game_id, None)  # the log is complete now, so the game can be watched from that instead
+    socketio.emit('live_end', request.get_json(force=True), to=live_room(game_id))
+    return '', 204
+
+
+@socketio.event
+def watch_live(data):
+    game_id = str(data['game_id'])
+    join_room(live_room(game_id))
+    live_game = live_games.get(game_id)
+    if live_game is None:
+        emit('live_end', {'game_id': data['game_id']})
+        return
+    emit('live_info', live_game.info)
+    emit_live_frames(live_game, list(live_game.frames), to=request.sid)
+
+
 if __name__ == '__main__':
+    get_catalogue()  # bring the catalogue up to date before any games are listed
     socketio.run(app, host='0.0.0.0', port=8000, debug=True)
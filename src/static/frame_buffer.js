@@ -0,0 +1,31 @@
+// A ring buffer of loaded frames, with the same has/get/set as a Map
+// frame n can only be kept in slot n % capacity, so it holds at most capacity consecutive frames (and no more memory)
+
+const BYTES_PER_CELL = 100; // roughly the memory a cell of a decoded frame takes up
+
+class FrameBuffer {
+
+    constructor(capacity) {
+        this.capacity = capacity;
+        this.nums = new Array(capacity).fill(-1);
+        this.frames = new Array(capacity).fill(null);
+    }
+
+    has(frame_num) {
+        return frame_num >= 0 && this.nums[frame_num % this.capacity] === frame_num;
+    }
+
+    get(frame_num) {
+        return this.has(frame_num) ? this.frames[frame_num % this.capacity] : undefined;
+    }
+
+    set(frame_num, frame) {
+        this.nums[frame_num % this.capacity] = frame_num;
+        this.frames[frame_num % this.capacity] = frame;
+    }
+}
+
+// how many frames of a map this size fit in the given memory
+function frame_buffer_capacity(bytes, w, h) {
+    return Math.max(Math.floor(bytes / (w * h * BYTES_PER_CELL)), 8);
+}
@@ -0,0 +1,141 @@
+// Decodes frames sent by the server in the binary form of log_codec.FrameArrays
+// into the same objects as the frames of a JSON log (which is what game.js renders)
+
+// these must match log_codec.py
+const KINDS = ['E', 'O', 'F', 'B', 'T', 'C', 'M', 'K'];
+const DIRECTIONS = ['U', 'D', 'R', 'L', 'N'];
+const INFO_FIELDS = ['player', 'ore', 'fuel', 'bases', 'turrets', 'under_construction', 'miners', 'fighters', 'points'];
+const CELL_COLUMNS = [['kind', 'u1'], ['owner', 'u1'], ['health', 'i4'], ['amount', 'i4'], ['dir', 'u1']];
+const ENTITY_COLUMNS = [['id', 'i4'], ['x', 'i2'], ['y', 'i2'], ['kind', 'u1'], ['owner', 'u1'], ['health', 'i4'],
+    ['dir', 'u1'], ['in_building', 'u1'], ['build', 'u1'], ['progress', 'u1'], ['cargo_len', 'u1']];
+const FRAME_HEADER_SIZE = 7 * 4;
+
+// size and DataView getter of every column type, everything is little-endian
+const COLUMN_TYPES = {
+    'u1': [1, 'getUint8'],
+    'i2': [2, 'getInt16'],
+    'i4': [4, 'getInt32']
+};
+
+class FrameReader {
+
+    constructor(view, pos) {
+        this.view = view;
+        this.pos = pos;
+    }
+
+    column(type, count) {
+        let [size, getter] = COLUMN_TYPES[type];
+        let values = new Array(count);
+        for (let i = 0; i < count; i++) {
+            values[i] = this.view[getter](this.pos + i * size, true);
+        }
+        this.pos += count * size;
+        return values;
+    }
+
+    rows(type, count, row_len) {
+        let values = this.column(type, count * row_len);
+        let rows = new Array(count);
+        for (let i = 0; i < count; i++) {
+            rows[i] = values.slice(i * row_len, (i + 1) * row_len);
+        }
+        return rows;
+    }
+
+    text(length) {
+        let bytes = new Uint8Array(this.view.buffer, this.view.byteOffset + this.pos, length);
+        this.pos += length;
+        return new TextDecoder().decode(bytes);
+    }
+}
+
+// decodes a payload of frames, each one prefixed with its length (as a little-endian uint32)
+function decode_frames(buffer, w, h) {
+    let view = new DataView(buffer);
+    let frames = [];
+    let pos = 0;
+    while (pos < view.byteLength) {
+        let length = view.getUint32(pos, true);
+        frames.push(decode_frame(new DataView(buffer, pos + 4, length), w, h));
+        pos += 4 + length;
+    }
+    return frames;
+}
+
+// the same as FrameArrays.decode followed by FrameArrays.to_dict
+function decode_frame(view, w, h) {
+    let r = new FrameReader(view, 0);
+    let [n_ent, n_cargo, n_moves, n_col, n_att, n_des, n_extra] = r.column('i4', 7);
+
+    let info_values = r.column('i4', 2 * INFO_FIELDS.length);
+    let info = [0, 1].map(p => Object.fromEntries(INFO_FIELDS.map(
+        (f, i) => [f, info_values[p * INFO_FIELDS.length + i]])));
+
+    let cells = {};
+    for (const [name, type] of CELL_COLUMNS) {
+        cells[name] = r.column(type, w * h); // stored [x][y], so y varies fastest
+    }
+    let map = new Array(w);
+    for (let x = 0; x < w; x++) {
+        map[x] = new Array(h);
+        for (let y = 0; y < h; y++) {
+            let k = cells.kind[x * h + y];
+            map[x][y] = (k === 1 || k === 2) ? {'t': KINDS[k], 'a': cells.amount[x * h + y]} : {'t': 'E'};
+        }
+    }
+
+    let ents = {};
+    for (const [name, type] of ENTITY_COLUMNS) {
+        ents[name] = r.column(type, n_ent);
+    }
+    let cargo = r.text(n_cargo);
+    let c_start = 0;
+    for (let i = 0; i < n_ent; i++) {
+        let t = KINDS[ents.kind[i]];
+        let id = String(ents.id[i]);
+        let ent = {'t': t, 'i': id, 'h': ents.health[i], 'p': ents.owner[i]};
+        if (t === 'M' || t === 'K') {
+            ent.d = DIRECTIONS[ents.dir[i]];
+        }
+        if (t === 'M') {
+            ent.c = cargo.substring(c_start, c_start + ents.cargo_len[i]);
+            c_start += ents.cargo_len[i];
+        }
+        if (t === 'B' || t === 'T' || t === 'C') {
+            ent.v = {};
+        }
+        if (t === 'C') {
+            ent.b = KINDS[ents.build[i]];
+            ent.m = ents.progress[i] / 100;
+        }
+        if (ents.in_building[i]) {
+            map[ents.x[i]][ents.y[i]].v[id] = ent;
+        } else {
+            map[ents.x[i]][ents.y[i]] = ent;
+        }
+    }
+
+    let moves = {};
+    for (const [id, d] of r.rows('i4', n_moves, 2)) {
+        moves[String(id)] = DIRECTIONS[d];
+    }
+    let frame = {
+        'info': info,
+        'map': map,
+        'moves': moves,
+        'collisions': r.rows('i2', n_col, 2),
+        'attacks': r.rows('i2', n_att, 5).map(([x1, y1, x2, y2, p]) => [[x1, y1], [x2, y2], p]),
+        'destroyed': r.rows('i2', n_des, 2)
+    };
+    if (n_extra > 0) {
+        Object.assign(frame, JSON.parse(r.text(n_extra)));
+    }
+    return frame;
+}
+
+// payloads are zlib compressed (consecutive frames are very similar, so this shrinks them a lot)
+async function decompress(buffer) {
+    let stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return await new Response(stream).arrayBuffer();
+}
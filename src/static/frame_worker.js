@@ -0,0 +1,55 @@
+// Streams windows of frames from the server (see api_window in server.py) and decodes them off the main thread
+// Each message asks for a window ({id, url, w, h}), and cancels the one before it
+// Frames are posted back as they are decoded ({id, frames: [[frame_num, frame], ...]}), then {id, done: true}
+
+importScripts('frame_decoder.js');
+
+let controller = null;
+
+onmessage = async function (e) {
+    if (controller !== null) {
+        controller.abort();
+    }
+    let {id, url, w, h} = e.data;
+    if (!url) {
+        return; // just cancelling
+    }
+    controller = new AbortController();
+    let signal = controller.signal;
+    try {
+        let response = await fetch(url, {signal: signal});
+        if (!response.ok) {
+            throw new Error(response.statusText);
+        }
+        let reader = response.body.getReader();
+        let pending = new Uint8Array(0); // anything received that isn't yet a complete frame
+        while (true) {
+            let {done, value} = await reader.read();
+            if (done) {
+                break;
+            }
+            let data = new Uint8Array(pending.length + value.length);
+            data.set(pending);
+            data.set(value, pending.length);
+            let view = new DataView(data.buffer);
+            let frames = [];
+            let pos = 0;
+            while (data.length - pos >= 8) { // every frame is prefixed with its number and length
+                let frame_num = view.getUint32(pos, true);
+                let length = view.getUint32(pos + 4, true);
+                if (data.length - pos - 8 < length) {
+                    break;
+                }
+                frames.push([frame_num, decode_frame(new DataView(data.buffer, pos + 8, length), w, h)]);
+                pos += 8 + length;
+            }
+            pending = data.slice(pos);
+            if (frames.length > 0) {
+                postMessage({id: id, frames: frames});
+            }
+        }
+        postMessage({id: id, done: true});
+    } catch (err) {
+        postMessage({id: id, done: true, failed: !signal.aborted});
+    }
+};
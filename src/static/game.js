@@ -129,6 +129,17 @@ function render_info(pg, dt) {
     txt = "" + info[1].points
     pg.text(txt, pg.width * 0.615, s * 0.8);
 
+    // how long each agent took to move from this frame, and what was left on its clock (older logs don't have these)
+    if (frame.agent_times !== undefined) {
+        pg.textSize(s * 0.4);
+        for (let p = 0; p < 2; p++) {
+            let slow = time_limits !== undefined && frame.agent_times[p] > time_limits.INCREMENT * 1e6;
+            pg.fill(slow ? color(255, 90, 90) : color(160));
+            txt = (frame.agent_times[p] / 1000).toFixed(1) + " ms (" + (frame.clocks[p] / 1000).toFixed(1) + " s left)";
+            pg.text(txt, p === 0 ? s * 1.1 : pg.width - s * 1.1 - pg.textWidth(txt), s * 0.65);
+        }
+    }
+
     drawBase(pg, s * 0.2, s * 1.2, false, s * 0.6);
     drawTurret(pg, pg.width * 0.25 + s * 0.1, s * 1.1, false, s * 0.8);
     drawMiner(pg, s * 0.05, s * 2.05, QUARTER_PI, "FOF", false, s * 0.9);
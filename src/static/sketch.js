@@ -1,7 +1,10 @@
 // noinspection JSUnresolvedVariable,JSUnresolvedFunction
 
-const BACK_BUFFER_SIZE = 80; // just keep prev 30 frames
-const FORWARD_BUFFER_SIZE = 120; // try to load next 60 frames
+const PREFETCH_AHEAD = 150; // frames loaded ahead of the current frame (in the direction we are moving)
+const PREFETCH_BEHIND = 50; // frames kept behind it
+const WINDOW_ALIGN = 30; // windows end on a multiple of this, so the same windows get asked for (and cached)
+const BUFFER_BYTES = 192*1024*1024; // roughly the most memory loaded frames may take up
+const RETRY_TIME = 1000; // how long to wait before trying again if a window couldn't be loaded
 
 const TIME_PER_FRAME = 1000;
 
@@ -9,16 +12,28 @@ let stopwatch;
 
 let cfn = 0;
 
-const loaded_frames = new Map();
-const loading_frames = new Set();
+let loaded_frames = new FrameBuffer(1);
+let ahead = PREFETCH_AHEAD, behind = PREFETCH_BEHIND, align = WINDOW_ALIGN; // scaled down for very large maps
+let reach = 0; // the furthest from the current frame we keep any frames
+let direction = 1, prev_cfn = 0; // the direction we are moving in (-1 if going backwards)
+
+// windows of frames are streamed and decoded by a worker, one at a time
+const frame_worker = new Worker(document.getElementById('frame_worker').content);
+frame_worker.onmessage = windowFramesReceived;
+let stream = null; // the window being streamed, and the next frame expected from it
+let next_stream_id = 0;
+let retry_at = 0;
 
 const game_id = parseInt(document.getElementById('game_id').content, 10);
+const live = document.getElementById('live').content === '1'; // watching a game while it is being played
+let live_frame = -1; // the latest frame of a live game we have received
 
 let gotGameInfo = false;
 let waitingForGameInfo = false;
 let game_length = 0;
 let map_w, map_h;
 let game_params;
+let time_limits;
 
 let trueCanvas;
 
@@ -52,7 +67,11 @@ function draw_real(pg){
 
 	if(!gotGameInfo){
 		if(!waitingForGameInfo){
-			fetch_game_info();
+			if(live){
+				watch_live();
+			}else{
+				fetch_game_info();
+			}
 			waitingForGameInfo = true;
 		}
 		center_text(pg, "Loading...");
@@ -81,6 +100,12 @@ function draw_real(pg){
 		stopwatch.pause();
 		stopwatch.update();
 	}
+	// a live game can't go past the latest frame played so far
+	if(live && cfn > live_frame){
+		cfn = max(live_frame, 0);
+		stopwatch.time = cfn*TIME_PER_FRAME;
+		stopwatch.update();
+	}
 	// are we done?
 	if(cfn >= game_length){
 		cfn = game_length;
@@ -171,49 +196,93 @@ function center_text(pg, txt){
 
 
 function handleFrameBuffer(){
-	// delete unnecessary loaded frames
-	// noinspection JSUnusedLocalSymbols
-	for(const [frame_num, frame] of loaded_frames){
-		if(frame_num < cfn - BACK_BUFFER_SIZE || frame_num > cfn + FORWARD_BUFFER_SIZE){
-			loaded_frames.delete(frame_num);
-		}
+	if(live){
+		return; // frames of a live game are sent to us as they are played
+	}
+	if(cfn !== prev_cfn){
+		direction = cfn > prev_cfn ? 1 : -1;
+		prev_cfn = cfn;
+	}
+	if(stream !== null && (loaded_frames.has(cfn) || (cfn - stream.next)*stream.step >= 0 &&
+			(stream.stop - cfn)*stream.step > 0)){
+		return; // the window being streamed is still what we need
 	}
-	// make sure current frame exists
-	if(fetch_frame_if_needed(cfn)){
-		return; // ONLY fetch one frame per call
+	if(millis() < retry_at){
+		return;
 	}
-	// forward buffer
-	for(let i = cfn+1; i <= min(cfn+FORWARD_BUFFER_SIZE, game_length); i++){
-		if(fetch_frame_if_needed(i)){
-			return; // ONLY fetch one frame per call
+	// the first missing frame ahead of us, then behind us
+	for(const [d, size] of [[direction, ahead], [-direction, behind]]){
+		let last = constrain(cfn + d*size, 0, game_length);
+		let n = cfn;
+		while(n !== last + d && loaded_frames.has(n)){
+			n += d;
+		}
+		if(n === last + d || abs(n - cfn) > size/2){
+			continue; // we have enough of this side for now
 		}
+		let stop = d > 0 ? min(ceil((cfn + size)/align)*align, game_length + 1) : max(floor((cfn - size)/align)*align, 0) - 1;
+		if(stream === null || stream.start !== n || stream.stop !== stop){
+			stream_window(n, stop);
+		}
+		return;
 	}
-	//back buffer
-	for(let i = max(0, cfn-BACK_BUFFER_SIZE); i < cfn; i++){
-		if(fetch_frame_if_needed(i)){
-			return; // ONLY fetch one frame per call
+}
+
+
+function stream_window(start, stop){
+	// this replaces any window already being streamed
+	stream = {id: next_stream_id++, start: start, stop: stop, next: start, step: stop > start ? 1 : -1};
+	frame_worker.postMessage({id: stream.id, url: `/api/${game_id}/${game_version}/window?start=${start}&stop=${stop}`,
+		w: map_w, h: map_h});
+}
+
+
+function windowFramesReceived(e){
+	let data = e.data;
+	for(const [frame_num, frame] of data.frames || []){
+		if(abs(frame_num - cfn) <= reach){ // anything further away might push out frames we need
+			loaded_frames.set(frame_num, frame);
 		}
 	}
+	if(stream === null || data.id !== stream.id)return; // from a window we no longer need
+	if(data.done){
+		stream = null;
+		if(data.failed)retry_at = millis() + RETRY_TIME;
+	}else{
+		stream.next = data.frames[data.frames.length - 1][0] + stream.step;
+	}
 }
 
 
-function fetch_frame_if_needed(frame_num){
-	if(!loaded_frames.has(frame_num) && !loading_frames.has(frame_num)){
-		fetch_frame(frame_num);
-		loading_frames.add(frame_num);
-		return true; // frame was fetched
+async function framesReceived(data){
+	if(data['game_id'] !== game_id)return; // ignore the frames
+	framesLoaded(data['start'], decode_frames(await decompress(data['data']), map_w, map_h));
+}
+
+
+function framesLoaded(start, frames){
+	if(live){
+		let first = live_frame < 0;
+		for(let i = 0; i < frames.length; i++){
+			loaded_frames.set(start + i, frames[i]);
+		}
+		live_frame = max(live_frame, start + frames.length - 1);
+		if(first){ // start watching from the latest frame
+			stopwatch.time = live_frame*TIME_PER_FRAME;
+			stopwatch.start();
+		}
+		return;
+	}
+	for(let i = 0; i < frames.length; i++){
+		if(abs(start + i - cfn) <= reach)loaded_frames.set(start + i, frames[i]);
 	}
-	return false;
 }
 
 
-function frameReceived(data){
-	if(data['game_id'] !== game_id)return; // ignore the frame
-	let frame_num = data['frame_num'];
-	if(!loading_frames.has(frame_num))return; // again ignore
-	// got a frame we needed
-	loading_frames.delete(frame_num);
-	loaded_frames.set(frame_num, data['frame']);
+function liveEnded(data){
+	if(data['game_id'] !== game_id)return; // ignore
+	// the game is over (or was never live), so its log can be watched instead
+	window.location.href = '/' + game_id;
 }
 
 
@@ -223,6 +292,15 @@ function gameInfoReceived(data){
 	map_w = data['map_w'];
 	map_h = data['map_h'];
 	game_params = data['game_params'];
+	time_limits = data['time_limits'];
+	// load as many frames around the current one as we can fit in memory, up to the prefetch window
+	let capacity = frame_buffer_capacity(BUFFER_BYTES, map_w, map_h);
+	let scale = min(1, (capacity - 1)/(2*(max(PREFETCH_AHEAD, PREFETCH_BEHIND) + WINDOW_ALIGN)));
+	ahead = max(floor(PREFETCH_AHEAD*scale), 1);
+	behind = floor(PREFETCH_BEHIND*scale);
+	align = max(floor(WINDOW_ALIGN*scale), 1);
+	reach = max(ahead, behind) + align;
+	loaded_frames = new FrameBuffer(2*reach + 1);
 	game_init(trueCanvas);
 	gotGameInfo = true;
 	waitingForGameInfo = false;
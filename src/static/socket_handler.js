@@ -11,19 +11,36 @@ socket.on('connect_error', function(){
 })
 
 
-function fetch_frame(frame_num){
-    socket.emit('get_frame', {'game_id': game_id, 'frame_num': frame_num});
-}
-
-socket.on('frame', function(data){
-    frameReceived(data);
+socket.on('frames', function(data){
+    framesReceived(data);
 })
 
 
+// game info and frames of saved games are fetched over HTTP instead (frames by frame_worker.js), so the browser
+// can cache them
+
+let game_version = null; // the version of the log frames are fetched from (given with the game info)
+
 function fetch_game_info(){
-    socket.emit('get_game_info', {'game_id': game_id});
+    fetch(`/api/${game_id}/info`)
+        .then(response => response.json())
+        .then(data => {
+            game_version = data['version'];
+            gameInfoReceived(data);
+        })
+        .catch(() => {
+            waitingForGameInfo = false; // try again
+        });
 }
 
-socket.on('game_info', function(data){
+function watch_live(){
+    socket.emit('watch_live', {'game_id': game_id});
+}
+
+socket.on('live_info', function(data){
     gameInfoReceived(data);
 })
+
+socket.on('live_end', function(data){
+    liveEnded(data);
+})
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+from copy import deepcopy
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import product
+from random import Random
+from time import perf_counter
+from typing import Any, Optional, Union, get_args, get_origin, get_type_hints
+
+import numpy as np
+
+import metrics
+from params import GameParams
+from result_cache import CACHE_DIR
+from tournament import GameTask, GameResult, init_worker, load_params, merge_metrics, play_in_worker, PRESETS
+
+
+def get_field(params: GameParams, path: str) -> Any:
+    """Gets a field of the params given its dotted path (e.g. 'turrets.damage')"""
+    value = params
+    for name in path.split('.'):
+        if not hasattr(value, name):
+            raise AttributeError(f"GameParams has no field {path}")
+        value = getattr(value, name)
+    return value
+
+
+def field_type(owner: Any, name: str) -> type:
+    """The declared type of a field of a dataclass, without the Optional if it has one"""
+    hint = get_type_hints(type(owner))[name]
+    if get_origin(hint) is Union:
+        args = [a for a in get_args(hint) if a is not type(None)]
+        if len(args) == 1:
+            hint = args[0]
+    return hint
+
+
+def coerce(path: str, value: Any, hint: type) -> Any:
+    """Converts a value to the declared type of the field, only numeric and bool fields can be swept"""
+    if hint is bool:
+        if isinstance(value, str) and value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        if isinstance(value, bool) or value in (0, 1):
+            return bool(value)
+        raise ValueError(f"{path} is a bool, {value!r} isn't")
+    if hint in (int, float):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{path} is a number, {value!r} isn't")
+        return hint(value)  # so that int fields stay ints
+    raise ValueError(f"{path} is a {getattr(hint, '__name__', hint)}, only numeric and bool fields can be swept")
+
+
+def with_fields(params: GameParams, values: dict[str, Any]) -> GameParams:
+    """A copy of the params with the fields (given by their dotted paths) set to the values"""
+    params = deepcopy(params)
+    for path, value in values.items():
+        *parents, name = path.split('.')
+        owner = get_field(params, '.'.join(parents)) if parents else params
+        get_field(params, path)  # fails if there is no such field
+        setattr(owner, name, coerce(path, value, field_type(owner, name)))
+    return params
+
+
+def grid(values: dict[str, list[Any]]) -> list[dict[str, Any]]:
+    """Every combination of the values of the fields"""
+    return [dict(zip(values, combination)) for combination in product(*values.values())]
+
+
+def random_search(ranges: dict[str, tuple[Any, Any]], samples: int, seed: int = 0) -> list[dict[str, Any]]:
+    """Samples values of the fields uniformly from their (inclusive) ranges, as integers if both bounds are"""
+    rand = Random(seed)
+    def sample(low: Any, high: Any) -> Any:
+        return rand.randint(low, high) if isinstance(low, int) and isinstance(high, int) else rand.uniform(low, high)
+
+    return [{path: sample(low, high) for path, (low, high) in ranges.items()} for _ in range(samples)]
+
+
+@dataclass
+class SweepTask(GameTask):
+    config: int = 0  # the index of the configuration
+    params: GameParams = field(default_factory=GameParams)
+
+
+def play_config(task: SweepTask) -> GameResult:
+    return play_in_worker(task, task.params)
+
+
+def run_sweep(configs: list[dict[str, Any]], seeds: range, player_1: str, player_2: str,
+              base: GameParams = GameParams(), workers: Optional[int] = None,
+              cache_dir: Optional[str] = CACHE_DIR) -> list[GameResult]:
+    """Plays every configuration (the fields to change in the base params) on every seed, on a pool of workers
+
+    Games already in the ResultCache in cache_dir are not played again, unless cache_dir is None.
+    """
+    params = [with_fields(base, config) for config in configs]
+    tasks = [SweepTask(seed, 'sweep', player_1, player_2, i, p) for seed in seeds for i, p in enumerate(params)]
+    results = []
+    workers = workers or os.cpu_count()
+    # the configurations of a seed are sent to a worker together, so that it can reuse their maps (they are only split
+    # up when there are fewer seeds than workers, so that every worker has something to do)
+    chunksize = max(min(len(configs), len(tasks) // workers), 1)
+    with multiprocessing.Pool(workers, partial(init_worker, metrics_enabled=metrics.enabled),
+                              ([player_1, player_2], [], cache_dir)) as pool:
+        for result in pool.imap_unordered(play_config, tasks, chunksize=chunksize):
+            merge_metrics(result)
+            results.append(result)
+            if result.error is not None:
+                print(f"Game {result.task.seed} of configuration {result.task.config} crashed:\n{result.error}")
+            if len(results) % 100 == 0 or len(results) == len(tasks):
+                print(f"{len(results)}/{len(tasks)} games played")
+    results.sort(key=lambda r: (r.task.config, r.task.seed))
+    return results
+
+
+def summarise(configs: list[dict[str, Any]], results: list[GameResult]) -> dict[str, np.ndarray]:
+    """The outcomes of every configuration, as columns (one value per configuration) along with the swept fields"""
+    columns: dict[str, np.ndarray] = {path: np.array([config[path] for config in configs]) for path in configs[0]}
+    config = np.array([r.task.config for r in results])
+    ok = np.array([r.error is None for r in results])
+    points = np.array([r.points for r in results], dtype=float).reshape(-1, 2)
+    won = np.array([r.winner for r in results])
+    turns = np.array([r.turns for r in results], dtype=float)
+    times = np.array([r.time for r in results])
+    games = np.bincount(config[ok], minlength=len(configs))
+    margin = points[:, 0] - points[:, 1]
+
+    def mean(values: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid='ignore', divide='ignore'):  # configurations where every game crashed are left as nan
+            return np.bincount(config[ok], values[ok], len(configs)) / games
+
+    columns.update({
+        'games': games,
+        'errors': np.bincount(config[~ok], minlength=len(configs)),
+        'p1_win_rate': mean(won == 1),
+        'p2_win_rate': mean(won == 2),
+        'draw_rate': mean(won == 0),
+        'p1_points': mean(points[:, 0]),
+        'p2_points': mean(points[:, 1]),
+        'margin': mean(margin),
+        'margin_std': np.sqrt(np.maximum(mean(margin ** 2) - mean(margin) ** 2, 0)),
+        'turns': mean(turns),
+        'time': mean(times),
+    })
+    return columns
+
+
+def save_results(path: str, columns: dict[str, np.ndarray], results: list[GameResult]):
+    """Saves the columns of the summary, along with the outcome of every game (as columns starting with 'game_')"""
+    np.savez(path, **columns,
+             game_config=np.array([r.task.config for r in results]),
+             game_seed=np.array([r.task.seed for r in results]),
+             game_points=np.array([r.points for r in results]).reshape(-1, 2),
+             game_turns=np.array([r.turns for r in results]),
+             game_winner=np.array([r.winner for r in results]),
+             game_error=np.array([r.error is not None for r in results]))
+
+
+def parse_value(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays games with many values of fields of GameParams, to see how "
+                                                 "the values affect the outcome")
+    parser.add_argument('--grid', nargs='+', default=[], metavar='FIELD=V1,V2,...',
+                        help="fields (as dotted paths, e.g. turrets.damage) and every value to try")
+    parser.add_argument('--random', nargs='+', default=[], metavar='FIELD=LOW:HIGH',
+                        help="fields and ranges to sample values from (combined with every grid value)")
+    parser.add_argument('--samples', type=int, default=20, help="values sampled from the random ranges")
+    parser.add_argument('--sample-seed', type=int, default=0)
+    parser.add_argument('--players', nargs=2, default=('player:Player', 'player:Player'),
+                        help="the agents to play as player 1 and 2 (default: player:Player for both)")
+    parser.add_argument('--seeds', type=int, nargs=2, default=(0, 20), metavar=('START', 'STOP'))
+    parser.add_argument('--preset', default='default',
+                        help=f"the params to start from ({', '.join(PRESETS)}, or a JSON file of GameParams fields)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--out', default='sweep.npz', help="where to save the results")
+    parser.add_argument('--cache', default=CACHE_DIR, help="the directory of the cache of game results")
+    parser.add_argument('--no-cache', action='store_true', help="play every game, even if its result is cached")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve the metrics of every game (see metrics.py) on this port while the games are played")
+    args = parser.parse_args()
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+    if not args.grid and not args.random:
+        parser.error("nothing to sweep, give some --grid or --random fields")
+
+    base = load_params(args.preset)
+    values = {}
+    for spec in args.grid:
+        path, _, text = spec.partition('=')
+        values[path] = [parse_value(v) for v in text.split(',')]
+    ranges = {}
+    for spec in args.random:
+        path, _, text = spec.partition('=')
+        low, _, high = text.partition(':')
+        ranges[path] = (parse_value(low), parse_value(high))
+    configs = grid(values)
+    if ranges:
+        configs = [dict(g, **r) for g in configs for r in random_search(ranges, args.samples, args.sample_seed)]
+    for path in list(values) + list(ranges):
+        get_field(base, path)  # fail before any games are played
+
+    start = perf_counter()
+    results = run_sweep(configs, range(*args.seeds), *args.players, base, args.workers,
+                        None if args.no_cache else args.cache)
+    columns = summarise(configs, results)
+    save_results(args.out, columns, results)
+    cached = sum(r.cached for r in results)
+    print(f"Played {len(results) - cached} games ({cached} more were cached) in {perf_counter() - start:.1f}s, "
+          f"results saved to {args.out}")
+    for i, config in enumerate(configs):
+        print(f"{config}: P1 wins {columns['p1_win_rate'][i]:.0%}, P2 wins {columns['p2_win_rate'][i]:.0%}, "
+              f"mean margin {columns['margin'][i]:+.1f}")
+
+
+if __name__ == '__main__':
+    main()
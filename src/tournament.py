@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import pstats
+import re
+import sys
+import traceback
+from dataclasses import dataclass, asdict, astuple
+from itertools import combinations
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+import metrics
+from agent import Agent
+from game import Game, MapLayout, map_key
+from params import GameParams, StartParams, TimeLimits
+from profiling import PROFILERS, aggregate
+from result_cache import ResultCache, CACHE_DIR, agent_version, engine_version, game_key
+
+
+# presets can also be given as the path of a JSON file of (some of) the fields of GameParams, see load_params
+PRESETS: dict[str, Callable[[], GameParams]] = {
+    'default': GameParams,
+    'short': lambda: GameParams(start=StartParams(min_len=150, max_len=200)),
+    'long': lambda: GameParams(start=StartParams(min_len=800, max_len=1000)),
+}
+
+
+def load_agent(path: str) -> type[Agent]:
+    """Loads an agent class given as 'module:Class' (or 'module.Class')"""
+    module, sep, name = path.partition(':')
+    if not sep:
+        module, _, name = path.rpartition('.')
+    agent = getattr(importlib.import_module(module), name)
+    if not (isinstance(agent, type) and issubclass(agent, Agent)):
+        raise TypeError(f"{path} is not an Agent")
+    return agent
+
+
+def load_params(preset: str) -> GameParams:
+    if preset in PRESETS:
+        return PRESETS[preset]()
+    with open(preset) as f:
+        return GameParams.from_dict(json.load(f))
+
+
+@dataclass
+class GameTask:
+    seed: int
+    preset: str
+    player_1: str  # the agents, as given to load_agent
+    player_2: str
+
+
+@dataclass
+class GameResult:
+    task: GameTask
+    points: tuple[int, int] = (0, 0)
+    turns: int = 0
+    winner: int = 0  # 1 or 2, or 0 if it was a draw
+    time: float = 0  # seconds taken to play the game
+    error: Optional[str] = None  # the traceback, if the game crashed
+    cached: bool = False  # whether the result was found in the ResultCache rather than played
+    timings: Optional[dict[str, dict[str, float]]] = None  # see Game.timings, only if they were recorded
+    profiles: Optional[tuple[str, str]] = None  # the profiles of both agents, only if they were profiled
+    metrics: Optional[dict[str, dict]] = None  # the metrics of the worker since its last game (see merge_metrics)
+
+
+# every worker loads the agents and presets once, and then plays any number of games with them
+_agents: dict[str, type[Agent]] = {}
+_params: dict[str, GameParams] = {}
+_cache: Optional[ResultCache] = None
+_versions: dict[str, str] = {}  # the version of every agent and of the engine, for the keys of the cache
+_record_timings: bool = False
+_profile: Optional[str] = None
+_profile_dir: str = ''
+
+
+def init_worker(agents: list[str], presets: list[str], cache_dir: Optional[str] = None, record_timings: bool = False,
+                profile: Optional[str] = None, profile_dir: str = 'profiles', metrics_enabled: bool = False):
+    global _cache, _record_timings, _profile, _profile_dir
+    metrics.REGISTRY.drain()  # a forked worker starts with the metrics of the parent, which already has them
+    if metrics_enabled:  # so that the workers time the steps too
+        metrics.enable()
+    _record_timings = record_timings
+    _profile, _profile_dir = profile, profile_dir
+    if profile is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+    sys.stdout = open(os.devnull, 'w')  # anything agents print (e.g. Player.close) would be unreadable
+    for path in agents:
+        _agents[path] = load_agent(path)
+    for preset in presets:
+        _params[preset] = load_params(preset)
+    if cache_dir is not None:
+        _cache = ResultCache(cache_dir)
+        _versions.update({path: agent_version(agent) for path, agent in _agents.items()}, engine=engine_version())
+
+
+def file_name(text: str) -> str:
+    return re.sub(r'\W+', '_', text).strip('_')
+
+
+def profile_paths(task: GameTask) -> tuple[str, str]:
+    name = f"game_{file_name(task.preset)}_{task.seed}_{file_name(task.player_1)}_vs_{file_name(task.player_2)}"
+    return os.path.join(_profile_dir, f"{name}.p1.prof"), os.path.join(_profile_dir, f"{name}.p2.prof")
+
+
+def play_game(task: GameTask, params: GameParams,
+              layout: Optional[MapLayout] = None) -> tuple[GameResult, Optional[Game]]:
+    """Plays the game of the task with the given params, returning the game too (None if it couldn't be created, or
+    if the result was in the cache)
+
+    Games whose agents are profiled are always played, as the cache only has their results.
+    """
+    key = None
+    profiles = profile_paths(task) if _profile is not None else None
+    if _cache is not None:
+        key = game_key(_versions[task.player_1], _versions[task.player_2], task.seed, params, TimeLimits(),
+                       _versions['engine'])
+        cached = _cache.get(key)
+        if cached is not None and (cached.get('timings') is not None or not _record_timings) and _profile is None:
+            return GameResult(task, tuple(cached['points']), cached['turns'], cached['winner'], cached['time'],
+                              cached=True, timings=cached.get('timings')), None
+    start = perf_counter()
+    game = None
+    try:
+        game = Game(task.seed, _agents[task.player_1], _agents[task.player_2], seed=task.seed, game_params=params,
+                    layout=layout, record_timings=_record_timings, profile=_profile)
+        try:
+            outcome = game.run()
+        finally:
+            game.player_1.close()
+            game.player_2.close()
+            if profiles is not None:  # also for games that crashed, to see where they were
+                game.save_profiles(*profiles)
+    except Exception:
+        return GameResult(task, time=perf_counter() - start, error=traceback.format_exc(),
+                          profiles=profiles if game is not None else None), game
+    result = GameResult(task, outcome.points, outcome.turns, outcome.winner, perf_counter() - start,
+                        timings=outcome.timings, profiles=profiles)
+    if key is not None:  # crashes aren't cached, as they may well not happen again
+        _cache.put(key, {'points': result.points, 'turns': result.turns, 'winner': result.winner, 'time': result.time,
+                         'timings': result.timings})
+    return result, game
+
+
+def drain_metrics(result: GameResult) -> GameResult:
+    """Sends the metrics of the worker back with the result, as nothing could export them from the worker"""
+    result.metrics = metrics.REGISTRY.drain()
+    return result
+
+
+def merge_metrics(result: GameResult):
+    """Adds the metrics a worker sent with the result to those of this process (so they can be served from it)"""
+    if result.metrics is not None:
+        metrics.REGISTRY.merge(result.metrics)
+        result.metrics = None
+
+
+# every worker keeps the maps it generates for the seed it is playing, as the other games on the seed (from the other
+# side, or with params that don't change the map) can reuse them
+_layouts: dict[tuple, MapLayout] = {}  # by map_key
+_layouts_seed: Optional[int] = None
+
+
+def play_in_worker(task: GameTask, params: GameParams) -> GameResult:
+    """Plays the game of the task in a worker, reusing the map of an earlier game on the same seed if there was one,
+    and sends the metrics of the worker back with the result"""
+    global _layouts_seed
+    if task.seed != _layouts_seed:  # the maps of any other seed won't be needed again
+        _layouts.clear()
+        _layouts_seed = task.seed
+    key = map_key(params)
+    result, game = play_game(task, params, _layouts.get(key))
+    if game is not None:
+        _layouts.setdefault(key, game.layout)
+    return drain_metrics(result)
+
+
+def play_task(task: GameTask) -> GameResult:
+    return play_in_worker(task, _params[task.preset])
+
+
+def make_tasks(agents: list[str], seeds: range, presets: list[str]) -> list[GameTask]:
+    """Every pair of agents plays every seed with every preset, once from each side"""
+    return [GameTask(seed, preset, *sides) for seed in seeds for preset in presets
+            for a, b in combinations(agents, 2) for sides in ((a, b), (b, a))]
+
+
+def run_tournament(agents: list[str], seeds: range, presets: list[str], workers: Optional[int] = None,
+                   cache_dir: Optional[str] = CACHE_DIR, record_timings: bool = False, profile: Optional[str] = None,
+                   profile_dir: str = 'profiles') -> list[GameResult]:
+    """Plays all the games of the tournament on a pool of workers (one per core by default)
+
+    Games already in the ResultCache in cache_dir are not played again, unless cache_dir is None.
+    If record_timings is set, every result has the timings of its game (see Game.timings).
+    If profile is given (one of PROFILERS), the agents are profiled and the profiles of every game are saved in
+    profile_dir (see aggregate_profiles to add them up).
+    """
+    agents = list(dict.fromkeys(agents))
+    tasks = make_tasks(agents, seeds, presets)
+    results = []
+    workers = workers or os.cpu_count()
+    # the games of a seed are sent to a worker together, so that it can reuse their maps (they are only split up when
+    # there are fewer seeds than workers, so that every worker has something to do)
+    chunksize = max(min(len(tasks) // max(len(seeds), 1), len(tasks) // workers), 1)
+    with multiprocessing.Pool(workers, init_worker, (agents, presets, cache_dir, record_timings, profile, profile_dir,
+                                                     metrics.enabled)) as pool:
+        for result in pool.imap_unordered(play_task, tasks, chunksize=chunksize):
+            merge_metrics(result)
+            results.append(result)
+            if result.error is not None:
+                print(f"Game {result.task} crashed:\n{result.error}")
+            if len(results) % 100 == 0 or len(results) == len(tasks):
+                print(f"{len(results)}/{len(tasks)} games played")
+    # results come back in whatever order they finish, the tasks (being copies) are matched by their fields
+    index = {astuple(task): i for i, task in enumerate(tasks)}
+    results.sort(key=lambda r: index[astuple(r.task)])
+    return results
+
+
+def summarise(results: list[GameResult]) -> list[dict[str, Any]]:
+    """The wins and score margins of every pair of agents with every preset, from the side of the first agent listed
+    (player_1 in the first game of the pair)"""
+    summary: dict[tuple[str, frozenset[str]], dict[str, Any]] = {}
+    for r in results:
+        t = r.task
+        s = summary.setdefault((t.preset, frozenset((t.player_1, t.player_2))),
+                               {'preset': t.preset, 'agent_a': t.player_1, 'agent_b': t.player_2, 'games': 0,
+                                'wins_a': 0, 'wins_b': 0, 'draws': 0, 'errors': 0, 'margin': 0})
+        if r.error is not None:
+            s['errors'] += 1
+            continue
+        a = 1 if t.player_1 == s['agent_a'] else 2  # the side agent_a played on
+        s['games'] += 1
+        s['wins_a' if r.winner == a else 'wins_b' if r.winner else 'draws'] += 1
+        s['margin'] += r.points[a - 1] - r.points[2 - a]
+    for s in summary.values():
+        s['margin'] = s['margin'] / s['games'] if s['games'] else 0  # the mean margin of agent_a
+    return list(summary.values())
+
+
+def aggregate_profiles(results: list[GameResult], profile_dir: str) -> dict[str, str]:
+    """Adds up the profiles of every agent over all its games, saving them in profile_dir as <agent>.prof (the
+    returned paths)"""
+    paths: dict[str, list[str]] = {}
+    for r in results:
+        if r.profiles is not None:
+            for agent, path in zip((r.task.player_1, r.task.player_2), r.profiles):
+                paths.setdefault(agent, []).append(path)
+    saved = {}
+    for agent, agent_paths in paths.items():
+        saved[agent] = os.path.join(profile_dir, f"{file_name(agent)}.prof")
+        aggregate(agent_paths).dump_stats(saved[agent])
+    return saved
+
+
+def save_results(path: str, results: list[GameResult], summary: list[dict[str, Any]]):
+    with open(path, 'w') as f:
+        json.dump({'summary': summary, 'games': [asdict(r) for r in results]}, f, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays every pair of agents against each other on a range of seeds")
+    parser.add_argument('agents', nargs='+', help="agent classes, as module:Class (e.g. player:Player)")
+    parser.add_argument('--seeds', type=int, nargs=2, default=(0, 100), metavar=('START', 'STOP'),
+                        help="the range of seeds to play (default: 0 100)")
+    parser.add_argument('--presets', nargs='+', default=['default'],
+                        help=f"GameParams presets ({', '.join(PRESETS)}) or JSON files of GameParams fields")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--out', default='tournament.json', help="where to save the results")
+    parser.add_argument('--cache', default=CACHE_DIR, help="the directory of the cache of game results")
+    parser.add_argument('--no-cache', action='store_true', help="play every game, even if its result is cached")
+    parser.add_argument('--timings', action='store_true',
+                        help="record how long the engine and the agents take (and show the share of each)")
+    parser.add_argument('--profile', choices=list(PROFILERS), default=None,
+                        help="profile the moves of the agents (every game is played, whether it is cached or not)")
+    parser.add_argument('--profile-dir', default='profiles', help="where to save the profiles")
+    parser.add_argument('--profile-limit', type=int, default=15, help="how many functions of each agent to show")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve the metrics of every game (see metrics.py) on this port while the games are played")
+    args = parser.parse_args()
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+
+    start = perf_counter()
+    results = run_tournament(args.agents, range(*args.seeds), args.presets, args.workers,
+                             None if args.no_cache else args.cache, args.timings, args.profile, args.profile_dir)
+    summary = summarise(results)
+    save_results(args.out, results, summary)
+    cached = sum(r.cached for r in results)
+    print(f"Played {len(results) - cached} games ({cached} more were cached) in {perf_counter() - start:.1f}s, "
+          f"results saved to {args.out}")
+    for s in summary:
+        print(f"[{s['preset']}] {s['agent_a']} vs {s['agent_b']}: {s['wins_a']}-{s['wins_b']}-{s['draws']} "
+              f"(mean margin {s['margin']:+.1f}, {s['errors']} crashed)")
+    if args.timings:
+        engine = sum(r.timings['engine']['total'] for r in results if r.timings is not None)
+        agents = sum(r.timings['agents']['total'] for r in results if r.timings is not None)
+        if engine + agents > 0:
+            print(f"The engine took {engine:.1f}s ({engine / (engine + agents):.0%}), the agents {agents:.1f}s")
+    if args.profile is not None:
+        for agent, path in aggregate_profiles(results, args.profile_dir).items():
+            print(f"Profile of {agent} over all its games (saved to {path}):")
+            pstats.Stats(path).strip_dirs().sort_stats('tottime').print_stats(args.profile_limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# the modules of the dev-kit are all at the top level of src, and import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def play_logged(tmp_path, monkeypatch):
+    """Plays short games logged to tmp_path/logs, play_logged(game_id, **kwargs) returns the path of the log, the
+    kwargs are those of Game.play (e.g. log_format)"""
+    import game
+    from params import GameParams, StartParams
+    from player import Player
+
+    monkeypatch.setattr(game, 'LOG_DIR', str(tmp_path / 'logs'))
+    os.makedirs(game.LOG_DIR)
+
+    def play(game_id: int, seed: int = 1, length: int = 6, **kwargs) -> str:
+        params = GameParams(start=StartParams(min_len=length, max_len=length))
+        game.Game(game_id, Player, Player, seed=seed, game_params=params).play(log=True, **kwargs)
+        return os.path.join(game.LOG_DIR, f"game_{game_id}.plog")
+
+    return play
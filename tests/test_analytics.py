@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pytest
+
+import game
+from analytics import Dataset, Table
+from game import Game
+from params import GameParams, StartParams
+from player import Player
+
+
+@pytest.fixture
+def table() -> Table:
+    return Table({'game': np.array([1, 0, 1, 0, 1]), 'frame': np.array([0, 0, 1, 1, 2]),
+                  'points': np.array([5, 2, 9, 4, 7])})
+
+
+def test_filter_by_value_and_bounds(table):
+    assert table.filter(game=1)['points'].tolist() == [5, 9, 7]
+    assert table.filter(min_points=5, max_frame=1)['points'].tolist() == [5, 9]
+    assert table.filter(table['frame'] > 0, game=0)['points'].tolist() == [4]
+    with pytest.raises(KeyError):
+        table.filter(turn=1)
+
+
+def test_sort_and_head(table):
+    assert table.sort('game', 'frame', descending=True)['points'].tolist() == [7, 9, 5, 4, 2]
+    assert len(table.head(2)) == 2 and len(table.head(10)) == 5
+
+
+def test_group_aggregations(table):
+    grouped = table.group('game', games=('frame', 'count'), total=('points', 'sum'), points='mean',
+                          best=('points', 'max'), spread=('points', 'std'), median=('points', 'median'),
+                          last=('points', 'last'))
+    assert grouped.rows() == [
+        {'game': 0, 'games': 2, 'total': 6.0, 'points': 3.0, 'best': 4, 'spread': 1.0, 'median': 3.0, 'last': 4},
+        {'game': 1, 'games': 3, 'total': 21.0, 'points': 7.0, 'best': 9, 'spread': pytest.approx(np.std([5, 9, 7])),
+         'median': 7.0, 'last': 7},
+    ]
+    assert table.group(total=('points', 'sum')).rows() == [{'total': 27.0}]  # a single group
+    assert len(table.filter(game=2).group('game', n=('frame', 'count'))) == 0
+    with pytest.raises(ValueError):
+        table.group('game', points='mode')
+
+
+def test_join_by_unique_key(table):
+    games = Table({'game': np.array([1, 0]), 'map_w': np.array([48, 52])})
+    assert table.join(games, 'game', 'map_w')['map_w'].tolist() == [48, 52, 48, 52, 48]
+
+
+def test_dataset_build(tmp_path, monkeypatch):
+    monkeypatch.setattr(game, 'LOG_DIR', str(tmp_path / 'logs'))
+    os.makedirs(game.LOG_DIR)
+    for game_id in (1, 2):
+        Game(game_id, Player, Player, seed=game_id,
+             game_params=GameParams(start=StartParams(min_len=6, max_len=6))).play(log=True)
+    dataset = Dataset(str(tmp_path / 'dataset'))
+    assert dataset.build([game.LOG_DIR], workers=1) == 2
+    assert dataset.games['game'].tolist() == [0, 1] and dataset.games['frames'].tolist() == [7, 7]
+    assert dataset.frames.group('game', n=('frame', 'count'))['n'].tolist() == [7, 7]
+    last = dataset.frames['frame'] == 6
+    assert (dataset.frames['p1_move_us'][~last] >= 0).all() and (dataset.frames['p1_move_us'][last] == -1).all()
+    assert len(dataset.moves) == dataset.frames['moves'].sum()
+    assert dataset.build([game.LOG_DIR], workers=1) == 0  # nothing changed
+
+    os.remove(os.path.join(game.LOG_DIR, 'game_2.plog'))
+    assert Dataset(str(tmp_path / 'dataset')).build([game.LOG_DIR], workers=1) == 0
+    assert len(Dataset(str(tmp_path / 'dataset')).games) == 1
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from time import sleep
+
+import pytest
+
+import metrics
+from bench import Scenario, advance, bench_attack_all, bench_step, compare, measure
+from game import Game
+from player import Player
+
+
+def results(**mins: float) -> dict:
+    return {'results': {key: {'median': t, 'min': t, 'runs': 5} for key, t in mins.items()}}
+
+
+def test_compare_flags_only_regressions_beyond_the_threshold(capsys):
+    old = results(a=1.0, b=1.0, c=1.0, gone=1.0)
+    new = results(a=1.05, b=1.2, c=0.5, added=1.0)
+    assert compare(old, new, threshold=0.1) == ['b']
+    assert compare(old, new, threshold=0.01) == ['a', 'b']
+    out = capsys.readouterr().out
+    assert 'added' not in out and 'gone' not in out  # only benchmarks in both runs are compared
+
+
+def test_measure_leaves_out_the_setup():
+    times = measure(lambda _: None, lambda: sleep(0.01), repeat=3)
+    assert len(times) == 3 and max(times) < 0.01
+
+
+@pytest.fixture(scope='module')
+def scenario() -> Scenario:
+    return Scenario('tiny', advance(Game(0, Player, Player, seed=1), lambda g: g.move_num >= 3))
+
+
+def test_benchmarks_leave_the_scenario_alone(scenario):
+    before = scenario.game.move_num, [e.health for e in scenario.game.p2_inv.entities]
+    assert len(bench_attack_all(scenario, 2)['attack_all']) == 2
+    assert (scenario.game.move_num, [e.health for e in scenario.game.p2_inv.entities]) == before
+
+
+def test_bench_step_times_every_phase_and_move(scenario, monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', False)  # bench_step enables them, this puts them back afterwards
+    timings = bench_step(scenario, 2, turns=2)
+    assert len(timings['step']) == 2
+    assert {'step.move.1', 'step.move.2', 'step.phase.movement', 'step.phase.attacks'} <= set(timings)
+    assert scenario.game.move_num == 3
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import catalogue
+from catalogue import Catalogue
+
+
+@pytest.fixture
+def log_dir(play_logged) -> str:
+    """A directory of logged games, whose ids are 1, 2 and 10"""
+    for game_id in (1, 2, 10):
+        path = play_logged(game_id, seed=game_id, length=4 + game_id)
+    return os.path.dirname(path)
+
+
+def test_games_are_added_as_they_are_logged(log_dir):
+    with Catalogue(log_dir) as cat:
+        games = cat.games()
+    assert [g['game_id'] for g in games] == ['1', '2', '10']  # in order of id
+    assert [g['game_length'] for g in games] == [5, 6, 14]
+    assert all(g['winner'] == (1 if g['p1_points'] > g['p2_points'] else 2 if g['p2_points'] > g['p1_points'] else 0)
+               for g in games)
+
+
+def test_filters_and_pages(log_dir):
+    with Catalogue(log_dir) as cat:
+        assert [g['game_id'] for g in cat.games(min_game_length=6)] == ['2', '10']
+        assert [g['game_id'] for g in cat.games(min_game_length=6, max_game_length=10)] == ['2']
+        assert [g['game_id'] for g in cat.games(seed=10)] == ['10']
+        assert [g['game_id'] for g in cat.games(limit=2, offset=1)] == ['2', '10']
+        assert cat.count(min_game_length=6) == 2 and cat.count() == 3
+        with pytest.raises(ValueError):
+            cat.games(min_turns=1)
+
+
+def test_refresh_follows_the_log_directory(log_dir):
+    os.remove(os.path.join(log_dir, 'catalogue.sqlite'))  # games logged elsewhere are found by refresh instead
+    shutil.copy(os.path.join(log_dir, 'game_2.plog'), os.path.join(log_dir, 'game_7.plog'))  # without a summary
+    os.remove(os.path.join(log_dir, 'game_1.plog'))
+    with Catalogue(log_dir) as cat:
+        cat.refresh()
+        games = {g['game_id']: g for g in cat.games()}
+        assert list(games) == ['2', '7', '10']
+        assert {k: v for k, v in games['7'].items() if k not in ('game_id', 'mtime')} == \
+               {k: v for k, v in games['2'].items() if k not in ('game_id', 'mtime')}
+        os.remove(os.path.join(log_dir, 'game_7.plog'))
+        cat.refresh()
+        assert cat.count() == 2
+
+
+def test_logs_still_being_written_are_reported_once(log_dir, capsys):
+    with open(os.path.join(log_dir, 'game_3.plog'), 'w') as f:
+        f.write('{"frames": [{"info": ')  # a JSON log can't be read until the game is over
+    with Catalogue(log_dir) as cat:
+        for _ in range(3):
+            cat.refresh()
+        assert cat.count() == 3
+        assert capsys.readouterr().out.count("Error reading game 3") == 1
+
+
+def test_catalogue_does_not_need_the_engine():
+    code = "import sys, catalogue; assert 'game' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(catalogue.__file__), check=True)
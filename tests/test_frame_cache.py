@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from frame_cache import CachedGameLog, FrameCache
+from game_log import GameLog
+
+
+def set_used(cache: FrameCache, key: str, when: int):
+    os.utime(os.path.join(cache.directory, key), ns=(when, when))
+
+
+def test_least_recently_used_chunks_are_evicted_past_the_budget(tmp_path):
+    cache = FrameCache(str(tmp_path), 1000)
+    for when, key in enumerate('abc', 1):
+        cache.put(key, bytes(300))
+        set_used(cache, key, when)
+    assert sorted(os.listdir(tmp_path)) == ['a', 'b', 'c']  # 900 bytes, within the budget
+    assert cache.get('a') is not None  # a is now the most recently used
+    cache.put('d', bytes(300))
+    # 1200 bytes, so the oldest chunks are evicted until there are at most 3/4 of the budget left
+    assert sorted(os.listdir(tmp_path)) == ['a', 'd']
+    assert cache.get('b') is None
+
+
+def test_chunks_bigger_than_the_budget_are_not_cached(tmp_path):
+    cache = FrameCache(str(tmp_path), 100)
+    cache.put('big', bytes(101))
+    assert cache.get('big') is None and os.listdir(tmp_path) == []
+
+
+@pytest.fixture
+def log_path(play_logged) -> str:
+    return play_logged(1, length=40)  # several chunks
+
+
+def test_cached_frames_are_those_of_the_log(log_path, tmp_path):
+    log = GameLog.load(log_path)
+    cached = CachedGameLog(log, 'game_1', FrameCache(str(tmp_path / 'frames'), 1 << 24))
+    assert len(cached) == len(log)
+    for n in (0, 31, 32, 40, 5):
+        assert cached.frame_bytes(n) == log.frame_bytes(n)
+    assert cached.frame(40) == log.frame_arrays(40).to_dict()
+    assert sorted(os.listdir(tmp_path / 'frames')) == ['game_1_0', 'game_1_1']
+    with pytest.raises(IndexError):
+        cached.frame_bytes(41)
+
+
+def test_readers_share_chunks(log_path, tmp_path, monkeypatch):
+    first = CachedGameLog(GameLog.load(log_path), 'game_1', FrameCache(str(tmp_path / 'frames'), 1 << 24))
+    expected = [first.frame_bytes(n) for n in range(len(first))]
+
+    def decode(frame_num: int) -> bytes:
+        raise AssertionError("the frame should have come from the cache")
+
+    log = GameLog.load(log_path)
+    monkeypatch.setattr(log, 'frame_bytes', decode)
+    second = CachedGameLog(log, 'game_1', FrameCache(str(tmp_path / 'frames'), 1 << 24))  # as another process would
+    assert [second.frame_bytes(n) for n in range(len(log))] == expected
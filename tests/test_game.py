@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import pytest
+
+from game import AgentClock
+from outcome import winner
+from params import TimeLimits
+
+
+def test_clock_gains_the_increment_and_loses_the_move_time():
+    clock = AgentClock(TimeLimits(MAIN=10, INCREMENT=2, DELAY=1))
+    clock.add_move(1, 0.5)
+    clock.add_move(2, 3)
+    assert clock.remaining == pytest.approx(10.5)
+    assert clock.timeouts == []
+
+
+def test_move_times_out_only_beyond_the_clock_and_delay():
+    clock = AgentClock(TimeLimits(MAIN=5, INCREMENT=0, DELAY=1))
+    clock.add_move(1, 5.5)  # within the delay
+    assert clock.timeouts == []
+    clock.add_move(2, 1)  # the clock has -0.5 left, so this is beyond even the delay
+    assert clock.timeouts == [2]
+
+
+def test_constructor_timeout_is_turn_0():
+    clock = AgentClock(TimeLimits(INIT=2, DELAY=1))
+    clock.add_init(2.5)
+    assert clock.timeouts == []
+    clock.add_init(3.5)
+    assert clock.timeouts == [0]
+
+
+def test_clock_summary():
+    clock = AgentClock(TimeLimits(MAIN=10, INCREMENT=0))
+    clock.add_init(0.25)
+    assert clock.summary() == {'init': 0.25, 'clock': 10, 'timeouts': []}  # no moves yet
+    for elapsed in (1, 2, 3):
+        clock.add_move(1, elapsed)
+    summary = clock.summary()
+    assert summary['p50'] == 2 and summary['max'] == 3 and summary['total'] == 6 and summary['clock'] == 4
+
+
+def test_winner():
+    assert winner((3, 2)) == 1
+    assert winner((2, 3)) == 2
+    assert winner((2, 2)) == 0
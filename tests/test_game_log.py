@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import os
+import shutil
+
+import pytest
+
+import game
+import game_log
+from game import Game
+from game_log import GameLog, JsonGameLog, LOG_WRITERS, index_path
+from params import GameParams, StartParams
+from player import Player
+from replay import ReplayDesyncError, ReplayGameLog
+
+
+GAME_LENGTH = 40  # long enough for several chunks of a compressed log and checksums of an action log
+PARAMS = GameParams(start=StartParams(min_len=GAME_LENGTH, max_len=GAME_LENGTH))
+# every format, with keyframes and deltas for those that have them
+FORMATS: list[tuple[str, int]] = [(name, 0) for name in LOG_WRITERS] + [('json', 4), ('jsonl', 4)]
+TIMED = ('agent_times', 'clocks')  # what differs between two plays of the same game
+UNTIMED_INFO = ('game_id', 'keyframe_interval', 'agent_times')
+
+
+def untimed(frame: dict) -> dict:
+    return {k: v for k, v in frame.items() if k not in TIMED}
+
+
+@pytest.fixture(scope='module')
+def logs(tmp_path_factory) -> dict[tuple[str, int], str]:
+    """The same game, logged in every format"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(game, 'LOG_DIR', str(tmp_path_factory.mktemp('logs')))
+        paths = {}
+        for game_id, (log_format, keyframe_interval) in enumerate(FORMATS):
+            Game(game_id, Player, Player, seed=3, game_params=PARAMS).play(True, log_format=log_format,
+                                                                           keyframe_interval=keyframe_interval)
+            paths[log_format, keyframe_interval] = os.path.join(game.LOG_DIR, f"game_{game_id}.plog")
+        return paths
+
+
+@pytest.fixture(scope='module')
+def reference(logs) -> GameLog:
+    return GameLog.load(logs['json', 0])
+
+
+@pytest.mark.parametrize('log_format,keyframe_interval', FORMATS)
+def test_every_format_has_the_frames_of_the_json_log(logs, reference, log_format, keyframe_interval):
+    log = GameLog.load(logs[log_format, keyframe_interval])
+    assert len(log) == len(reference) == GAME_LENGTH + 1
+    assert ({k: v for k, v in log.info.items() if k not in UNTIMED_INFO} ==
+            {k: v for k, v in reference.info.items() if k not in UNTIMED_INFO})
+    for n in range(len(log)):
+        assert untimed(log.frame(n)) == untimed(reference.frame(n)), f"frame {n}"
+    assert log.frame_arrays(5).state_checksum() == reference.frame_arrays(5).state_checksum()
+
+
+@pytest.mark.parametrize('log_format', ['json', 'jsonl'])
+def test_delta_frames_in_any_order(logs, reference, log_format):
+    order = [37, 38, 39, 12, 13, 3, 0, 40, 39, 21]  # forwards within a keyframe, backwards and across keyframes
+    log = GameLog.load(logs[log_format, 4])
+    assert 'delta' in log.raw_frame(1) and 'delta' not in log.raw_frame(4)
+    for n in order:
+        assert log.frame(n)['map'] == reference.frame(n)['map'], f"frame {n}"
+
+
+def test_json_index_is_saved_and_rebuilt_when_the_log_changes(logs, tmp_path):
+    path = str(tmp_path / 'game_1.plog')
+    shutil.copy(logs['json', 4], path)
+    log = JsonGameLog(path)
+    assert os.path.exists(index_path(path))
+    assert JsonGameLog.load_index(path) == (log.info, log.starts, log.ends)
+    with open(path, 'ab') as f:
+        f.write(b' ')
+    assert JsonGameLog.load_index(path) is None  # made before the log changed
+    assert JsonGameLog(path).starts == log.starts
+
+
+@pytest.mark.parametrize('window', [64, 1000, 1 << 16])
+def test_json_index_with_small_windows(logs, tmp_path, monkeypatch, window):
+    expected = JsonGameLog(logs['json', 4])
+    path = str(tmp_path / 'game_1.plog')
+    shutil.copy(logs['json', 4], path)  # without its index
+    monkeypatch.setattr(game_log, 'INDEX_WINDOW', window)  # smaller than a single frame, down to a few frames
+    log = JsonGameLog(path)
+    assert (log.info, log.starts, log.ends) == (expected.info, expected.starts, expected.ends)
+
+
+def write_unfinished(path: str, log_format: str, frames: int, cut: int) -> str:
+    """Writes the first frames of the game to a log without finalizing it, as if the game were still being played,
+    with the last cut bytes of what was written left out (as if they were still being written)"""
+    g = Game(0, Player, Player, seed=3, game_params=PARAMS)
+    writer = LOG_WRITERS[log_format](path, g.log_info())
+    for _ in range(frames):
+        frame = g.capture_frame()
+        frame.set_events(*g.step())
+        writer.write_frame(frame)
+    writer.flush()
+    with open(path, 'rb') as f:
+        data = f.read()
+    writer.close(g.log_info())
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) - cut])
+    return path
+
+
+# compressed logs only write complete chunks (of 32 frames), so the 3 frames after the first chunk are never written
+@pytest.mark.parametrize('log_format,cut,readable', [('jsonl', 0, 35), ('jsonl', 3, 34), ('binary', 3, 34),
+                                                     ('zlib', 0, 32), ('zlib', 3, 0), ('lzma', 0, 32)])
+def test_unfinished_logs(reference, tmp_path, log_format, cut, readable):
+    """Only frames that were completely written can be read"""
+    log = GameLog.load(write_unfinished(str(tmp_path / 'game_0.plog'), log_format, 35, cut))
+    assert len(log) == readable and log.info['game_length'] == readable - 1
+    for n in sorted({0, readable // 2, readable - 1}) if readable else []:
+        assert untimed(log.frame(n)) == untimed(reference.frame(n))
+
+
+def test_replay_rebuilds_frames_from_snapshots(logs, reference):
+    log = GameLog.load(logs['actions', 0])
+    assert isinstance(log, ReplayGameLog)
+    assert sorted(log.checksums) == [0, 20, 40]
+    for n in (30, 10, 25, 40):  # backwards from the nearest snapshot
+        assert untimed(log.frame(n)) == untimed(reference.frame(n))
+    with pytest.raises(IndexError):
+        log.frame(41)
+
+
+def test_replay_detects_desyncs(logs):
+    log = ReplayGameLog(logs['actions', 0])
+    log.actions[2] = [[], []]  # as if neither player had moved on the third turn
+    log.frame(19)
+    with pytest.raises(ReplayDesyncError):
+        log.frame(20)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import math
+
+import pytest
+
+from match import SPRT, Match, crashed, elo_to_score, score_to_elo
+from tournament import GameResult
+
+
+def play_pair(match: Match, winners: tuple[int, int]):
+    """Plays the next pair of the match, where winners are those of both games (1, 2 or 0 for a draw)"""
+    for task, winner in zip(match.next_pair(), winners):
+        match.add_result(GameResult(task, winner=winner))
+
+
+def test_elo_score_round_trip():
+    assert elo_to_score(0) == 0.5
+    assert elo_to_score(400) == pytest.approx(10 / 11)
+    for elo in (-300, -20, 0, 5, 150):
+        assert score_to_elo(elo_to_score(elo)) == pytest.approx(elo)
+    assert math.isfinite(score_to_elo(1))  # clamped
+
+
+def test_sprt_bounds():
+    lower, upper = SPRT(alpha=0.05, beta=0.05).bounds
+    assert upper == pytest.approx(math.log(19)) and lower == pytest.approx(-math.log(19))
+
+
+def test_pentanomial_counts_pairs_from_agent_a_side():
+    match = Match('a', 'b')
+    play_pair(match, (1, 2))  # a wins both, first as player 1 then as player 2
+    play_pair(match, (1, 1))  # one each
+    play_pair(match, (0, 1))  # a draws then loses
+    play_pair(match, (2, 1))  # b wins both
+    assert match.pentanomial == [1, 1, 1, 0, 1]
+    assert match.pairs == 4
+
+
+def test_crashed_games_throw_the_pair_away():
+    match = Match('a', 'b')
+    first, second = match.next_pair()
+    match.add_result(crashed(first, RuntimeError('boom')))
+    assert match.pairs == 0 and match.errors == 0  # waiting for the other game
+    match.add_result(GameResult(second, winner=1))
+    assert match.pairs == 0 and match.errors == 1 and not match.pending
+
+
+def test_no_decision_before_min_pairs():
+    match = Match('a', 'b', sprt=SPRT(min_pairs=8))
+    for _ in range(7):
+        play_pair(match, (1, 2))
+    assert match.decision is None and match.llr() > match.sprt.bounds[1]
+    play_pair(match, (1, 2))
+    assert match.decision == 'H1'
+
+
+def test_sprt_accepts_h0_for_equal_agents():
+    match = Match('a', 'b', sprt=SPRT(elo0=0, elo1=20))
+    while match.decision is None and match.pairs < 500:
+        play_pair(match, (1, 1))  # the seed always decides, so they are exactly as strong
+    assert match.decision == 'H0'
+    elo, low, high = match.elo()
+    assert elo == pytest.approx(0, abs=1e-6) and low < 0 < high
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Metric, Registry, TimingStats, NULL_STEP_TIMER, step_timer
+
+
+def test_metric_is_abstract():
+    with pytest.raises(TypeError):
+        Metric('m', "doc")
+
+
+def test_counter_render():
+    c = Counter('c_total', "doc", ('kind',))
+    c.inc(kind='a')
+    c.inc(2, kind='a')
+    c.inc(kind='b')
+    assert c.render() == ['# HELP c_total doc', '# TYPE c_total counter', 'c_total{kind="a"} 3', 'c_total{kind="b"} 1']
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram('h', "doc", buckets=(1, 2))
+    for value in (0.5, 1.5, 1.5, 3):
+        h.observe(value)
+    assert h.samples() == ['h_bucket{le="1"} 1', 'h_bucket{le="2"} 3', 'h_bucket{le="+Inf"} 4', 'h_sum 6.5',
+                           'h_count 4']
+
+
+def make_registry() -> tuple[Registry, Counter, Gauge, Histogram]:
+    registry = Registry()
+    return (registry, registry.add(Counter('c', "doc", ('kind',))), registry.add(Gauge('g', "doc")),
+            registry.add(Histogram('h', "doc", buckets=(1,))))
+
+
+def test_drain_empties_the_registry():
+    registry, counter, gauge, histogram = make_registry()
+    counter.inc(kind='a')
+    histogram.observe(0.5)
+    drained = registry.drain()
+    assert set(drained) == {'c', 'h'}  # metrics without values aren't sent at all
+    assert counter.values == {} and histogram.values == {}
+    assert registry.drain() == {}
+
+
+def test_merge_adds_counters_and_histograms_and_replaces_gauges():
+    worker, w_counter, w_gauge, w_histogram = make_registry()
+    parent, p_counter, p_gauge, p_histogram = make_registry()
+    p_counter.inc(2, kind='a')
+    p_gauge.set(10)
+    p_histogram.observe(0.5)
+    for _ in range(2):  # two games
+        w_counter.inc(kind='a')
+        w_counter.inc(kind='b')
+        w_gauge.set(5)
+        w_histogram.observe(2)
+        parent.merge(worker.drain())
+    assert p_counter.values == {('a',): 4, ('b',): 2}
+    assert p_gauge.values == {(): 5}
+    assert p_histogram.values == {(): ([1, 2], [4.5])}
+
+
+def test_timing_stats_summary():
+    stats = TimingStats()
+    for step in range(1, 5):
+        stats.add({'mining': step * 0.001, 'move_1': 0.01, 'move_2': 0.02})
+    summary = stats.summary()
+    assert summary['mining'] == pytest.approx({'total': 0.01, 'mean': 0.0025, 'p50': 0.0025, 'p95': 0.00385,
+                                               'max': 0.004})
+    assert summary['engine']['total'] == pytest.approx(0.01)
+    assert summary['agents']['total'] == pytest.approx(0.12)
+
+
+def test_step_timer_records_without_observing():
+    timer = step_timer(record=True)
+    timer.agent(1)
+    timer.phase('mining')
+    assert set(timer.times) == {'move_1', 'mining'}
+    assert step_timer() is NULL_STEP_TIMER  # metrics aren't enabled in the tests
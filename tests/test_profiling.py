@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import sys
+from time import perf_counter
+
+import pytest
+
+from profiling import MOVES, NULL_PROFILER, CProfiler, SamplingProfiler, aggregate, profile_path
+
+
+def busy(seconds: float):
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        pass
+
+
+def move(profiler, seconds: float = 0.02):
+    with profiler:
+        busy(seconds)
+
+
+def test_sampling_profiler_times_the_moves():
+    profiler = SamplingProfiler(interval=0.001)
+    switch_interval = sys.getswitchinterval()
+    for _ in range(3):
+        move(profiler)
+        assert sys.getswitchinterval() == switch_interval  # only lowered during a move
+    profiler.close()
+    stats = profiler.stats().stats
+    calls, _, _, total, _ = stats[MOVES]
+    assert calls == 3 and total == pytest.approx(0.06, rel=0.5)
+    busy_key = next(key for key in stats if key[2] == 'busy')
+    assert stats[busy_key][0] > 0 and MOVES in stats[busy_key][4]  # sampled, and called by the move
+
+
+def test_closing_stops_the_sampling_thread():
+    profiler = SamplingProfiler()
+    move(profiler, 0.001)
+    thread = profiler.sampler
+    assert thread.is_alive()
+    profiler.close()
+    assert not thread.is_alive()
+    move(profiler, 0.001)  # nothing is profiled once it's closed
+    assert profiler.sampler is None and profiler.moves == 1
+
+
+def test_cprofiler_only_profiles_the_moves():
+    profiler = CProfiler()
+    busy(0.001)
+    move(profiler, 0.001)
+    stats = profiler.stats().stats
+    assert [key for key in stats if key[2] == 'busy'] and not [key for key in stats if key[2] == 'move']
+
+
+def test_null_profiler_has_no_stats():
+    move(NULL_PROFILER, 0)
+    assert NULL_PROFILER.stats().stats == {}
+
+
+def test_aggregate_adds_saved_profiles(tmp_path):
+    paths = []
+    for i, n in enumerate((2, 3)):
+        profiler = SamplingProfiler()
+        for _ in range(n):
+            move(profiler, 0.005)
+        profiler.close()
+        paths.append(profile_path(str(tmp_path / f"game_{i}.plog"), 1))
+        profiler.save(paths[-1])
+    assert paths[0].endswith('game_0.p1.prof')
+    assert aggregate(paths).stats[MOVES][0] == 5
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import importlib
+import sys
+
+from params import GameParams, TimeLimits
+from result_cache import ENGINE_MODULES, ResultCache, agent_version, engine_version, game_key
+
+
+def key(**changes) -> str:
+    inputs = {'player_1': 'a', 'player_2': 'b', 'seed': 1, 'params': GameParams(), 'time_limits': TimeLimits(),
+              'engine': 'e'} | changes
+    return game_key(**inputs)
+
+
+def test_game_key_depends_on_every_input():
+    assert key() == key()
+    params = GameParams()
+    params.turrets.damage += 1
+    others = [key(player_1='c'), key(player_1='b', player_2='a'), key(seed=2), key(params=params),
+              key(time_limits=TimeLimits(MAIN=60)), key(engine='f')]
+    assert len({key(), *others}) == len(others) + 1
+
+
+def test_engine_version_is_stable():
+    assert engine_version() == engine_version()
+
+
+def test_agent_version_follows_the_modules_it_uses(tmp_path, monkeypatch):
+    (tmp_path / 'cache_helper.py').write_text("def plan():\n    return 1\n")
+    (tmp_path / 'cache_agent.py').write_text("from cache_helper import plan\n\nclass CacheAgent:\n    pass\n")
+    (tmp_path / 'cache_unused.py').write_text("x = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    agent = importlib.import_module('cache_agent').CacheAgent
+    version = agent_version(agent)
+    (tmp_path / 'cache_unused.py').write_text("x = 2\n")
+    assert agent_version(agent) == version  # not imported by the agent
+    (tmp_path / 'cache_helper.py').write_text("def plan():\n    return 2\n")
+    assert agent_version(agent) != version
+    for name in ('cache_agent', 'cache_helper'):
+        del sys.modules[name]
+
+
+def test_result_cache_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    assert cache.get('k') is None
+    cache.put('k', {'points': [3, 1], 'winner': 1})
+    assert ResultCache(str(tmp_path / 'cache')).get('k') == {'points': [3, 1], 'winner': 1}  # shared by directory
+    (tmp_path / 'cache' / 'broken.json').write_text('{"points"')
+    assert cache.get('broken') is None  # a partly written file counts as a miss
+    assert [p.name for p in (tmp_path / 'cache').iterdir() if p.suffix == '.tmp'] == []
+
+
+def test_engine_modules_are_those_game_uses():
+    import game
+    used = {getattr(value, '__module__', None) or getattr(value, '__name__', None) for value in vars(game).values()}
+    assert set(ENGINE_MODULES) <= used | {'game'}
+    assert 'catalogue' not in ENGINE_MODULES and 'log_codec' not in ENGINE_MODULES
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+import server
+from game_log import GameLog
+from live import LIVE_FRAME
+
+
+@pytest.fixture
+def client(play_logged, monkeypatch):
+    log_path = play_logged(1)
+    monkeypatch.setitem(server.app.config, 'GAME_LOGS', os.path.dirname(log_path))
+    monkeypatch.setitem(server.app.config, 'FRAME_CACHE_BYTES', 0)
+    return server.app.test_client()
+
+
+def window(client, **args) -> tuple[int, list[int]]:
+    """The status of a window request, and the numbers of the frames streamed"""
+    version = client.get('/api/1/info').get_json()['version']
+    response = client.get(f"/api/1/{version}/window", query_string=args)
+    frames = []
+    data, pos = response.data, 0
+    while pos < len(data):
+        n, length = LIVE_FRAME.unpack_from(data, pos)
+        frames.append(n)
+        pos += LIVE_FRAME.size + length
+    return response.status_code, frames
+
+
+def test_window_streams_the_frames_in_order(client):
+    assert window(client) == (200, list(range(7)))
+    assert window(client, start=2, stop=5) == (200, [2, 3, 4])
+    assert window(client, start=6, stop=3) == (200, [6, 5, 4])  # backwards from the last frame
+    assert window(client, start=2, stop=-10) == (200, [2, 1, 0])
+
+
+def test_window_frames_are_those_of_the_log(client):
+    log = GameLog.load(os.path.join(server.app.config['GAME_LOGS'], 'game_1.plog'))
+    version = client.get('/api/1/info').get_json()['version']
+    data = client.get(f"/api/1/{version}/window", query_string={'start': 3, 'stop': 4}).data
+    assert data[LIVE_FRAME.size:] == log.frame_bytes(3)
+
+
+def test_window_past_the_end_is_not_found(client):
+    assert window(client, start=7, stop=0)[0] == 404
+    assert window(client, start=463, stop=400)[0] == 404
+    assert window(client, start=-5, stop=2) == (200, [0, 1])
+    assert client.get('/api/1/stale/window').status_code == 404
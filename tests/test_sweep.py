@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import pytest
+
+from params import GameParams, StartParams
+from sweep import SweepTask, coerce, grid, random_search, run_sweep, summarise, with_fields
+from tournament import GameResult
+
+
+def test_with_fields_casts_to_the_declared_type():
+    params = GameParams()
+    swept = with_fields(params, {'turrets.damage': 450.0, 'start.miners': 4})
+    assert swept.turrets.damage == 450 and type(swept.turrets.damage) is int
+    assert swept.start.miners == 4
+    assert params.turrets.damage == 900  # the original is left alone
+
+
+def test_with_fields_rejects_unknown_and_non_numeric_fields():
+    with pytest.raises(AttributeError):
+        with_fields(GameParams(), {'turrets.speed': 1})
+    with pytest.raises(ValueError):
+        with_fields(GameParams(), {'turrets.damage': 'lots'})
+    with pytest.raises(ValueError):
+        with_fields(GameParams(), {'ore_deposits.resource': 1})
+
+
+def test_coerce_bools():
+    assert coerce('x', 'True', bool) is True
+    assert coerce('x', 0, bool) is False
+    with pytest.raises(ValueError):
+        coerce('x', 2, bool)
+    with pytest.raises(ValueError):
+        coerce('x', True, int)  # a bool isn't a number here
+
+
+def test_grid_is_every_combination():
+    configs = grid({'a': [1, 2], 'b': ['x', 'y', 'z']})
+    assert len(configs) == 6
+    assert configs[0] == {'a': 1, 'b': 'x'} and configs[-1] == {'a': 2, 'b': 'z'}
+
+
+def test_random_search_is_seeded_and_within_ranges():
+    ranges = {'turrets.damage': (100, 200), 'turrets.range': (1.0, 2.0)}
+    configs = random_search(ranges, 20, seed=3)
+    assert configs == random_search(ranges, 20, seed=3)
+    assert all(100 <= c['turrets.damage'] <= 200 and isinstance(c['turrets.damage'], int) for c in configs)
+    assert all(1 <= c['turrets.range'] <= 2 for c in configs)
+
+
+def test_summarise_per_configuration():
+    configs = [{'a': 1}, {'a': 2}]
+    def result(config: int, winner: int, points: tuple[int, int], error: Optional[str] = None) -> GameResult:
+        return GameResult(SweepTask(0, 'default', 'p1', 'p2', config=config), points, 100, winner, 1.0, error)
+
+    columns = summarise(configs, [result(0, 1, (10, 4)), result(0, 2, (2, 6)), result(1, 0, (0, 0), 'crashed')])
+    assert list(columns['games']) == [2, 0] and list(columns['errors']) == [0, 1]
+    assert columns['p1_win_rate'][0] == 0.5 and columns['margin'][0] == 1 and columns['margin_std'][0] == 5
+
+
+def test_run_sweep_plays_every_configuration_on_every_seed():
+    base = GameParams(start=StartParams(min_len=3, max_len=3))
+    configs = grid({'turrets.damage': [100, 900], 'miners.range': [1, 2]})
+    results = run_sweep(configs, range(2), 'player:Player', 'player:Player', base, workers=2, cache_dir=None)
+    assert [(r.task.config, r.task.seed) for r in results] == [(c, s) for c in range(4) for s in range(2)]
+    assert all(r.error is None and r.turns == 3 for r in results)
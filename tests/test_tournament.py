@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import tournament
+from game import Game, map_key
+from params import GameParams, StartParams
+from player import Player
+from tournament import GameResult, GameTask, make_tasks, play_in_worker, run_tournament, summarise
+
+SHORT = GameParams(start=StartParams(min_len=5, max_len=5))
+
+
+def test_play_in_worker_reuses_the_maps_of_the_seed(monkeypatch):
+    layouts = []  # the layout every game was given
+
+    def play_game(task, params, layout=None):
+        layouts.append(layout)
+        return GameResult(task), SimpleNamespace(layout=(task.seed, map_key(params)))
+
+    monkeypatch.setattr(tournament, 'play_game', play_game)
+    monkeypatch.setattr(tournament, '_layouts', {})
+    monkeypatch.setattr(tournament, '_layouts_seed', None)
+    bigger = GameParams(start=StartParams(min_w=60, max_w=60))
+    for seed, params, sides in ((1, GameParams(), 'ab'), (1, GameParams(), 'ba'), (1, bigger, 'ab'),
+                                (2, GameParams(), 'ab'), (2, GameParams(), 'ba')):
+        play_in_worker(GameTask(seed, 'default', *sides), params)
+    assert layouts == [None, (1, map_key(GameParams())), None, None, (2, map_key(GameParams()))]
+    assert list(tournament._layouts) == [map_key(GameParams())]  # only those of the last seed are kept
+
+
+def test_a_reused_map_plays_the_same_game():
+    first = Game(0, Player, Player, seed=4, game_params=SHORT)
+    fresh = Game(0, Player, Player, seed=4, game_params=SHORT).run()
+    reused = Game(0, Player, Player, seed=4, game_params=SHORT, layout=first.layout).run()
+    assert (reused.points, reused.turns) == (fresh.points, fresh.turns)
+    assert str(Game(0, Player, Player, seed=4, game_params=SHORT, layout=first.layout)) == str(first)
+
+
+def test_every_pair_plays_every_seed_from_both_sides():
+    tasks = make_tasks(['a', 'b', 'c'], range(2), ['default'])
+    assert len(tasks) == 12
+    assert tasks[:2] == [GameTask(0, 'default', 'a', 'b'), GameTask(0, 'default', 'b', 'a')]
+    assert all(t.seed == 0 for t in tasks[:6])  # by seed, so that the games of a seed can share its map
+
+
+def test_run_tournament(monkeypatch):
+    monkeypatch.setitem(tournament.PRESETS, 'test', lambda: SHORT)
+    results = run_tournament(['player:Player', 'player.Player'], range(3), ['test'], workers=2, cache_dir=None)
+    assert [r.task for r in results] == make_tasks(['player:Player', 'player.Player'], range(3), ['test'])
+    assert all(r.error is None and r.turns == 5 for r in results)
+    summary, = summarise(results)
+    assert summary['games'] == 6